@@ -0,0 +1,50 @@
+# The WSGI and the ASGI (webapp/asgi.py) ways of serving the app, side by side under the same concurrent users.
+#
+#     python benchmarks/asgi.py                       # 16 virtual users for 20 s each
+#     python benchmarks/asgi.py --clients 64 --seconds 60
+#
+# Runs benchmarks/harness.py three times, in processes of their own: --server wsgi (werkzeug, a thread per request),
+# --server asgi (uvicorn, every view in a thread) and --server asgi with ASYNC_VIEWS=1 (the api lists awaiting the async
+# driver); then prints the latencies and the throughput of the three.
+# needs the ASGI packages: pip install "flask[async]" uvicorn greenlet aiosqlite
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+HARNESS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'harness.py')
+MODES = {'wsgi': ('wsgi', '0'), 'asgi': ('asgi', '0'), 'asgi+async': ('asgi', '1')}  # name: --server, ASYNC_VIEWS
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--seconds', type=int, default=20)
+    parser.add_argument('--users', type=int, default=20)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    results = {}
+    for mode, (server, async_views) in MODES.items():
+        output = os.path.join(directory, f'{server}{async_views}.json')
+        subprocess.run([sys.executable, HARNESS, '--server', server, '--clients', str(args.clients),
+                        '--seconds', str(args.seconds), '--users', str(args.users), '--output', output,
+                        '--baseline', os.path.join(directory, 'none.json')],
+                       env=dict(os.environ, ASYNC_VIEWS=async_views), check=True, stdout=subprocess.DEVNULL)
+        with open(output) as f:
+            results[mode] = json.load(f)
+
+    print(f'{"p50 / p99 ms":<24}' + ''.join(f'{mode:>20}' for mode in MODES))
+    for step in results['wsgi']:
+        if step != 'total':
+            print(f'{step:<24}' + ''.join(f'{summary[step]["p50_ms"]:>10}{summary[step]["p99_ms"]:>10}'
+                                          for summary in results.values()))
+    for mode, summary in results.items():
+        total = summary['total']
+        print(f'{mode}: {total["requests"]} requests, {total["per_second"]} per second, {total["errors"]} errors')
+
+
+if __name__ == '__main__':
+    main()
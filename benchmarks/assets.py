@@ -0,0 +1,61 @@
+# Requests and bytes a browser spends on the static files of a page, on the first load and on the loads after it.
+#
+#     python benchmarks/assets.py
+#
+# Loads /login like a browser with a cache that keeps what Cache-Control allows: once with the files served from
+# static/ (no build) and once from a build of webapp/assets.py in a temporary folder.
+import os
+import re
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class Browser:
+
+    def __init__(self, client):
+        self.client = client
+        self.cache = {}  # url -> (etag, fresh without asking)
+
+    def load(self, url):
+        # the number of requests for the page's files and the bytes they carried
+        body = self.client.get(url).get_data(as_text=True)
+        requests, received = 0, 0
+        for asset in re.findall(r'(?:href|src)="(/(?:static|assets)/[^"]+)"', body):
+            etag, fresh = self.cache.get(asset, (None, False))
+            if fresh:
+                continue
+            headers = {'Accept-Encoding': 'br, gzip'}
+            if etag:
+                headers['If-None-Match'] = etag
+            response = self.client.get(asset, headers=headers)
+            requests += 1
+            received += len(response.data)
+            max_age = response.cache_control.max_age or 0
+            self.cache[asset] = (response.headers.get('ETag'), response.cache_control.immutable and max_age > 0)
+        return requests, received
+
+
+def main():
+    from webapp import create_app, assets
+
+    app = create_app()
+
+    def run(label):
+        browser = Browser(app.test_client())
+        first = browser.load('/login')
+        repeat = browser.load('/login')
+        print(f'{label:<12} first load: {first[0]} requests, {first[1] / 1024:7.1f} KiB   '
+              f'repeat load: {repeat[0]} requests, {repeat[1] / 1024:7.1f} KiB')
+
+    app.config['ASSET_DIR'] = tempfile.mkdtemp()
+    assets.load_manifest(app)
+    run('static/')
+    assets.build(app.static_folder, app.config['ASSET_DIR'])
+    assets.load_manifest(app)
+    run('built')
+
+
+if __name__ == '__main__':
+    main()
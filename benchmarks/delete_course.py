@@ -0,0 +1,89 @@
+# Deleting and archiving a big course (webapp/courses.py).
+#
+#     python benchmarks/delete_course.py                       # a course with 50k assignments, study times and resources
+#     python benchmarks/delete_course.py --orm                 # the same delete through the session, one record at a time
+#
+# Fills a throwaway SQLite database (WAL, like a fresh install) with a few courses, one of them with --children records
+# (a third of each kind, with their search documents and daily rollup), then archives it, brings it back and deletes it.
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import date, datetime, time as clock, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--children', type=int, default=50_000)
+    parser.add_argument('--orm', action='store_true', help='delete with db.session.delete, after loading every record')
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    os.environ['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{directory}/bench.db'
+
+    from sqlalchemy import func, insert, select
+    from webapp import create_app, db
+    from webapp.analytics import refresh_study_days
+    from webapp.courses import archive_courses, delete_courses
+    from webapp.migrations import upgrade
+    from webapp.models import User, Course, Assignment, StudyTime, Resource, SearchDocument
+    from webapp.search import reindex_all
+    from webapp.versioning import bump_data_version
+
+    app = create_app()
+
+    with app.app_context():
+        upgrade()
+        user = User(username='bench', email='bench@example.com', password='not-a-real-hash')
+        db.session.add(user)
+        db.session.flush()
+        course_ids = db.session.scalars(insert(Course).returning(Course.id), [{'code': f'C{i}', 'name': f'Course {i}', 'user_id': user.id}
+                                                                              for i in range(5)]).all()
+        big, per_kind = course_ids[0], args.children // 3
+        for course_id in course_ids:
+            n = per_kind if course_id == big else 100
+            start = datetime(2021, 1, 1, 8, 0)
+            db.session.execute(insert(Assignment), [{'name': f'Assignment {i}', 'deadline': start + timedelta(hours=i),
+                                                     'course_id': course_id} for i in range(n)])
+            db.session.execute(insert(StudyTime), [{'date': date(2021, 1, 1) + timedelta(days=i // 10), 'start_time': clock(i % 10 + 8),
+                                                    'end_time': clock(i % 10 + 9), 'course_id': course_id} for i in range(n)])
+            db.session.execute(insert(Resource), [{'name': f'Resource {i}', 'course_id': course_id} for i in range(n)])
+        refresh_study_days(db.session, db.session.execute(select(StudyTime.course_id, StudyTime.date).distinct()).all())
+        reindex_all(db.session)
+        db.session.commit()
+        documents = db.session.scalar(select(func.count()).select_from(SearchDocument))
+        print(f'{len(course_ids)} courses, {per_kind * 3} records in C0, {documents} search documents')
+
+        def timed(label, change):
+            started = time.perf_counter()
+            change()
+            db.session.commit()
+            print(f'{label}: {(time.perf_counter() - started) * 1000:.0f} ms')
+
+        def bulk(change):
+            def run():
+                change(db.session, [big])
+                bump_data_version(db.session, user_ids=[user.id])
+            return run
+
+        timed('archive', bulk(archive_courses))
+        timed('unarchive', bulk(lambda session, ids: archive_courses(session, ids, archived=False)))
+        if args.orm:
+            def orm_delete():
+                course = db.session.get(Course, big)
+                for record in course.resources + course.study_times + course.assignments:
+                    db.session.delete(record)
+                db.session.flush()
+                db.session.delete(course)
+            timed('delete (orm)', orm_delete)
+        else:
+            timed('delete', bulk(delete_courses))
+        left = {model.__tablename__: db.session.scalar(select(func.count()).select_from(model)) for model in (Assignment, StudyTime, Resource)}
+        print('left: ' + ', '.join(f'{count} in {table}' for table, count in left.items()))
+
+
+if __name__ == '__main__':
+    main()
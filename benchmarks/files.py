@@ -0,0 +1,81 @@
+# Attached files (webapp/files.py): the same file uploaded by many students, then read by a PDF viewer.
+#
+#     python benchmarks/files.py                       # 300 students upload the same 5 MB file
+#     python benchmarks/files.py --students 50 --mb 20
+#
+# Every student has a course in a throwaway SQLite database and uploads the file as a resource of it. Prints the time
+# per upload, the most memory Python held during one (tracemalloc), the bytes on disk against the bytes uploaded, and
+# a 64 KiB Range request of the file like a viewer jumping to a page.
+import argparse
+import io
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--students', type=int, default=300)
+    parser.add_argument('--mb', type=int, default=5)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    os.environ['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{directory}/bench.db'
+    os.environ['FILE_STORAGE'] = os.path.join(directory, 'files')
+
+    from flask.testing import EnvironBuilder
+    from webapp import create_app, db
+    from webapp.migrations import upgrade
+    from webapp.models import User, Course, Resource
+
+    app = create_app()
+    app.config['WTF_CSRF_ENABLED'] = False
+    with app.app_context():
+        upgrade()
+        for i in range(args.students):
+            user = User(username=f'student{i}', email=f'student{i}@example.com', password='not-a-real-hash')
+            db.session.add(user)
+            db.session.add(Course(code='MA2', name='Mathematics 2', user=user))
+        db.session.commit()
+        user_ids = [user.id for user in User.query.order_by(User.id)]
+
+    content = os.urandom(args.mb * 1024 * 1024)
+    elapsed, peak = 0.0, 0
+    for user_id in user_ids:
+        client = app.test_client()
+        with client.session_transaction() as session:
+            session['_user_id'] = str(user_id)
+        # the request body is made before the measurement, it's the browser's memory
+        environ = EnvironBuilder(app, '/course/MA2/resource/new', method='POST', content_type='multipart/form-data',
+                                 data={'name': 'Lecture notes', 'file': (io.BytesIO(content), 'notes.pdf')}).get_environ()
+        tracemalloc.start()
+        started = time.perf_counter()
+        response = client.open(environ)
+        elapsed += time.perf_counter() - started
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+        assert response.status_code == 302, response.status_code
+
+    stored = sum(os.path.getsize(os.path.join(parent, name))
+                 for parent, folders, names in os.walk(os.environ['FILE_STORAGE']) for name in names)
+    print(f'{args.students} uploads of {args.mb} MB: {elapsed / args.students * 1000:.1f} ms each, '
+          f'at most {peak / 1024:.0f} KiB of memory held for one')
+    print(f'uploaded {args.students * len(content) / 1024 / 1024:.0f} MB, stored {stored / 1024 / 1024:.1f} MB')
+
+    with app.app_context():
+        resource_id = Resource.query.filter_by(course_id=Course.query.filter_by(user_id=user_ids[0]).one().id).one().id
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user_ids[0])
+    started = time.perf_counter()
+    response = client.get(f'/course/MA2/resource/{resource_id}/file', headers={'Range': 'bytes=1048576-1114111'})
+    data = response.data
+    response.close()
+    print(f'Range request: {response.status_code}, {len(data) / 1024:.0f} KiB in {(time.perf_counter() - started) * 1000:.1f} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,324 @@
+# Load test of the html pages and the api against a seeded database, compared with a stored baseline.
+#
+#     python benchmarks/harness.py                                   # seed, run, compare with benchmarks/baseline.json
+#     python benchmarks/harness.py --server --clients 8 --seconds 30 # through a local threaded WSGI server
+#     python benchmarks/harness.py --server asgi --clients 8          # through uvicorn and webapp.asgi (ASYNC_VIEWS=1 for the async lists)
+#     python benchmarks/harness.py --save-baseline                   # after a change that is meant to be slower (or faster)
+#
+# 1. seed():  --users users with --courses courses each, every course with --items assignments, study times and resources,
+#             made through the models in a throwaway SQLite database (the same data for the same --seed)
+# 2. drive(): --clients virtual users, each logged in as one of the seeded users, go through scenario() again and again:
+#             log in, the dashboards and lists (html and api), search, create and delete a course, create assignments through the api
+#             and delete them through their pages, log out; with the Flask test client, or over HTTP with --server (wsgi or asgi)
+# 3. report(): throughput, p50/p95/p99 latency and SQL statements per request of every step (the statements come from
+#             webapp/metrics.py), and what got worse than the baseline: a median more than --tolerance slower (and by at
+#             least --min-ms), more statements per request, or errors; the exit status is 1 if anything did, so it can gate a deploy
+# latencies depend on the machine, keep the baseline of the machine the suite runs on; statement counts don't
+import argparse
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import defaultdict
+from datetime import date, datetime, time as clock, timedelta
+from http.cookiejar import CookieJar
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+PASSWORD = 'benchmark'
+WORDS = ('mathematics analysis algebra linear geometry physics optics mechanics chemistry biology history economics '
+         'statistics programming databases networks homework project report exam lab lecture notes slides exercises').split()
+
+
+### 1. data ###
+
+def _name(rng, words=3):
+    return ' '.join(rng.choice(WORDS) for _ in range(words)).capitalize()
+
+
+def seed(db, users=20, courses=5, items=20, seed=1, password_hash=None):
+    # returns the seeded users: [(email, [(course id, course code)])]; the study times of a user don't overlap
+    from webapp.models import User, Course, Assignment, StudyTime, Resource
+    rng = random.Random(seed)
+    today = date.today()
+    seeded = []
+    for u in range(users):
+        user = User(username=f'bench{u}', email=f'bench{u}@example.com', password=password_hash)
+        db.session.add(user)
+        db.session.flush()
+        user_courses = []
+        for c in range(courses):
+            course = Course(code=f'C{c}', name=_name(rng, 2), user=user)
+            user_courses.append(course)
+            for i in range(items):
+                db.session.add(Assignment(name=_name(rng), course=course, deadline=datetime.combine(
+                    today + timedelta(days=rng.randint(-60, 60)), clock(rng.randint(8, 20)))))
+                # a day per item and an hour per course, so that they never overlap
+                start = clock(8 + c % 14)
+                db.session.add(StudyTime(course=course, date=today - timedelta(days=i), start_time=start,
+                                         end_time=clock(start.hour, rng.choice((30, 45, 59)))))
+                db.session.add(Resource(name=_name(rng), course=course))
+        db.session.commit()  # a user at a time, the session stays small
+        seeded.append((user.email, [(course.id, course.code) for course in user_courses]))
+    return seeded
+
+
+### 2. the driver ###
+
+class TestClientSession:
+    # a virtual user on the Flask test client
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method, url, data=None, json_body=None):
+        response = self.client.open(url, method=method, data=data, json=json_body)
+        return response.status_code, response.get_json(silent=True) if response.is_json else None
+
+
+class HttpSession:
+    # a virtual user talking HTTP to the local server, with its own cookies, without following redirects
+    def __init__(self, base):
+        self.base = base
+        no_redirects = type('NoRedirect', (urllib.request.HTTPRedirectHandler,), {'redirect_request': lambda *a, **k: None})
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(CookieJar()), no_redirects)
+
+    def request(self, method, url, data=None, json_body=None):
+        headers, body = {}, None
+        if json_body is not None:
+            headers['Content-Type'], body = 'application/json', json.dumps(json_body).encode()
+        elif data is not None:
+            body = urllib.parse.urlencode(data).encode()
+        try:
+            with self.opener.open(urllib.request.Request(self.base + url, body, headers, method=method), timeout=60) as response:
+                content = response.read()
+                status, content_type = response.status, response.headers.get('Content-Type', '')
+        except urllib.error.HTTPError as error:
+            content, status, content_type = error.read(), error.code, error.headers.get('Content-Type', '')
+        return status, json.loads(content) if content_type.startswith('application/json') and content else None
+
+
+def scenario(email, courses, rng, iteration):
+    # one round of a virtual user: yields (step, endpoint, method, url, form data, json body) and gets the response back
+    course_id, course_code = rng.choice(courses)
+    code = f'T{iteration}'
+    yield 'login', 'main.login', 'POST', '/login', {'email': email, 'password': PASSWORD}, None
+    yield 'home', 'main.home', 'GET', '/home', None, None
+    yield 'courses', 'main.all_courses', 'GET', '/courses', None, None
+    yield 'course', 'main.course', 'GET', f'/course/{course_code}', None, None
+    yield 'course assignments', 'main.course_assignments', 'GET', f'/course/{course_code}/assignments', None, None
+    yield 'course study times', 'main.course_study_times', 'GET', f'/course/{course_code}/studytimes', None, None
+    yield 'course resources', 'main.course_resources', 'GET', f'/course/{course_code}/resources', None, None
+    yield 'all assignments', 'main.all_assignments', 'GET', '/assignments', None, None
+    yield 'api assignments', 'api.list_assignments', 'GET', f'/api/v1/assignments?course_id={course_id}', None, None
+    yield 'api study times', 'api.list_studytimes', 'GET', '/api/v1/studytimes?limit=100', None, None
+    yield 'statistics', 'main.statistics', 'GET', '/statistics', None, None
+    yield 'search', 'main.search', 'GET', f'/search?q={rng.choice(WORDS)[:4]}', None, None
+    yield 'new course', 'main.new_course', 'POST', '/course/new', {'code': code, 'name': 'Benchmark course'}, None
+    yield 'delete course', 'main.delete_course', 'POST', f'/course/{code}/delete', None, None
+    response = yield 'api create assignments', 'api.create_assignments', 'POST', '/api/v1/assignments', None, [
+        {'course_id': course_id, 'name': f'Benchmark {iteration} {n}', 'deadline': '2030-01-01T12:00'} for n in range(5)]
+    for done in (response or {}).get('done', []):
+        yield 'delete assignment', 'main.delete_assignment', 'POST', f'/course/{course_code}/assignment/{done["id"]}/delete', None, None
+    yield 'logout', 'main.logout', 'GET', '/logout', None, None
+
+
+def drive(make_session, users, clients=4, seconds=10, iterations=None, seed=1):
+    # runs the scenario from `clients` threads for `seconds` (or `iterations` rounds each);
+    # returns {step: {'endpoint', 'times': [...], 'errors': n}} and the wall time
+    results = defaultdict(lambda: {'endpoint': None, 'times': [], 'errors': 0})
+    lock = threading.Lock()
+    stop = time.monotonic() + seconds
+
+    def client(number):
+        rng = random.Random(seed * 1000 + number)
+        session = make_session()
+        email, courses = users[number % len(users)]
+        iteration = 0
+        while (iteration < iterations) if iterations is not None else (time.monotonic() < stop):
+            steps = scenario(email, courses, rng, f'{number}x{iteration}')
+            response = None
+            try:
+                while True:
+                    step, endpoint, method, url, data, json_body = steps.send(response)
+                    started = time.perf_counter()
+                    status, response = session.request(method, url, data, json_body)
+                    elapsed = time.perf_counter() - started
+                    with lock:
+                        result = results[step]
+                        result['endpoint'] = endpoint
+                        result['times'].append(elapsed)
+                        result['errors'] += status >= 400
+            except StopIteration:
+                pass
+            iteration += 1
+
+    threads = [threading.Thread(target=client, args=(number,)) for number in range(clients)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return dict(results), time.perf_counter() - started
+
+
+### 3. the report ###
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))] * 1000 if values else 0.0
+
+
+def summarize(results, wall_seconds):
+    from webapp import metrics
+    summary = {}
+    for step, result in results.items():
+        times = result['times']
+        endpoint = result['endpoint']
+        handled = metrics.REQUEST_SQL.count(endpoint)  # observed once per request
+        summary[step] = {
+            'requests': len(times), 'errors': result['errors'],
+            'per_second': round(len(times) / wall_seconds, 1),
+            'p50_ms': round(percentile(times, 50), 2), 'p95_ms': round(percentile(times, 95), 2),
+            'p99_ms': round(percentile(times, 99), 2),
+            'queries': round(metrics.SQL_STATEMENTS.value(endpoint) / handled, 1) if handled else None,
+        }
+    total = sum(len(result['times']) for result in results.values())
+    summary['total'] = {'requests': total, 'errors': sum(result['errors'] for result in results.values()),
+                        'per_second': round(total / wall_seconds, 1)}
+    return summary
+
+
+def regressions(summary, baseline, tolerance=0.25, min_ms=1.0):
+    found = []
+    for step, current in summary.items():
+        before = baseline.get(step)
+        if step in ('total', 'settings') or before is None:
+            continue
+        # the median: the tail of a short run on a shared machine is too noisy to gate on
+        if current['p50_ms'] > before['p50_ms'] * (1 + tolerance) and current['p50_ms'] - before['p50_ms'] >= min_ms:
+            found.append(f'{step}: p50 {before["p50_ms"]} -> {current["p50_ms"]} ms')
+        # an average over cache hits and misses, so a little noise is allowed, but not a query more per request
+        if current['queries'] is not None and before.get('queries') is not None and current['queries'] > before['queries'] * 1.1 + 0.5:
+            found.append(f'{step}: {before["queries"]} -> {current["queries"]} SQL statements per request')
+        if current['errors'] > before.get('errors', 0):
+            found.append(f'{step}: {current["errors"]} errors')
+    return found
+
+
+def report(summary, baseline=None):
+    baseline = baseline or {}
+    print(f'{"step":<24}{"requests":>9}{"req/s":>9}{"p50 ms":>9}{"p95 ms":>9}{"p99 ms":>9}{"queries":>9}{"p50 before":>12}')
+    for step, row in summary.items():
+        if step == 'total':
+            continue
+        before = baseline.get(step, {}).get('p50_ms', '')
+        queries = '' if row['queries'] is None else row['queries']
+        print(f'{step:<24}{row["requests"]:>9}{row["per_second"]:>9}{row["p50_ms"]:>9}{row["p95_ms"]:>9}{row["p99_ms"]:>9}'
+              f'{queries:>9}{before:>12}')
+    total = summary['total']
+    print(f'{total["requests"]} requests, {total["per_second"]} per second, {total["errors"]} errors')
+
+
+def serve_asgi():
+    # uvicorn with the ASGI entry point in a thread of this process (one worker, like the WSGI server); returns its port
+    import socket
+    import uvicorn
+    from webapp.asgi import app, application
+    app.config['WTF_CSRF_ENABLED'] = False  # the app of the ASGI entry point is one of its own
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    server = uvicorn.Server(uvicorn.Config(application, log_level='warning', access_log=False))
+    threading.Thread(target=server.run, kwargs={'sockets': [sock]}, daemon=True).start()
+    while not server.started:
+        time.sleep(0.01)
+
+    def stop():
+        server.should_exit = True
+    return sock.getsockname()[1], stop
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--courses', type=int, default=5)
+    parser.add_argument('--items', type=int, default=20, help='assignments, study times and resources per course')
+    parser.add_argument('--clients', type=int, default=1, help='more measure throughput, one keeps the latencies steady')
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--rounds', type=int, default=4, help='bcrypt cost of the seeded passwords and the logins')
+    parser.add_argument('--server', nargs='?', const='wsgi', choices=('wsgi', 'asgi'),
+                        help='over HTTP to a local threaded WSGI server, or to uvicorn with the ASGI entry point')
+    parser.add_argument('--output', help='write the results to this JSON file too')
+    parser.add_argument('--baseline', default=BASELINE)
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='how much slower a median may get')
+    parser.add_argument('--min-ms', type=float, default=1.0, help='changes smaller than this are noise')
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    os.environ['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{directory}/bench.db'
+    os.environ['BCRYPT_LOG_ROUNDS'] = str(args.rounds)
+    os.environ['PASSWORD_HASH_WORKERS'] = '0'
+    os.environ['RATELIMIT_ENABLED'] = '0'  # the virtual users all log in from 127.0.0.1, over and over
+
+    from webapp import create_app, db, metrics, passwords
+    from webapp.migrations import upgrade
+
+    app = create_app()
+    app.config['WTF_CSRF_ENABLED'] = False
+    with app.app_context():
+        upgrade()
+        started = time.perf_counter()
+        users = seed(db, args.users, args.courses, args.items, args.seed, passwords.hash(PASSWORD))
+        print(f'seeded {args.users} users x {args.courses} courses x {args.items} items in {time.perf_counter() - started:.1f} s')
+
+    if args.server == 'asgi':
+        port, stop_server = serve_asgi()
+        make_session = lambda: HttpSession(f'http://127.0.0.1:{port}')
+    elif args.server:
+        from werkzeug.serving import make_server
+        logging.getLogger('werkzeug').setLevel(logging.ERROR)
+        server = make_server('127.0.0.1', 0, app, threaded=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        make_session, stop_server = lambda: HttpSession(f'http://127.0.0.1:{server.server_port}'), server.shutdown
+    else:
+        make_session, stop_server = lambda: TestClientSession(app), None
+    metrics.reset()
+    results, wall_seconds = drive(make_session, users, args.clients, args.seconds, seed=args.seed)
+    if stop_server:
+        stop_server()
+    summary = summarize(results, wall_seconds)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(summary, f, indent=2)
+    settings = {name: getattr(args, name) for name in ('users', 'courses', 'items', 'clients', 'seconds', 'seed', 'rounds', 'server')}
+
+    baseline = None
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    report(summary, baseline)
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(dict(summary, settings=settings), f, indent=2)
+            f.write('\n')
+        print(f'baseline saved to {args.baseline}')
+    elif baseline is not None and baseline.get('settings') != settings:
+        print(f'the baseline was made with other settings ({baseline.get("settings")}), nothing compared')
+    elif baseline is not None:
+        found = regressions(summary, baseline, args.tolerance, args.min_ms)
+        for regression in found:
+            print(f'REGRESSION {regression}')
+        sys.exit(1 if found else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+# Throughput of the CSV importer (webapp/importer.py).
+#
+#     python benchmarks/import_assignments.py                      # 100k assignments into 20 courses
+#     python benchmarks/import_assignments.py --chunk-size 1       # a commit per row, for comparison
+#
+# Writes a CSV file, then imports it into a throwaway SQLite database (WAL, like a fresh install) for one user.
+import argparse
+import os
+import random
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=100_000)
+    parser.add_argument('--courses', type=int, default=20)
+    parser.add_argument('--chunk-size', type=int, default=2000)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    os.environ['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{directory}/bench.db'
+
+    from webapp import create_app, db
+    from webapp.importer import import_courses, import_assignments
+    from webapp.migrations import upgrade
+    from webapp.models import User
+
+    app = create_app()
+
+    random.seed(1)
+    start = datetime(2021, 1, 1, 8, 0)
+    path = os.path.join(directory, 'assignments.csv')
+    with open(path, 'w', newline='') as f:
+        f.write('course,name,deadline\r\n')
+        for i in range(args.rows):
+            deadline = start + timedelta(minutes=15 * random.randrange(100_000))
+            f.write(f'C{i % args.courses},Assignment {i},{deadline:%d-%m-%Y %H:%M}\r\n')
+
+    with app.app_context():
+        upgrade()
+        user = User(username='bench', email='bench@example.com', password='not-a-real-hash')
+        db.session.add(user)
+        db.session.commit()
+        with open(os.path.join(directory, 'courses.csv'), 'w', newline='') as f:
+            f.write('code,name\r\n' + ''.join(f'C{i},Course {i}\r\n' for i in range(args.courses)))
+        with open(os.path.join(directory, 'courses.csv'), 'rb') as f:
+            import_courses(f, user.id)
+        with open(path, 'rb') as f:
+            report = import_assignments(f, user.id, chunk_size=args.chunk_size)
+
+    print(f'chunk size {args.chunk_size}: {report}')
+
+
+if __name__ == '__main__':
+    main()
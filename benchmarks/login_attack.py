@@ -0,0 +1,156 @@
+# Latency of real users' logins during a credential-stuffing attack, with and without the rate limits (webapp/ratelimit.py).
+#
+#     python benchmarks/login_attack.py
+#     python benchmarks/login_attack.py --attack-rate 300 --attacker-addresses 4 --seconds 20
+#
+# Runs the app on a local threaded WSGI server with a throwaway SQLite database and bcrypt on the worker pool (like
+# login_storm.py), then three rounds of --seconds: the users alone, the users during the attack without the limits, and
+# with them. The attackers try wrong passwords for a few accounts, --attack-rate times a second from
+# --attacker-addresses addresses, starting --warmup seconds before the users (a bucket lets a burst through before it limits, the attack
+# has spent them by then); the users log in with their right password, each one from an address of their own (the
+# loopback network is all of 127.0.0.0/8 on Linux, the requests are sent from 127.0.0.x and 127.1.x.y).
+import argparse
+import http.client
+import itertools
+import logging
+import multiprocessing
+import os
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))] * 1000 if values else float('nan')
+
+
+def login(port, email, password, address):
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=60, source_address=(address, 0))
+    try:
+        connection.request('POST', '/login', urllib.parse.urlencode({'email': email, 'password': password}),
+                           {'Content-Type': 'application/x-www-form-urlencoded'})
+        response = connection.getresponse()
+        response.read()
+        return response.status
+    finally:
+        connection.close()
+
+
+def attacker(port, number, addresses, victims, rate, seconds, results):
+    # in a process of its own, so the attack's client doesn't take the GIL from the server; `rate` requests a second
+    # whatever the responses take (a real attack comes from other machines and doesn't wait for them either)
+    sent = []
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=64) as executor:
+        for attempt in itertools.count():
+            now = time.monotonic()
+            if now >= started + seconds:
+                break
+            time.sleep(max(0, started + attempt / rate - now))
+            address = f'127.0.0.{10 + (number + attempt) % addresses}'
+            sent.append(executor.submit(login, port, f'victim{(number + attempt) % victims}@example.com', 'guess', address))
+    results.put(Counter(future.result() for future in sent))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--hash-workers', type=int, default=2)
+    parser.add_argument('--hash-queue', type=int, default=8)
+    parser.add_argument('--rounds', type=int, default=12)
+    parser.add_argument('--attackers', type=int, default=4, help='processes sending the attack')
+    parser.add_argument('--attack-rate', type=float, default=100, help='requests a second of all the attackers')
+    parser.add_argument('--attacker-addresses', type=int, default=8)
+    parser.add_argument('--victims', type=int, default=20, help='accounts the attackers try')
+    parser.add_argument('--users', type=int, default=2, help='threads of real users logging in')
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--warmup', type=float, default=5, help='seconds the attack runs before the users start')
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    os.environ['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{directory}/bench.db'
+    os.environ['BCRYPT_LOG_ROUNDS'] = str(args.rounds)
+    os.environ['PASSWORD_HASH_WORKERS'] = str(args.hash_workers)
+    os.environ['PASSWORD_HASH_QUEUE'] = str(args.hash_queue)
+
+    from werkzeug.serving import make_server
+    from webapp import create_app, db, metrics, passwords, rate_limiter
+    from webapp.migrations import upgrade
+    from webapp.models import User
+
+    accounts = 1000  # every real login is of another user, from another address
+    app = create_app()
+    app.config['WTF_CSRF_ENABLED'] = False
+    with app.app_context():
+        upgrade()
+        password = passwords.hash('secret')  # one hash for everyone, the seeding would take minutes otherwise
+        db.session.add_all([User(username=f'user{i}', email=f'user{i}@example.com', password=password) for i in range(accounts)])
+        db.session.add_all([User(username=f'victim{i}', email=f'victim{i}@example.com', password=password)
+                            for i in range(args.victims)])
+        db.session.commit()
+
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)  # no access log
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    port = server.server_port
+    users = itertools.count()
+    context = multiprocessing.get_context('spawn')  # not a fork of a process with the server's threads
+
+    def run(attack, limits):
+        rate_limiter.enabled = limits
+        rate_limiter.clear()
+        metrics.reset()
+        stop = time.monotonic() + args.seconds + (args.warmup if attack else 0)
+        attack_statuses, user_statuses, user_times = Counter(), Counter(), []
+        results = context.Queue()
+        attackers = [context.Process(target=attacker, args=(port, number, args.attacker_addresses, args.victims,
+                                                            args.attack_rate / args.attackers, args.seconds + args.warmup,
+                                                            results))
+                     for number in range(args.attackers if attack else 0)]
+
+        def user():
+            while time.monotonic() < stop:
+                number = next(users) % accounts
+                started = time.perf_counter()
+                user_statuses[login(port, f'user{number}@example.com', 'secret', f'127.1.{number // 250}.{number % 250 + 1}')] += 1
+                user_times.append(time.perf_counter() - started)
+                time.sleep(0.1)
+
+        for process in attackers:
+            process.start()
+        if attack:
+            time.sleep(args.warmup)
+        threads = [threading.Thread(target=user) for _ in range(args.users)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        for process in attackers:
+            attack_statuses.update(results.get())
+            process.join()
+        label = ('attack' if attack else 'no attack') + (', limits' if limits else ', no limits')
+        print(f'{label:<22} users: {len(user_times)} logins, statuses {dict(user_statuses)}, '
+              f'p50 {percentile(user_times, 50):.1f} ms, p95 {percentile(user_times, 95):.1f} ms, '
+              f'p99 {percentile(user_times, 99):.1f} ms')
+        if attack:
+            limited = {bucket: int(metrics.RATE_LIMIT_CHECKS.value(bucket, 'limited')) for bucket in ('ip', 'email', 'backoff')}
+            print(f'{"":<22} attackers: {sum(attack_statuses.values())} requests, statuses {dict(attack_statuses)}, '
+                  f'limited {limited}')
+
+    print(f'hash workers={args.hash_workers} queue={args.hash_queue} cost={args.rounds} attack={args.attack_rate}/s '
+          f'from {args.attacker_addresses} addresses, users={args.users} seconds={args.seconds} warmup={args.warmup}')
+    run(attack=False, limits=True)
+    run(attack=True, limits=False)
+    run(attack=True, limits=True)
+    server.shutdown()
+    passwords.shutdown()
+
+
+if __name__ == '__main__':
+    main()
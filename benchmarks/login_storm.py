@@ -0,0 +1,109 @@
+# Latency of ordinary pages while a burst of logins hammers the server.
+#
+#     python benchmarks/login_storm.py --hash-workers 0     # bcrypt inline in the request threads
+#     python benchmarks/login_storm.py --hash-workers 2     # bcrypt on the worker pool (see webapp/passwords.py)
+#
+# Runs the app on a local threaded WSGI server with a throwaway SQLite database, starts --attackers threads that
+# log in as fast as they can, and measures GET /home from --readers other threads.
+import argparse
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))] * 1000 if values else float('nan')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--hash-workers', type=int, default=2)
+    parser.add_argument('--hash-queue', type=int, default=8)
+    parser.add_argument('--rounds', type=int, default=12)
+    parser.add_argument('--attackers', type=int, default=16)
+    parser.add_argument('--readers', type=int, default=4)
+    parser.add_argument('--seconds', type=float, default=10)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    os.environ['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{directory}/bench.db'
+    os.environ['BCRYPT_LOG_ROUNDS'] = str(args.rounds)
+    os.environ['PASSWORD_HASH_WORKERS'] = str(args.hash_workers)
+    os.environ['PASSWORD_HASH_QUEUE'] = str(args.hash_queue)
+    os.environ['RATELIMIT_ENABLED'] = '0'  # the hashing pool alone, login_attack.py runs the storm against the rate limits
+
+    from werkzeug.serving import make_server
+    from webapp import create_app, db, passwords
+    from webapp.migrations import upgrade
+    from webapp.models import User
+
+    app = create_app()
+    app.config['WTF_CSRF_ENABLED'] = False
+    with app.app_context():
+        upgrade()
+        db.session.add(User(username='bench', email='bench@example.com', password=passwords.hash('secret')))
+        db.session.commit()
+
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)  # no access log
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f'http://127.0.0.1:{server.server_port}'
+    login_body = urllib.parse.urlencode({'email': 'bench@example.com', 'password': 'secret'}).encode()
+    opener = urllib.request.build_opener(type('NoRedirect', (urllib.request.HTTPRedirectHandler,), {
+        'redirect_request': lambda *a, **k: None}))
+
+    stop = time.monotonic() + args.seconds
+    login_statuses = Counter()
+    login_times, page_times = [], []
+
+    def request(url, data=None):
+        try:
+            with opener.open(url, data=data, timeout=60) as response:
+                return response.status
+        except urllib.error.HTTPError as error:
+            return error.code
+
+    def attacker():
+        while time.monotonic() < stop:
+            started = time.perf_counter()
+            login_statuses[request(base + '/login', login_body)] += 1
+            login_times.append(time.perf_counter() - started)
+
+    def reader():
+        while time.monotonic() < stop:
+            started = time.perf_counter()
+            request(base + '/home')
+            page_times.append(time.perf_counter() - started)
+            time.sleep(0.01)
+
+    threads = [threading.Thread(target=attacker) for _ in range(args.attackers)]
+    threads += [threading.Thread(target=reader) for _ in range(args.readers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    server.shutdown()
+    passwords.shutdown()
+
+    print(f'hash workers={args.hash_workers} queue={args.hash_queue} cost={args.rounds} '
+          f'attackers={args.attackers} readers={args.readers} seconds={args.seconds}')
+    print(f'logins:  {sum(login_statuses.values())} requests, statuses {dict(login_statuses)}, '
+          f'p50 {percentile(login_times, 50):.1f} ms, p99 {percentile(login_times, 99):.1f} ms')
+    print(f'/home:   {len(page_times)} requests, p50 {percentile(page_times, 50):.1f} ms, '
+          f'p95 {percentile(page_times, 95):.1f} ms, p99 {percentile(page_times, 99):.1f} ms, '
+          f'mean {statistics.mean(page_times) * 1000:.1f} ms')
+
+
+if __name__ == '__main__':
+    main()
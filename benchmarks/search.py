@@ -0,0 +1,83 @@
+# Latency of the full-text search (webapp/search.py) over a large index.
+#
+#     python benchmarks/search.py                         # a million documents of 1000 users
+#     python benchmarks/search.py --rows 100000 --users 100
+#
+# Fills search_document of a throwaway SQLite database (the FTS5 index follows through its triggers) with names made of
+# random words, then times search() for a random user and one or two word prefixes, like someone typing in the search box.
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+WORDS = ('mathematics analysis algebra linear geometry physics optics mechanics chemistry organic biology genetics '
+         'history philosophy economics statistics probability programming databases networks compilers operating '
+         'systems homework project report exam midterm final lab lecture notes slides exercises chapter seminar '
+         'reading essay presentation quiz assignment review summary practice solutions paper draft').split()
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))] * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--queries', type=int, default=2000)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    os.environ['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{directory}/bench.db'
+
+    from sqlalchemy import insert
+    from webapp import create_app, db
+    from webapp.migrations import upgrade
+    from webapp.models import Course, SearchDocument
+    from webapp.search import search
+
+    app = create_app()
+
+    random.seed(1)
+    kinds = ('course', 'assignment', 'resource')
+    with app.app_context():
+        upgrade()
+        started = time.perf_counter()
+        # 50 courses per user, the results are joined with them for their codes
+        db.session.execute(insert(Course), [{'id': (user_id - 1) * 50 + c + 1, 'code': f'C{c}', 'name': f'Course {c}', 'user_id': user_id}
+                                            for user_id in range(1, args.users + 1) for c in range(50)])
+        batch = []
+        for i in range(args.rows):
+            user_id = i % args.users + 1
+            batch.append({'kind': kinds[i % 3], 'record_id': i, 'user_id': user_id, 'course_id': (user_id - 1) * 50 + i % 50 + 1,
+                          'name': ' '.join(random.choice(WORDS) for _ in range(random.randint(2, 5))) + f' {i % 97}'})
+            if len(batch) == 10_000:
+                db.session.execute(insert(SearchDocument), batch)
+                batch = []
+        if batch:
+            db.session.execute(insert(SearchDocument), batch)
+        db.session.commit()
+        db.session.execute(db.text("INSERT INTO search_index (search_index) VALUES ('optimize')"))  # merge the b-trees, like a long-lived index
+        db.session.commit()
+        print(f'indexed {args.rows:,} documents of {args.users} users in {time.perf_counter() - started:.1f} s')
+
+        timings, found = [], 0
+        for _ in range(args.queries):
+            words = random.sample(WORDS, random.choice((1, 1, 2)))
+            query = ' '.join(word[:random.randint(2, len(word))] for word in words)
+            user_id = random.randint(1, args.users)
+            started = time.perf_counter()
+            found += len(search(user_id, query))
+            timings.append(time.perf_counter() - started)
+        print(f'{args.queries} queries: p50 {percentile(timings, 50):.2f} ms, p99 {percentile(timings, 99):.2f} ms, '
+              f'mean {statistics.mean(timings) * 1000:.2f} ms, {found / args.queries:.1f} results per query')
+
+
+if __name__ == '__main__':
+    main()
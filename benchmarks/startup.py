@@ -0,0 +1,102 @@
+# Cold start: how long a new worker process takes to import the app, make it, and answer its first requests.
+#
+#     python benchmarks/startup.py                  # compares with benchmarks/startup_baseline.json
+#     python benchmarks/startup.py --save-baseline  # after an intended change, on the machine the comparisons run on
+#
+# Every run is a fresh interpreter (like a worker after a deploy or a scale-out) that measures `import webapp`,
+# create_app() and the first GET of a few pages against a throwaway SQLite database; once with the templates compiled
+# on the first request (no template cache) and once with a cache filled by `flask templates compile` (see
+# webapp/templating.py). The medians of --runs runs are compared like in harness.py: the exit status is 1 if one got
+# more than --tolerance slower (and by at least --min-ms), so it can gate a deploy next to the load test.
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'startup_baseline.json')
+PAGES = ('/login', '/register', '/home')
+
+# what runs in the new process; prints the milliseconds of every step as JSON
+CHILD = f'''
+import json, sys, time
+sys.path.insert(0, {ROOT!r})
+started = time.perf_counter()
+import webapp
+imported = time.perf_counter()
+app = webapp.create_app()
+created = time.perf_counter()
+client = app.test_client()
+times = {{'import': imported - started, 'create_app': created - imported}}
+for url in {PAGES!r}:
+    before = time.perf_counter()
+    assert client.get(url).status_code == 200, url
+    times['first ' + url] = time.perf_counter() - before
+times['total'] = time.perf_counter() - started
+print(json.dumps({{step: round(seconds * 1000, 2) for step, seconds in times.items()}}))
+'''
+
+
+def run(env):
+    output = subprocess.run([sys.executable, '-c', CHILD], env=env, check=True, capture_output=True, text=True).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+def measure(runs, template_cache):
+    # the medians of `runs` fresh processes, {step: ms}
+    directory = tempfile.mkdtemp()
+    env = dict(os.environ, SQLALCHEMY_DATABASE_URI=f'sqlite:///{directory}/startup.db',
+               TEMPLATE_CACHE_DIR=os.path.join(directory, 'jinja_cache') if template_cache else '')
+    if template_cache:
+        subprocess.run([sys.executable, '-m', 'flask', '--app', 'webapp', 'templates', 'compile'], env=env, cwd=ROOT,
+                       check=True, stdout=subprocess.DEVNULL)
+    results = [run(env) for _ in range(runs)]
+    return {step: round(statistics.median(result[step] for result in results), 2) for step in results[0]}
+
+
+def regressions(summary, baseline, tolerance=0.25, min_ms=5.0):
+    found = []
+    for mode, steps in summary.items():
+        for step, ms in steps.items():
+            before = baseline.get(mode, {}).get(step)
+            if before is not None and ms > before * (1 + tolerance) and ms - before >= min_ms:
+                found.append(f'{mode} {step}: {before} -> {ms} ms')
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--runs', type=int, default=7, help='fresh processes per mode')
+    parser.add_argument('--baseline', default=BASELINE)
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='how much slower a median may get')
+    parser.add_argument('--min-ms', type=float, default=5.0, help='changes smaller than this are noise')
+    args = parser.parse_args()
+
+    summary = {'no template cache': measure(args.runs, False), 'template cache': measure(args.runs, True)}
+    baseline = None
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    steps = list(summary['template cache'])
+    print(f'{"step":<20}' + ''.join(f'{mode:>20}' for mode in summary) + (f'{"before":>20}' if baseline else ''))
+    for step in steps:
+        before = baseline.get('template cache', {}).get(step, '') if baseline else None
+        print(f'{step:<20}' + ''.join(f'{summary[mode][step]:>20}' for mode in summary) + (f'{before:>20}' if baseline else ''))
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(summary, f, indent=2)
+            f.write('\n')
+        print(f'baseline saved to {args.baseline}')
+    elif baseline is not None:
+        found = regressions(summary, baseline, args.tolerance, args.min_ms)
+        for regression in found:
+            print(f'REGRESSION {regression}')
+        sys.exit(1 if found else 0)
+
+
+if __name__ == '__main__':
+    main()
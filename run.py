@@ -1,4 +1,6 @@
-from webapp import app
+from webapp import create_app
+
+app = create_app()
 
 if __name__ == "__main__":
     app.run(debug=True, port=8888)
\ No newline at end of file
@@ -0,0 +1,60 @@
+import os
+import tempfile
+
+# the tests run against an in-memory SQLite database (never the one in SQLALCHEMY_DATABASE_URI),
+# set TEST_DATABASE_URL to run them against another backend, e.g. TEST_DATABASE_URL=postgresql+psycopg://localhost/webapp_test
+os.environ['SQLALCHEMY_DATABASE_URI'] = os.environ.get('TEST_DATABASE_URL') or 'sqlite://'
+os.environ['BCRYPT_LOG_ROUNDS'] = '4'  # the cheapest bcrypt cost
+os.environ['PASSWORD_HASH_WORKERS'] = '0'  # hash inline, the pool has its own tests
+os.environ['TEMPLATE_CACHE_DIR'] = ''  # no compiled templates in the instance folder, test_templating.py uses its own
+os.environ['FILE_STORAGE'] = tempfile.mkdtemp()  # nor uploaded files
+
+import pytest
+from webapp import create_app, db as _db, user_cache, page_cache, rate_limiter
+from webapp.models import User
+
+flask_app = create_app()  # one app for the whole session, its templates are compiled once
+
+
+@pytest.fixture
+def app():
+    flask_app.config['TESTING'] = True
+    flask_app.config['WTF_CSRF_ENABLED'] = False
+    user_cache.clear()  # the ids start again from 1 in every test
+    page_cache.clear()
+    rate_limiter.clear()  # every test logs in from the same address
+    # no app context stays pushed while the tests send requests, otherwise every request would share its `g`
+    with flask_app.app_context():
+        _db.create_all()
+    yield flask_app
+    with flask_app.app_context():
+        _db.session.remove()
+        _db.drop_all()
+
+
+@pytest.fixture
+def db(app):
+    return _db
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def user_id(app):
+    with app.app_context():
+        user = User(username='iulia', email='iulia@gmail.com', password='not-a-real-hash')
+        _db.session.add(user)
+        _db.session.commit()
+        return user.id
+
+
+@pytest.fixture
+def logged_in(client, user_id):
+    # log the user in through the session cookie so the tests don't pay for bcrypt
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user_id)
+        session['_fresh'] = True
+    return client
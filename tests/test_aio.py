@@ -0,0 +1,74 @@
+import asyncio
+import sqlite3
+
+import pytest
+from flask_login import login_user
+
+from webapp import aio, db as _db
+from webapp.api import COLLECTIONS
+from webapp.models import User
+
+pytest.importorskip('greenlet')  # the async engine of SQLAlchemy runs on it
+pytest.importorskip('aiosqlite')
+
+
+def test_async_url():
+    assert str(aio.async_url({'SQLALCHEMY_DATABASE_URI': 'sqlite:///site.db'})) == 'sqlite+aiosqlite:///site.db'
+    assert str(aio.async_url({'SQLALCHEMY_DATABASE_URI': 'postgresql+psycopg://db/app'})) == 'postgresql+psycopg://db/app'
+    assert str(aio.async_url({'SQLALCHEMY_DATABASE_URI': 'postgresql://db/app'})) == 'postgresql+asyncpg://db/app'
+    assert str(aio.async_url({'SQLALCHEMY_DATABASE_URI': 'sqlite://',
+                              'ASYNC_DATABASE_URI': 'sqlite+aiosqlite:///other.db'})) == 'sqlite+aiosqlite:///other.db'
+
+
+@pytest.fixture
+def async_database(app, tmp_path):
+    # the async engine can't reach the in-memory database of the tests, so it reads a copy of it
+    with app.app_context():
+        if _db.engine.dialect.name != 'sqlite':
+            yield
+            return
+        _db.session.commit()
+        raw = _db.engine.raw_connection()
+        copy = sqlite3.connect(tmp_path / 'copy.db')
+        try:
+            raw.driver_connection.backup(copy)
+        finally:
+            copy.close()
+            raw.close()
+    app.config['ASYNC_DATABASE_URI'] = f'sqlite+aiosqlite:///{tmp_path / "copy.db"}'
+    yield
+    app.config['ASYNC_DATABASE_URI'] = None
+
+
+def async_list(app, user_id, name, query):
+    with app.test_request_context(f'/api/v1/{name}?{query}'):
+        login_user(_db.session.get(User, user_id))
+        return asyncio.run(COLLECTIONS[name].list_async()).get_json()
+
+
+@pytest.fixture
+def records(logged_in, user_id):
+    logged_in.post('/api/v1/courses', json=[{'code': code, 'name': code} for code in ('MA2', 'PH1', 'CS1')])  # ids 1, 2 and 3
+    logged_in.post('/api/v1/assignments', json=[
+        {'course_id': course_id, 'name': f'Homework {i}', 'deadline': f'{i + 1:02}-01-2021 12:00'}
+        for course_id in (1, 2) for i in range(3)])
+
+
+@pytest.mark.parametrize('name, query', [
+    ('courses', 'limit=2'),
+    ('assignments', 'limit=4'),
+    ('assignments', 'course_id=2&limit=2'),
+])
+def test_async_lists_match_the_sync_ones(app, logged_in, user_id, records, async_database, name, query):
+    expected = logged_in.get(f'/api/v1/{name}?{query}').get_json()
+    assert async_list(app, user_id, name, query) == expected
+    # and the next page, through the cursor
+    query = f'{query}&after={expected["next"]}'
+    assert async_list(app, user_id, name, query) == logged_in.get(f'/api/v1/{name}?{query}').get_json()
+
+
+@pytest.mark.parametrize('course_id', ['4', 'PH1'])
+def test_async_list_of_another_users_course(app, user_id, records, async_database, course_id):
+    with pytest.raises(Exception) as error:
+        async_list(app, user_id, 'assignments', f'course_id={course_id}')
+    assert getattr(error.value, 'code', None) == 404
@@ -0,0 +1,87 @@
+from datetime import date, datetime, time
+
+from sqlalchemy import select
+
+from webapp.analytics import statistics
+from webapp.models import Course, Assignment, StudyTime, StudyDay
+
+
+def rollup(db):
+    return db.session.execute(select(StudyDay.course_id, StudyDay.date, StudyDay.seconds, StudyDay.sessions)
+                              .order_by(StudyDay.course_id, StudyDay.date)).all()
+
+
+def test_rollup_follows_the_study_time_pages(app, db, logged_in, user_id):
+    with app.app_context():
+        course = Course(code='MA2', name='Mathematics 2', user_id=user_id)
+        db.session.add(course)
+        db.session.commit()
+        course_id = course.id
+    for start, end in (('10:00', '11:30'), ('14:00', '14:45')):
+        logged_in.post('/course/MA2/studytime/new', data={'date': '05-01-2021', 'start': start, 'end': end})
+    with app.app_context():
+        assert rollup(db) == [(course_id, date(2021, 1, 5), 8100, 2)]
+    # moving a study time to another day updates both days
+    logged_in.post('/course/MA2/studytime/1/update', data={'date': '06-01-2021', 'start': '10:00', 'end': '11:00'})
+    with app.app_context():
+        assert rollup(db) == [(course_id, date(2021, 1, 5), 2700, 1), (course_id, date(2021, 1, 6), 3600, 1)]
+    logged_in.post('/course/MA2/studytime/2/delete')
+    with app.app_context():
+        assert rollup(db) == [(course_id, date(2021, 1, 6), 3600, 1)]
+
+
+def test_rollup_follows_the_api(app, db, logged_in, user_id):
+    course_id = logged_in.post('/api/v1/courses', json={'code': 'MA2', 'name': 'Mathematics 2'}).get_json()['done'][0]['id']
+    logged_in.post('/api/v1/studytimes', json=[
+        {'course_id': course_id, 'date': f'{day:02}-03-2021', 'start': f'{hour}:00', 'end': f'{hour + 1}:00'}
+        for day, hour in ((1, 10), (1, 12), (2, 10))])
+    with app.app_context():
+        assert rollup(db) == [(course_id, date(2021, 3, 1), 7200, 2), (course_id, date(2021, 3, 2), 3600, 1)]
+    logged_in.patch('/api/v1/studytimes', json=[{'id': 3, 'date': '2021-03-04', 'end': '12:30'}])
+    logged_in.delete('/api/v1/studytimes', json={'ids': [1]})
+    with app.app_context():
+        assert rollup(db) == [(course_id, date(2021, 3, 1), 3600, 1), (course_id, date(2021, 3, 4), 9000, 1)]
+    logged_in.delete('/api/v1/courses', json={'ids': [course_id]})
+    with app.app_context():
+        assert rollup(db) == []
+
+
+def test_statistics(app, db, user_id):
+    with app.app_context():
+        math = Course(code='MA2', name='Mathematics 2', user_id=user_id)
+        physics = Course(code='PH1', name='Physics 1', user_id=user_id)
+        db.session.add_all([math, physics])
+        # two days in a row, a gap, then three days in a row (monday 4 to wednesday 13 january 2021)
+        for day in (4, 5, 11, 12, 13):
+            db.session.add(StudyTime(date=date(2021, 1, day), start_time=time(10), end_time=time(11, 30), course=math))
+        db.session.add(StudyTime(date=date(2021, 1, 12), start_time=time(18), end_time=time(19), course=physics))
+        db.session.add(Assignment(name='Homework 1', deadline=datetime(2021, 1, 12, 23, 59), course=math))
+        db.session.commit()
+
+        stats = statistics(user_id, start=date(2021, 1, 1), end=date(2021, 1, 31), today=date(2021, 1, 14))
+        assert stats['total_hours'] == 8.5
+        assert [(day['date'].day, day['hours']) for day in stats['days']] == [(4, 1.5), (5, 1.5), (11, 1.5), (12, 2.5), (13, 1.5)]
+        assert [(week['week'], week['hours'], week['days']) for week in stats['weeks']] == [
+            (date(2021, 1, 4), 3.0, 2), (date(2021, 1, 11), 5.5, 3)]
+        assert [(course['code'], course['name'], course['hours']) for course in stats['courses']] == [
+            ('MA2', 'Mathematics 2', 7.5), ('PH1', 'Physics 1', 1.0)]
+        assert stats['streaks']['current'] == {'days': 3, 'first': date(2021, 1, 11), 'last': date(2021, 1, 13)}
+        assert stats['streaks']['longest']['days'] == 3
+        assert [(a['name'], a['hours']) for a in stats['deadlines']] == [('Homework 1', 3.0)]  # the 6th to the 12th
+
+        physics_only = statistics(user_id, physics.id, date(2021, 1, 1), date(2021, 1, 31), today=date(2021, 1, 20))
+        assert physics_only['total_hours'] == 1.0
+        assert physics_only['streaks']['current']['days'] == 0
+        assert physics_only['deadlines'] == []
+
+
+def test_statistics_pages(app, db, logged_in, user_id):
+    course_id = logged_in.post('/api/v1/courses', json={'code': 'MA2', 'name': 'Mathematics 2'}).get_json()['done'][0]['id']
+    logged_in.post('/api/v1/studytimes', json={'course_id': course_id, 'date': '2021-03-01', 'start': '10:00', 'end': '11:00'})
+    assert logged_in.get('/statistics?from=2021-03-01&to=2021-03-31').status_code == 200
+    assert logged_in.get('/course/MA2/statistics').status_code == 200
+    response = logged_in.get(f'/api/v1/statistics?course_id={course_id}&from=2021-03-01&to=2021-03-31')
+    assert response.status_code == 200
+    assert response.get_json()['days'] == [{'date': '2021-03-01', 'hours': 1.0, 'sessions': 1}]
+    assert logged_in.get('/api/v1/statistics?course_id=99').status_code == 404
+    assert logged_in.get('/api/v1/statistics?course_id=MA2').status_code == 404
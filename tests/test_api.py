@@ -0,0 +1,166 @@
+from webapp.models import Course, Assignment, Resource
+
+
+def create_course(client, code='MA2', name='Mathematics 2'):
+    return client.post('/api/v1/courses', json={'code': code, 'name': name})
+
+
+def test_api_needs_a_login(client):
+    response = client.get('/api/v1/courses')
+    assert response.status_code == 401
+    assert response.get_json()['error'] == 'Unauthorized'
+
+
+def test_bulk_create_with_partial_failures(app, logged_in, user_id):
+    response = create_course(logged_in)
+    assert response.status_code == 201
+    course_id = response.get_json()['done'][0]['id']
+    response = logged_in.post('/api/v1/assignments', json=[
+        {'course_id': course_id, 'name': 'Homework 1', 'deadline': '10-01-2021 12:00'},
+        {'course_id': course_id, 'name': 'Homework 2', 'deadline': '2021-01-17T12:00'},  # ISO 8601 works too
+        {'course_id': course_id, 'name': '', 'deadline': 'tomorrow'},
+        {'course_id': 99, 'name': 'Lab', 'deadline': '10-01-2021 12:00'},
+    ])
+    assert response.status_code == 207
+    body = response.get_json()
+    assert [item['index'] for item in body['done']] == [0, 1]
+    assert [item['index'] for item in body['errors']] == [2, 3]
+    assert set(body['errors'][0]['errors']) == {'name', 'deadline'}
+    assert body['errors'][1]['errors'] == {'course_id': ['No such course.']}
+    with app.app_context():
+        assert [a.name for a in Assignment.query.order_by(Assignment.id)] == ['Homework 1', 'Homework 2']
+        assert [a.id for a in Assignment.query.order_by(Assignment.id)] == [item['id'] for item in body['done']]
+
+
+def test_bulk_insert_is_one_statement(app, db, logged_in, user_id):
+    from sqlalchemy import event
+    course_id = create_course(logged_in).get_json()['done'][0]['id']
+    with app.app_context():
+        engine = db.engine
+    inserts = []
+    record = lambda conn, cursor, statement, *args: inserts.append(statement) if statement.startswith('INSERT INTO study_time') else None
+    event.listen(engine, 'before_cursor_execute', record)
+    try:
+        response = logged_in.post('/api/v1/studytimes', json=[
+            {'course_id': course_id, 'date': f'{day:02}-03-2021', 'start': '10:00', 'end': '11:30'} for day in range(1, 29)])
+    finally:
+        event.remove(engine, 'before_cursor_execute', record)
+    assert response.status_code == 201
+    assert len(response.get_json()['done']) == 28
+    assert len(inserts) == 1
+
+
+def test_list_with_etag(logged_in, user_id):
+    create_course(logged_in)
+    create_course(logged_in, 'PH1', 'Physics 1')
+    response = logged_in.get('/api/v1/courses')
+    assert response.status_code == 200
+    assert [course['code'] for course in response.get_json()['items']] == ['MA2', 'PH1']
+    etag = response.headers['ETag']
+    assert logged_in.get('/api/v1/courses', headers={'If-None-Match': etag}).status_code == 304
+    create_course(logged_in, 'CS1', 'Computer Science 1')
+    assert logged_in.get('/api/v1/courses', headers={'If-None-Match': etag}).status_code == 200
+
+
+def test_bulk_update_and_delete(app, logged_in, user_id):
+    course_id = create_course(logged_in).get_json()['done'][0]['id']
+    created = logged_in.post('/api/v1/assignments', json=[
+        {'course_id': course_id, 'name': f'Homework {i}', 'deadline': f'{i + 1:02}-01-2021 12:00'} for i in range(3)]).get_json()
+    ids = [item['id'] for item in created['done']]
+    logged_in.post('/api/v1/resources', json={'course_id': course_id, 'name': 'Slides'})
+    with app.app_context():
+        resource = Resource.query.one()
+        resource.assignment_id = ids[0]
+        from webapp import db
+        db.session.commit()
+
+    response = logged_in.patch('/api/v1/assignments', json=[{'id': ids[0], 'name': 'Renamed'}, {'id': 12345, 'name': 'x'}])
+    assert response.status_code == 207
+    items = logged_in.get(f'/api/v1/assignments?course_id={course_id}').get_json()['items']
+    assert [(item['name'], item['deadline']) for item in items][0] == ('Renamed', '2021-01-01T12:00:00')
+
+    response = logged_in.delete('/api/v1/assignments', json={'ids': ids[:2]})
+    assert response.status_code == 200
+    with app.app_context():
+        assert [a.id for a in Assignment.query] == ids[2:]
+        assert Resource.query.one().assignment_id is None
+
+
+def test_cannot_touch_other_users_records(app, db, logged_in, user_id):
+    from webapp.models import User
+    with app.app_context():
+        other = User(username='maria', email='maria@gmail.com', password='x')
+        db.session.add(other)
+        physics = Course(code='PH1', name='Physics', user=other)
+        db.session.add(Assignment(name='Lab', deadline=__import__('datetime').datetime(2021, 1, 1), course=physics))
+        db.session.commit()
+        physics_id = physics.id
+    assert logged_in.get(f'/api/v1/assignments?course_id={physics_id}').status_code == 404
+    assert logged_in.get('/api/v1/assignments?course_id=PH1').status_code == 404
+    assert logged_in.get('/api/v1/assignments').get_json()['items'] == []
+    assert logged_in.delete('/api/v1/courses', json={'ids': [physics_id]}).status_code == 422
+    assert logged_in.patch('/api/v1/courses', json=[{'id': physics_id, 'name': 'mine'}]).status_code == 422
+    assert logged_in.patch('/api/v1/assignments', json=[{'id': 1, 'name': 'mine'}]).status_code == 422
+    with app.app_context():
+        assert Course.query.count() == 1
+        assert Assignment.query.one().name == 'Lab'
+
+
+def test_ids_and_codes_that_are_not_ids_or_codes(app, logged_in, user_id):
+    # a list or an object where an id or a code goes is an error of its item, not a 500
+    course_id = create_course(logged_in).get_json()['done'][0]['id']
+    response = logged_in.delete('/api/v1/assignments', json={'ids': [{}]})
+    assert response.status_code == 422
+    assert response.get_json()['errors'] == [{'index': 0, 'errors': {'id': ['No such record.']}}]
+    response = logged_in.delete('/api/v1/courses', json={'ids': [[1], course_id]})
+    assert response.status_code == 207
+    assert response.get_json() == {'done': [{'index': 1, 'id': course_id}],
+                                   'errors': [{'index': 0, 'errors': {'id': ['No such course.']}}]}
+    course_id = create_course(logged_in).get_json()['done'][0]['id']
+    response = logged_in.post('/api/v1/assignments', json=[{'course_id': [1], 'name': 'Homework', 'deadline': '10-01-2021 12:00'},
+                                                           {'course_id': course_id, 'name': 'Homework', 'deadline': '10-01-2021 12:00'}])
+    assert response.status_code == 207
+    assert response.get_json()['errors'] == [{'index': 0, 'errors': {'course_id': ['No such course.']}}]
+    response = logged_in.patch('/api/v1/assignments', json=[{'id': [1]}])
+    assert response.status_code == 422
+    assert response.get_json()['errors'] == [{'index': 0, 'errors': {'id': ['No such record.']}}]
+    response = logged_in.post('/api/v1/courses', json=[{'code': ['x'], 'name': 'Mathematics 3'}])
+    assert response.status_code == 422
+    assert response.get_json()['errors'][0]['errors']['code'] == ['Expected a string.']
+    response = logged_in.patch('/api/v1/courses', json=[{'id': course_id, 'code': {'x': 1}}])
+    assert response.status_code == 422
+    assert response.get_json()['errors'][0]['errors']['code'] == ['Expected a string.']
+    with app.app_context():
+        assert [course.code for course in Course.query] == ['MA2']
+
+
+def test_conflict_at_insert_time_saves_nothing(app, db, logged_in, user_id, monkeypatch):
+    from webapp.api import CourseApi
+    create_course(logged_in)
+    # a concurrent request takes the code between the check and the insert
+    monkeypatch.setattr(CourseApi, '_taken_codes', lambda self, codes: {})
+    response = logged_in.post('/api/v1/courses', json=[{'code': 'PH1', 'name': 'Physics 1'}, {'code': 'MA2', 'name': 'Twice'}])
+    assert response.status_code == 409
+    assert response.get_json()['message'] == 'The records conflict with existing ones, nothing was saved.'
+    with app.app_context():
+        assert [course.code for course in Course.query] == ['MA2']
+    assert create_course(logged_in, 'PH1', 'Physics 1').status_code == 201  # the session was rolled back
+
+
+def test_course_codes(app, db, logged_in, user_id):
+    response = logged_in.post('/api/v1/courses', json=[{'code': 'MA2', 'name': 'Mathematics 2'}, {'code': 'PH1', 'name': 'Physics 1'},
+                                                       {'code': 'MA2', 'name': 'Twice'}])
+    assert response.status_code == 207
+    math, physics = [item['id'] for item in response.get_json()['done']]
+    assert response.get_json()['errors'] == [{'index': 2, 'errors': {'code': ['This course already exists.']}}]
+    logged_in.post('/api/v1/assignments', json={'course_id': math, 'name': 'Homework 1', 'deadline': '2021-01-10T12:00'})
+
+    # the code can change, the id (and what points to it) stays
+    response = logged_in.patch('/api/v1/courses', json=[{'id': math, 'code': 'MA3'}, {'id': physics, 'code': 'MA3'}])
+    assert response.get_json()['errors'] == [{'index': 1, 'errors': {'code': ['This course already exists.']}}]
+    assert [(course['id'], course['code']) for course in logged_in.get('/api/v1/courses').get_json()['items']] == [
+        (math, 'MA3'), (physics, 'PH1')]
+    assert logged_in.get('/course/MA3/assignment/1').status_code == 200
+    assert logged_in.get('/course/MA2').status_code == 404
+    with app.app_context():
+        assert Assignment.query.one().course_id == math
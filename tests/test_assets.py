@@ -0,0 +1,83 @@
+import gzip
+import os
+
+import pytest
+
+from webapp import assets
+
+
+@pytest.fixture(scope='module')
+def build_dir(tmp_path_factory):
+    # one build of the real static folder for the tests of this file (brotli takes its time)
+    path = tmp_path_factory.mktemp('dist')
+    assets.build(os.path.join(os.path.dirname(assets.__file__), 'static'), path)
+    return path
+
+
+@pytest.fixture
+def built(app, build_dir):
+    app.config['ASSET_DIR'] = str(build_dir)
+    manifest = assets.load_manifest(app)
+    yield manifest
+    app.config['ASSET_DIR'] = None
+    assets.load_manifest(app)
+
+
+def test_pages_link_the_hashed_files(built, client):
+    body = client.get('/login').get_data(as_text=True)
+    assert f'/assets/{built["main.css"]}' in body
+    assert f'/assets/{built["vendor/bootstrap-4.0.0/bootstrap.min.css"]}' in body
+    assert f'/assets/{built["vendor/bootstrap-4.0.0/bootstrap.bundle.min.js"]}' in body
+    assert 'https://' not in body  # nothing comes from a CDN
+
+
+def test_unbuilt_files_fall_back_to_static(app, client):
+    assets.load_manifest(app)
+    with app.test_request_context():
+        assert assets.asset_url('main.css') == '/static/main.css'
+    assert '/static/main.css' in client.get('/login').get_data(as_text=True)
+
+
+def test_hash_changes_with_the_content(app, tmp_path):
+    static = tmp_path / 'static'
+    static.mkdir()
+    (static / 'main.css').write_text('body { color: red; }')
+    first = assets.build(static, tmp_path / 'dist')['main.css']
+    assert first == assets.build(static, tmp_path / 'dist')['main.css']
+    (static / 'main.css').write_text('body { color: blue; }')
+    second = assets.build(static, tmp_path / 'dist')['main.css']
+    assert first != second and first.startswith('main.') and first.endswith('.css')
+    # the older build stays for the pages that still link to it
+    assert (tmp_path / 'dist' / first).exists() and (tmp_path / 'dist' / second).exists()
+
+
+@pytest.mark.parametrize('accept, encoding', [('br, gzip', 'br'), ('gzip, deflate', 'gzip'), ('', None), ('br;q=0, gzip', 'gzip')])
+def test_encoding_is_negotiated(built, client, build_dir, accept, encoding):
+    if encoding == 'br' and not os.path.exists(build_dir / (built['main.css'] + '.br')):
+        pytest.skip('brotli is not installed')
+    response = client.get(f'/assets/{built["main.css"]}', headers={'Accept-Encoding': accept})
+    assert response.status_code == 200
+    assert response.headers.get('Content-Encoding') == encoding
+    assert response.mimetype == 'text/css'
+    assert 'immutable' in response.headers['Cache-Control'] and 'max-age=31536000' in response.headers['Cache-Control']
+    assert 'Accept-Encoding' in response.headers['Vary']
+    with open(build_dir / built['main.css'], 'rb') as file:
+        original = file.read()
+    if encoding == 'gzip':
+        assert gzip.decompress(response.data) == original
+    elif encoding is None:
+        assert response.data == original
+    # a browser that revalidates anyway gets a 304
+    etag = response.headers['ETag']
+    assert client.get(f'/assets/{built["main.css"]}', headers={'Accept-Encoding': accept, 'If-None-Match': etag}).status_code == 304
+
+
+def test_images_are_not_compressed(built, client, build_dir):
+    assert not os.path.exists(build_dir / (built['profile_pic.jpg'] + '.gz'))
+    response = client.get(f'/assets/{built["profile_pic.jpg"]}', headers={'Accept-Encoding': 'gzip'})
+    assert response.status_code == 200 and 'Content-Encoding' not in response.headers
+
+
+@pytest.mark.parametrize('filename', ['manifest.json', 'nothing.css', '../assets.py'])
+def test_only_built_files_are_served(built, client, filename):
+    assert client.get(f'/assets/{filename}').status_code == 404
@@ -0,0 +1,133 @@
+from datetime import date, datetime, time, timedelta
+
+from sqlalchemy import event, func, select
+
+from webapp.analytics import statistics
+from webapp.models import Course, Assignment, StudyTime, StudyDay, Resource, SearchDocument
+from webapp.search import search
+
+
+def add_course(app, db, user_id, code='MA2', children=3):
+    with app.app_context():
+        course = Course(code=code, name=f'Mathematics {code}', user_id=user_id)
+        db.session.add(course)
+        for i in range(children):
+            assignment = Assignment(name=f'Homework {i}', deadline=datetime(2021, 1, 10) + timedelta(days=i), course=course)
+            db.session.add(assignment)
+            db.session.add(StudyTime(date=date(2021, 1, 1) + timedelta(days=i), start_time=time(10), end_time=time(11), course=course))
+            db.session.add(Resource(name=f'Slides {i}', course=course, assignment=assignment))
+        db.session.commit()
+        return course.id
+
+
+def counts(app, db, course_id):
+    with app.app_context():
+        return [db.session.scalar(select(func.count()).select_from(model).where(model.course_id == course_id))
+                for model in (Assignment, StudyTime, Resource, StudyDay, SearchDocument)]
+
+
+def test_delete_course_with_its_records(app, db, logged_in, user_id):
+    course_id = add_course(app, db, user_id, children=50)
+    other = add_course(app, db, user_id, 'PH1')
+    with app.app_context():
+        engine = db.engine
+    statements = []
+    record = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(engine, 'before_cursor_execute', record)
+    try:
+        assert logged_in.post('/course/MA2/delete').status_code == 302
+    finally:
+        event.remove(engine, 'before_cursor_execute', record)
+    assert counts(app, db, course_id) == [0, 0, 0, 0, 0]
+    assert counts(app, db, other) == [3, 3, 3, 3, 7]
+    with app.app_context():
+        assert db.session.get(Course, course_id) is None
+    assert len(statements) < 15  # not one per record
+
+
+def test_archive_and_unarchive(app, db, logged_in, user_id):
+    course_id = add_course(app, db, user_id)
+    add_course(app, db, user_id, 'PH1')
+    assert logged_in.post('/course/MA2/archive').status_code == 302
+    assert counts(app, db, course_id) == [3, 3, 3, 3, 0]  # kept, but out of the search
+    assert 'Mathematics MA2' not in logged_in.get('/courses').get_data(as_text=True)
+    assert 'Mathematics MA2' in logged_in.get('/courses/archived').get_data(as_text=True)
+    assert 'Mathematics MA2' not in logged_in.get('/assignments').get_data(as_text=True)
+    assert len(logged_in.get('/api/v1/assignments').get_json()['items']) == 3  # only the other course's
+    assert 'Unarchive' in logged_in.get('/course/MA2').get_data(as_text=True)
+    assert 'Homework 0' in logged_in.get('/course/MA2/assignments').get_data(as_text=True)  # the archived course's own lists
+    with app.app_context():
+        assert {result['code'] for result in search(user_id, 'homework')} == {'PH1'}
+        assert statistics(user_id, None, date(2021, 1, 1), date(2021, 1, 31))['total_hours'] == 6  # the time studied still counts
+
+    # nothing can be added to an archived course
+    assert logged_in.post('/course/MA2/resource/new', data={'name': 'Notes'}).status_code == 404
+    response = logged_in.post('/api/v1/resources', json={'course_id': course_id, 'name': 'Notes'})
+    assert response.get_json()['errors'][0]['errors'] == {'course_id': ['No such course.']}
+
+    assert logged_in.post('/course/MA2/unarchive').status_code == 302
+    assert counts(app, db, course_id) == [3, 3, 3, 3, 7]
+    assert len(logged_in.get('/api/v1/assignments').get_json()['items']) == 6
+
+
+def test_unarchive_reindexes_through_subqueries(app, db, logged_in, user_id):
+    course_id = add_course(app, db, user_id, children=50)
+    logged_in.post('/course/MA2/archive')
+    with app.app_context():
+        engine = db.engine
+    parameters = []
+    record = lambda conn, cursor, statement, params, *args: parameters.append(len(params))
+    event.listen(engine, 'before_cursor_execute', record)
+    try:
+        assert logged_in.post('/course/MA2/unarchive').status_code == 302
+    finally:
+        event.remove(engine, 'before_cursor_execute', record)
+    assert counts(app, db, course_id) == [50, 50, 50, 50, 101]
+    assert max(parameters) < 10  # the ids of the records stay in the database, not one bound parameter each
+
+
+def test_archive_through_the_api(app, db, logged_in, user_id):
+    course_id = add_course(app, db, user_id)
+    response = logged_in.patch('/api/v1/courses', json=[{'id': course_id, 'archived': True}, {'id': course_id, 'archived': 'yes'}])
+    assert response.status_code == 207
+    assert response.get_json()['errors'] == [{'index': 1, 'errors': {'archived': ['Expected true or false.']}}]
+    assert logged_in.get('/api/v1/courses').get_json()['items'] == []
+    with app.app_context():
+        assert db.session.scalars(select(Assignment.archived).where(Assignment.course_id == course_id)).all() == [True] * 3
+    logged_in.patch('/api/v1/courses', json=[{'id': course_id, 'archived': False}])
+    assert [course['id'] for course in logged_in.get('/api/v1/courses').get_json()['items']] == [course_id]
+
+
+def test_archived_rows_are_left_out_through_the_index(app, db, user_id):
+    from webapp import queries
+    from webapp.pagination import PageRequest
+    course_id = add_course(app, db, user_id)
+    with app.app_context():
+        if db.engine.dialect.name != 'sqlite':
+            return
+        statements = []
+        record = lambda conn, cursor, statement, parameters, *args: statements.append((statement, parameters))
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            queries.course_assignments(course_id, PageRequest(limit=10))
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+        statement, parameters = statements[-1]
+        plan = ' '.join(row[3] for row in db.session.connection().exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, parameters))
+        assert 'ix_assignment_course_id_archived_deadline' in plan and 'TEMP B-TREE' not in plan, plan
+
+
+def test_update_course_keeps_its_records(app, db, logged_in, user_id):
+    course_id = add_course(app, db, user_id)
+    add_course(app, db, user_id, 'PH1', children=0)
+    response = logged_in.post('/course/MA2/update', data={'code': 'PH1', 'name': 'Mathematics 3'})
+    assert b'You already have a course with this code!' in response.data
+    assert logged_in.post('/course/MA2/update', data={'code': 'MA3', 'name': 'Mathematics 3'}).headers['Location'] == '/course/MA3'
+    with app.app_context():
+        course = db.session.get(Course, course_id)
+        assert (course.code, course.name) == ('MA3', 'Mathematics 3')
+    assert counts(app, db, course_id) == [3, 3, 3, 3, 7]  # nothing that points to the course had to change
+    assert 'Homework 0' in logged_in.get('/course/MA3/assignments').get_data(as_text=True)
+    assert logged_in.get('/course/MA2').status_code == 404
+    with app.app_context():
+        assert [result['code'] for result in search(user_id, 'mathematics 3')] == ['MA3']
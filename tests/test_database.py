@@ -0,0 +1,36 @@
+from webapp import create_app, db
+from webapp.config import Config
+from webapp.database import engine_options
+
+
+def make_config(url):
+    return type('TestConfig', (Config,), {'SQLALCHEMY_DATABASE_URI': url, 'SQLITE_BUSY_TIMEOUT': 1234})
+
+
+def config_dict(url):
+    config = make_config(url)
+    return {key: getattr(config, key) for key in dir(config) if key.isupper()}
+
+
+def test_sqlite_connections_are_tuned(tmp_path):
+    app = create_app(make_config(f'sqlite:///{tmp_path / "tuned.db"}'))
+    with app.app_context():
+        with db.engine.connect() as connection:
+            pragma = lambda name: connection.exec_driver_sql(f'PRAGMA {name}').scalar()
+            assert pragma('journal_mode') == 'wal'
+            assert pragma('synchronous') == 1  # NORMAL
+            assert pragma('busy_timeout') == 1234
+            assert pragma('mmap_size') == Config.SQLITE_MMAP_SIZE
+        assert db.engine.pool.size() == Config.DB_POOL_SIZE
+
+
+def test_postgresql_gets_a_pool():
+    options = engine_options(config_dict('postgresql+psycopg://app:secret@db/webapp'))
+    assert options['pool_size'] == Config.DB_POOL_SIZE
+    assert options['max_overflow'] == Config.DB_MAX_OVERFLOW
+    assert options['pool_recycle'] == Config.DB_POOL_RECYCLE
+    assert options['pool_pre_ping'] is True
+
+
+def test_memory_sqlite_has_no_pool_settings():
+    assert 'pool_size' not in engine_options(config_dict('sqlite://'))
@@ -0,0 +1,73 @@
+from datetime import datetime, date, time
+
+import pytest
+
+from webapp.export import feed_token, _ics_line
+from webapp.models import User, Course, Assignment, StudyTime
+
+
+@pytest.fixture
+def course_id(app, db, user_id):
+    with app.app_context():
+        course = Course(code='MA2', name='Mathematics 2', user_id=user_id)
+        db.session.add(course)
+        db.session.add(Assignment(name='Homework, part 1', deadline=datetime(2021, 1, 10, 12, 0), course=course))
+        db.session.add(StudyTime(date=date(2021, 1, 5), start_time=time(10), end_time=time(11, 30), course=course))
+        db.session.commit()
+        return course.id
+
+
+def data_version(app, user_id):
+    with app.app_context():
+        return User.query.get(user_id).data_version
+
+
+def test_assignments_calendar(logged_in, course_id):
+    response = logged_in.get('/export/assignments.ics')
+    assert response.status_code == 200
+    assert response.mimetype == 'text/calendar'
+    body = response.get_data(as_text=True)
+    assert body.startswith('BEGIN:VCALENDAR\r\n') and body.endswith('END:VCALENDAR\r\n')
+    assert 'DTSTART:20210110T120000\r\n' in body
+    assert 'SUMMARY:Homework\\, part 1 (Mathematics 2)\r\n' in body
+
+
+def test_study_times_csv(logged_in, course_id):
+    body = logged_in.get('/export/studytimes.csv').get_data(as_text=True)
+    assert body.splitlines() == ['id,course_code,course,date,start_time,end_time',
+                                 '1,MA2,Mathematics 2,2021-01-05,10:00:00,11:30:00']
+
+
+def test_conditional_get_until_the_data_changes(app, logged_in, course_id, user_id):
+    response = logged_in.get('/export/assignments.ics')
+    etag, modified = response.headers['ETag'], response.headers['Last-Modified']
+    assert logged_in.get('/export/assignments.ics', headers={'If-None-Match': etag}).status_code == 304
+    assert logged_in.get('/export/assignments.ics', headers={'If-Modified-Since': modified}).status_code == 304
+
+    version = data_version(app, user_id)
+    logged_in.post('/course/MA2/assignment/new', data={'name': 'Homework 2', 'deadline': '17-01-2021 12:00'})
+    assert data_version(app, user_id) == version + 1
+    response = logged_in.get('/export/assignments.ics', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert 'Homework 2' in response.get_data(as_text=True)
+
+
+def test_bulk_api_bumps_the_version(app, logged_in, course_id, user_id):
+    version = data_version(app, user_id)
+    logged_in.post('/api/v1/assignments', json=[{'course_id': course_id, 'name': 'Quiz', 'deadline': '2021-02-01T09:00'}])
+    assert data_version(app, user_id) == version + 1
+
+
+def test_feed_token_works_without_login(app, client, course_id, user_id):
+    with app.test_request_context():
+        token = feed_token(user_id)
+    assert client.get(f'/export/studytimes.ics?token={token}').status_code == 200
+    assert client.get('/export/studytimes.ics?token=forged').status_code == 404
+    assert client.get('/export/studytimes.ics').status_code == 401
+
+
+def test_long_lines_are_folded():
+    line = 'SUMMARY:' + 'é' * 60
+    folded = _ics_line(line)
+    assert all(len(part.encode()) <= 75 for part in folded.rstrip('\r\n').split('\r\n'))
+    assert folded.replace('\r\n ', '') == line + '\r\n'
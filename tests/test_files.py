@@ -0,0 +1,136 @@
+import hashlib
+import io
+import os
+
+import pytest
+
+from webapp.files import blob_path, collect_garbage
+from webapp.models import Course, Resource, Blob
+
+PDF = b'%PDF-1.4 ' + bytes(range(256)) * 400  # 100 KiB
+
+
+@pytest.fixture
+def storage(app, tmp_path):
+    old = app.config['FILE_STORAGE']
+    app.config['FILE_STORAGE'] = str(tmp_path)
+    yield tmp_path
+    app.config['FILE_STORAGE'] = old
+
+
+@pytest.fixture
+def course(app, db, user_id):
+    with app.app_context():
+        db.session.add(Course(code='MA2', name='Mathematics 2', user_id=user_id))
+        db.session.commit()
+
+
+def upload(client, name, content, filename='slides.pdf', url='/course/MA2/resource/new'):
+    return client.post(url, data={'name': name, 'file': (io.BytesIO(content), filename)}, content_type='multipart/form-data')
+
+
+def blobs(app, db):
+    with app.app_context():
+        return {blob.sha256: blob.refcount for blob in Blob.query}
+
+
+def resource_id(app, name):
+    with app.app_context():
+        return Resource.query.filter_by(name=name).one().id
+
+
+def stored_files(storage):
+    return sorted(name for parent, folders, names in os.walk(storage) for name in names if parent != str(storage / 'tmp'))
+
+
+def test_the_same_file_is_stored_once(app, db, logged_in, storage, course):
+    sha256 = hashlib.sha256(PDF).hexdigest()
+    for name in ('Slides', 'Slides again'):
+        assert upload(logged_in, name, PDF).status_code == 302
+    assert blobs(app, db) == {sha256: 2}
+    assert stored_files(storage) == [sha256]
+    assert os.listdir(storage / 'tmp') == []  # the uploads were linked into place and their temporary files removed
+
+    url = f'/course/MA2/resource/{resource_id(app, "Slides")}/file'
+    response = logged_in.get(url)
+    assert response.data == PDF
+    assert response.headers['ETag'] == f'"{sha256}"'
+    assert response.headers['Content-Type'] == 'application/pdf'
+    assert response.headers['Content-Disposition'].startswith('inline')
+    assert 'private' in response.headers['Cache-Control']
+    response.close()
+
+    response = logged_in.get(url, headers={'Range': 'bytes=100-199'})
+    assert response.status_code == 206
+    assert response.headers['Content-Range'] == f'bytes 100-199/{len(PDF)}'
+    assert response.data == PDF[100:200]
+    response.close()
+    assert logged_in.get(url, headers={'If-None-Match': f'"{sha256}"'}).status_code == 304
+
+
+def test_other_types_are_downloaded(app, db, logged_in, storage, course):
+    upload(logged_in, 'Page', b'<script>alert(1)</script>', filename='page.html')
+    response = logged_in.get(f'/course/MA2/resource/{resource_id(app, "Page")}/file')
+    assert response.headers['Content-Disposition'] == 'attachment; filename=page.html'
+    assert response.headers['X-Content-Type-Options'] == 'nosniff'
+    response.close()
+
+
+def test_no_file_no_download(app, db, logged_in, storage, course):
+    assert logged_in.post('/course/MA2/resource/new', data={'name': 'Notes'}).status_code == 302
+    assert logged_in.get(f'/course/MA2/resource/{resource_id(app, "Notes")}/file').status_code == 404
+    assert blobs(app, db) == {}
+
+
+def test_garbage_collection_after_the_last_reference(app, db, logged_in, storage, course):
+    old, new = hashlib.sha256(PDF).hexdigest(), hashlib.sha256(b'new slides').hexdigest()
+    upload(logged_in, 'Slides', PDF)
+    upload(logged_in, 'Slides again', PDF)
+    slides = resource_id(app, 'Slides')
+    # a new file for one of them, then the other one is deleted: the first file has no references left
+    upload(logged_in, 'Slides', b'new slides', url=f'/course/MA2/resource/{slides}/update')
+    assert blobs(app, db) == {old: 1, new: 1}
+    logged_in.post(f'/course/MA2/resource/{resource_id(app, "Slides again")}/delete')
+    assert blobs(app, db) == {old: 0, new: 1}
+
+    with app.app_context():
+        assert collect_garbage(app)['removed'] == 0  # not before FILE_GC_GRACE
+        assert collect_garbage(app, grace=0) == {'removed': 1, 'orphans': 0, 'temporary': 0}
+    assert blobs(app, db) == {new: 1}
+    assert stored_files(storage) == [new]
+    assert logged_in.get(f'/course/MA2/resource/{slides}/file').data == b'new slides'
+
+    # uploaded again after it was removed, it's stored again
+    upload(logged_in, 'Slides once more', PDF)
+    assert blobs(app, db) == {old: 1, new: 1}
+    assert stored_files(storage) == sorted([old, new])
+
+
+def test_bulk_deletes_release_their_files(app, db, logged_in, user_id, storage, course):
+    upload(logged_in, 'Slides', PDF)
+    upload(logged_in, 'Slides again', PDF)
+    upload(logged_in, 'Notes', b'notes', filename='notes.txt')
+    response = logged_in.delete('/api/v1/resources', json={'ids': [resource_id(app, 'Notes')]})
+    assert response.status_code == 200, response.get_json()
+    assert sorted(blobs(app, db).values()) == [0, 2]
+
+    logged_in.post('/course/MA2/delete')  # the course with its resources, in a few statements
+    assert sorted(blobs(app, db).values()) == [0, 0]
+    with app.app_context():
+        assert collect_garbage(app, grace=0)['removed'] == 2
+    assert stored_files(storage) == []
+
+
+def test_orphans_and_stale_uploads_are_collected(app, db, storage):
+    orphan = hashlib.sha256(b'rolled back').hexdigest()
+    path = blob_path(str(storage), orphan)
+    os.makedirs(os.path.dirname(path))
+    with open(path, 'wb') as f:
+        f.write(b'rolled back')
+    os.makedirs(storage / 'tmp')
+    (storage / 'tmp' / 'upload-left-behind').write_bytes(b'half a file')
+    with app.app_context():
+        assert collect_garbage(app) == {'removed': 0, 'orphans': 0, 'temporary': 0}  # too recent
+        assert collect_garbage(app, grace=0) == {'removed': 1, 'orphans': 1, 'temporary': 1}
+    assert stored_files(storage) == []
+    assert os.listdir(storage / 'tmp') == []
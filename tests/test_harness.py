@@ -0,0 +1,26 @@
+import importlib.util
+import os
+
+from webapp import metrics, passwords
+
+# a short run of the load test (benchmarks/harness.py), so that it keeps working with the pages it drives
+
+path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks', 'harness.py')
+spec = importlib.util.spec_from_file_location('harness', path)
+harness = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(harness)
+
+
+def test_every_step_of_the_scenario_succeeds(app, db):
+    with app.app_context():
+        users = harness.seed(db, users=2, courses=2, items=3, password_hash=passwords.hash(harness.PASSWORD))
+    assert users == [('bench0@example.com', [(1, 'C0'), (2, 'C1')]), ('bench1@example.com', [(3, 'C0'), (4, 'C1')])]
+    metrics.reset()
+    results, seconds = harness.drive(lambda: harness.TestClientSession(app), users, clients=1, iterations=2)  # the in-memory database has one connection
+    summary = harness.summarize(results, seconds)
+    assert summary['total']['errors'] == 0
+    assert summary['delete assignment']['requests'] == 10  # 5 created through the api by each round
+    assert summary['course assignments']['queries'] >= 1
+
+    baseline = dict(summary, search=dict(summary['search'], p50_ms=0.001, queries=0.0))
+    assert [regression.split(':')[0] for regression in harness.regressions(summary, baseline, min_ms=0)] == ['search', 'search']
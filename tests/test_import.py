@@ -0,0 +1,84 @@
+import io
+
+from webapp.importer import import_courses, import_assignments, import_command
+from webapp.models import User, Course, Assignment
+
+COURSES = 'code,name\nMA2,Mathematics 2\nPH1,Physics 1\n,No code\nMA2,Mathematics 2 again\n'
+ASSIGNMENTS = '\ufeffcourse,name,deadline\r\nMA2,Homework 1,10-01-2021 12:00\r\nPH1,Lab 1,2021-01-12T08:00\r\nCS1,Essay,10-01-2021 12:00\r\nMA2,Homework 2,tomorrow\r\n'
+
+
+def csv_file(text):
+    return io.BytesIO(text.encode('utf-8'))
+
+
+def test_import_courses_and_assignments(app, db, user_id):
+    with app.app_context():
+        report = import_courses(csv_file(COURSES), user_id)
+        assert (report.rows, report.imported, report.failed) == (4, 2, 2)
+        assert [line for line, errors in report.errors] == [4, 5]
+        assert report.errors[1][1] == {'code': ['This course already exists.']}
+        courses = {course.code: course.id for course in Course.query}
+        assert sorted(courses) == ['MA2', 'PH1']
+
+        report = import_assignments(csv_file(ASSIGNMENTS), user_id, chunk_size=1)
+        assert (report.rows, report.imported, report.failed) == (4, 2, 2)
+        assert report.errors[0] == (4, {'course': ['No such course.']})
+        assert set(report.errors[1][1]) == {'deadline'}
+        assert [(a.course_id, a.name) for a in Assignment.query.order_by(Assignment.id)] == [
+            (courses['MA2'], 'Homework 1'), (courses['PH1'], 'Lab 1')]
+        assert db.session.get(User, user_id).data_version == 3  # one bump per chunk
+
+
+def test_no_assignments_for_archived_courses(app, db, user_id):
+    with app.app_context():
+        import_courses(csv_file(COURSES), user_id)
+        Course.query.filter_by(code='PH1').one().archived = True
+        db.session.commit()
+        report = import_assignments(csv_file(ASSIGNMENTS), user_id)
+        assert report.imported == 1
+        assert report.errors[:2] == [(3, {'course': ['No such course.']}), (4, {'course': ['No such course.']})]
+        assert [a.name for a in Assignment.query] == ['Homework 1']
+
+
+def test_upload(logged_in, user_id):
+    logged_in.post('/api/v1/courses', json={'code': 'MA2', 'name': 'Mathematics 2'})
+    response = logged_in.post('/import', data={'kind': 'assignments', 'file': (csv_file(ASSIGNMENTS), 'deadlines.csv')},
+                              content_type='multipart/form-data')
+    assert response.status_code == 200
+    assert b'1 of 4 rows imported' in response.data
+    assert b'Line 3:' in response.data
+    assert len(logged_in.get('/api/v1/assignments').get_json()['items']) == 1
+
+
+def test_command(app, user_id, tmp_path):
+    path = tmp_path / 'courses.csv'
+    path.write_text(COURSES.replace('code,', 'id,', 1))  # a file from before the codes
+    result = app.test_cli_runner().invoke(import_command, ['courses', str(path), '--user', 'iulia@gmail.com'])
+    assert result.exit_code == 0
+    assert '2 of 4 rows imported' in result.output
+    result = app.test_cli_runner().invoke(import_command, ['courses', str(path), '--user', 'nobody@gmail.com'])
+    assert result.exit_code != 0
+
+
+def test_files_that_are_not_utf8(app, db, logged_in, user_id, tmp_path):
+    # Latin-1: the rows before the first byte that isn't UTF-8 are imported, the report says where it stopped
+    latin1 = ('code,name\n' + ''.join(f'C{i},Course {i}\n' for i in range(1000)) + 'EC1,\u00c9conomie\n').encode('latin-1')
+    with app.app_context():
+        report = import_courses(io.BytesIO(latin1), user_id, chunk_size=100)
+        assert 0 < report.imported == report.rows < 1000
+        assert report.file_error == f'the file is not UTF-8 text (save it as "CSV UTF-8"), only its first {report.rows + 1} lines were read'
+        assert Course.query.count() == report.imported
+
+    # UTF-16 (Excel's "Unicode text"): nothing is read
+    utf16 = 'course,name,deadline\nMA2,Homework 1,10-01-2021 12:00\n'.encode('utf-16')
+    response = logged_in.post('/import', data={'kind': 'assignments', 'file': (io.BytesIO(utf16), 'deadlines.csv')},
+                              content_type='multipart/form-data', follow_redirects=True)
+    assert response.status_code == 200
+    assert b'0 of 0 rows imported, the file is not UTF-8 text' in response.data
+    assert b'only its first 0 lines were read' in response.data
+
+    path = tmp_path / 'deadlines.csv'
+    path.write_bytes(utf16)
+    result = app.test_cli_runner().invoke(import_command, ['assignments', str(path), '--user', 'iulia@gmail.com'])
+    assert result.exit_code != 0
+    assert 'the file is not UTF-8 text' in result.output
@@ -0,0 +1,65 @@
+import logging
+import time
+
+import pytest
+
+from webapp import metrics, passwords
+from webapp.models import Course
+
+
+@pytest.fixture
+def fresh_metrics(app):
+    metrics.reset()
+    yield metrics
+    app.config.update(SLOW_REQUEST_MS=0, SLOW_REQUEST_PROFILE=False, METRICS_TOKEN=None)
+
+
+def test_requests_are_timed_by_endpoint(app, db, logged_in, user_id, fresh_metrics):
+    with app.app_context():
+        db.session.add(Course(code='MA2', name='Mathematics 2', user_id=user_id))
+        db.session.commit()
+    for _ in range(3):
+        logged_in.get('/course/MA2/studytimes')
+    logged_in.get('/no/such/page')
+    assert metrics.REQUEST_DURATION.count('main.course_study_times', 'GET') == 3
+    assert metrics.REQUESTS.value('main.course_study_times', 'GET', '200') == 3
+    assert metrics.REQUESTS.value('unmatched', 'GET', '404') == 1
+    assert metrics.SQL_STATEMENTS.value('main.course_study_times') >= 3
+    assert metrics.TEMPLATE_DURATION.count('course_study_times.html') == 1  # the other two came from the page cache
+
+    text = logged_in.get('/metrics').get_data(as_text=True)
+    assert '# TYPE webapp_request_duration_seconds histogram' in text
+    assert 'webapp_request_duration_seconds_count{endpoint="main.course_study_times",method="GET"} 3' in text
+    assert 'webapp_request_duration_seconds_bucket{endpoint="main.course_study_times",method="GET",le="+Inf"} 3' in text
+    assert 'webapp_requests_total{endpoint="unmatched",method="GET",status="404"} 1.0' in text
+    assert 'webapp_cache_hits_total{cache="pages"} 2' in text
+
+
+def test_password_hashing_is_timed(app, fresh_metrics):
+    with app.app_context():
+        passwords.check(passwords.hash('secret'), 'secret')
+    assert metrics.PASSWORD_HASH_DURATION.count('hashpw') == 1
+    assert metrics.PASSWORD_HASH_DURATION.count('checkpw') == 1
+
+
+def test_metrics_token(app, client, fresh_metrics):
+    app.config['METRICS_TOKEN'] = 'scraper'
+    assert client.get('/metrics').status_code == 401
+    assert client.get('/metrics', headers={'Authorization': 'Bearer scraper'}).status_code == 200
+
+
+def test_slow_requests_are_logged_with_their_sql_and_stacks(app, logged_in, fresh_metrics, caplog, monkeypatch):
+    app.config.update(SLOW_REQUEST_MS=1, SLOW_REQUEST_PROFILE=True)
+    render = app.jinja_env.get_template
+
+    def slow_template(*args, **kwargs):
+        time.sleep(0.05)
+        return render(*args, **kwargs)
+
+    monkeypatch.setattr(app.jinja_env, 'get_template', slow_template)
+    with caplog.at_level(logging.WARNING, logger='webapp.metrics'):
+        logged_in.get('/courses')
+    message = caplog.records[-1].getMessage()
+    assert message.startswith('Slow request: GET /courses (main.all_courses) took')
+    assert 'FROM course' in message
+    assert 'samples in:' in message and 'slow_template' in message
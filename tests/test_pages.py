@@ -0,0 +1,86 @@
+from datetime import datetime
+
+from sqlalchemy import event
+
+from webapp import pages
+from webapp.models import Course, Assignment
+
+
+def add_course(app, db, user_id, code='MA2', name='Mathematics 2'):
+    with app.app_context():
+        course = Course(code=code, name=name, user_id=user_id)
+        db.session.add(course)
+        db.session.commit()
+        return course.id
+
+
+def get(app, db, client, url, **kwargs):
+    # the response and the number of statements it ran
+    with app.app_context():
+        engine = db.engine
+    statements = []
+    record = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(engine, 'before_cursor_execute', record)
+    try:
+        response = client.get(url, **kwargs)
+    finally:
+        event.remove(engine, 'before_cursor_execute', record)
+    return response, len(statements)
+
+
+def test_second_request_is_served_from_the_cache(app, db, logged_in, user_id):
+    add_course(app, db, user_id)
+    pages.reset_stats()
+    first, first_statements = get(app, db, logged_in, '/course/MA2/assignments')
+    second, second_statements = get(app, db, logged_in, '/course/MA2/assignments')
+    assert (first.headers['X-Cache'], second.headers['X-Cache']) == ('MISS', 'HIT')
+    assert second.data == first.data and second.headers['ETag'] == first.headers['ETag']
+    assert second_statements == 1 < first_statements  # only the course's version
+    # a browser that has the page gets a 304
+    response = logged_in.get('/course/MA2/assignments', headers={'If-None-Match': first.headers['ETag']})
+    assert response.status_code == 304 and response.data == b''
+    # every page of a paginated list has its own entry
+    assert logged_in.get('/course/MA2/assignments?limit=5').headers['X-Cache'] == 'MISS'
+    assert pages.stats() == {'hits': 2, 'misses': 2, 'not_modified': 1, 'bypassed': 0}
+    assert logged_in.get('/api/v1/cache').get_json()['pages']['hits'] == 2
+
+
+def test_changes_invalidate_only_their_course(app, db, logged_in, user_id):
+    math = add_course(app, db, user_id)
+    physics = add_course(app, db, user_id, 'PH1', 'Physics 1')
+    for url in ('/course/MA2/assignments', '/course/PH1', '/course/PH1/assignments'):
+        logged_in.get(url)
+    # through the session
+    with app.app_context():
+        db.session.add(Assignment(name='Homework 1', deadline=datetime(2021, 1, 10, 12), course_id=math))
+        db.session.commit()
+    response = logged_in.get('/course/MA2/assignments')
+    assert response.headers['X-Cache'] == 'MISS' and b'Homework 1' in response.data
+    assert logged_in.get('/course/PH1/assignments').headers['X-Cache'] == 'HIT'
+    # through the bulk api, which bypasses the session
+    logged_in.post('/api/v1/assignments', json={'course_id': physics, 'name': 'Lab report', 'deadline': '10-01-2021 12:00'})
+    response = logged_in.get('/course/PH1/assignments')
+    assert response.headers['X-Cache'] == 'MISS' and b'Lab report' in response.data
+    logged_in.patch('/api/v1/courses', json={'id': physics, 'name': 'Quantum Physics'})
+    assert b'Quantum Physics' in logged_in.get('/course/PH1').data
+    assert logged_in.get('/course/MA2/assignments').headers['X-Cache'] == 'HIT'
+
+
+def test_recreated_course_never_gets_an_old_page(app, db, logged_in, user_id):
+    course_id = add_course(app, db, user_id)
+    assert b'Mathematics 2' in logged_in.get('/course/MA2').data
+    logged_in.delete('/api/v1/courses', json={'ids': [course_id]})
+    logged_in.post('/api/v1/courses', json={'code': 'MA2', 'name': 'Mathematical Analysis'})
+    response = logged_in.get('/course/MA2')
+    assert response.headers['X-Cache'] == 'MISS' and b'Mathematical Analysis' in response.data
+
+
+def test_pages_with_flashed_messages_are_not_cached(app, db, logged_in, user_id):
+    add_course(app, db, user_id)
+    pages.reset_stats()
+    response = logged_in.post('/course/MA2/assignment/new', data={'name': 'Homework 1', 'deadline': '10-01-2021 12:00'},
+                              follow_redirects=True)
+    assert b'Your assignment has been created!' in response.data and 'X-Cache' not in response.headers
+    response = logged_in.get('/course/MA2/assignments')
+    assert response.headers['X-Cache'] == 'MISS' and b'Your assignment has been created!' not in response.data
+    assert pages.stats()['bypassed'] == 1
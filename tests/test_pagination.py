@@ -0,0 +1,60 @@
+import re
+from datetime import datetime, timedelta
+
+from webapp.models import Course, Assignment
+
+
+def seed_assignments(app, db, user_id, n):
+    with app.app_context():
+        course = Course(code='MA2', name='Mathematics 2', user_id=user_id)
+        db.session.add(course)
+        for i in range(n):
+            # a few assignments share a deadline, so the id has to break the ties
+            db.session.add(Assignment(name=f'assignment {i}', deadline=datetime(2021, 1, 1) + timedelta(days=i // 3), course=course))
+        db.session.commit()
+        return [a.name for a in Assignment.query.order_by(Assignment.deadline, Assignment.id)]
+
+
+def names(body):
+    return re.findall(r'>(assignment \d+)</a>', body)
+
+
+def link(body, label):
+    match = re.search(r'href="([^"]+)">[^<]*' + label, body)
+    return match.group(1).replace('&amp;', '&') if match else None
+
+
+def test_walk_pages_forward_and_back(app, logged_in, db, user_id):
+    expected = seed_assignments(app, db, user_id, 25)
+    url = '/assignments?limit=10'
+    pages = []
+    while url:
+        body = logged_in.get(url).get_data(as_text=True)
+        pages.append(names(body))
+        url = link(body, 'Next')
+    assert [len(page) for page in pages] == [10, 10, 5]
+    assert sum(pages, []) == expected
+
+    # and back again from the last page
+    back = []
+    url = link(body, 'Previous')
+    while url:
+        body = logged_in.get(url).get_data(as_text=True)
+        back.insert(0, names(body))
+        url = link(body, 'Previous')
+    assert back == pages[:-1]
+
+
+def test_course_assignments_page(app, logged_in, db, user_id):
+    expected = seed_assignments(app, db, user_id, 7)
+    body = logged_in.get('/course/MA2/assignments?limit=5').get_data(as_text=True)
+    assert names(body) == expected[:5]
+    body = logged_in.get(link(body, 'Next')).get_data(as_text=True)
+    assert names(body) == expected[5:]
+    assert link(body, 'Next') is None
+
+
+def test_bad_cursor_is_a_bad_request(app, logged_in, db, user_id):
+    seed_assignments(app, db, user_id, 3)
+    assert logged_in.get('/assignments?after=yesterday,1').status_code == 400
+    assert logged_in.get('/assignments?after=2021-01-01T00:00:00').status_code == 400
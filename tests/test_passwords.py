@@ -0,0 +1,68 @@
+import pytest
+
+from webapp import passwords
+from webapp.models import User
+from webapp.passwords import PasswordHasher, PasswordHashingBusy
+
+
+def register_and_login(client):
+    client.post('/register', data={'username': 'iulia', 'email': 'iulia@gmail.com',
+                                   'password': 'testing', 'confirm_password': 'testing'})
+    return client.post('/login', data={'email': 'iulia@gmail.com', 'password': 'testing'}, follow_redirects=True)
+
+
+def stored_hash(app):
+    with app.app_context():
+        return User.query.filter_by(email='iulia@gmail.com').one().password
+
+
+def test_register_and_login(app, client):
+    assert b'Welcome back, iulia!' in register_and_login(client).data
+    assert stored_hash(app).startswith('$2b$04$')
+
+
+def test_wrong_password(app, client):
+    register_and_login(client)
+    client.get('/logout')
+    response = client.post('/login', data={'email': 'iulia@gmail.com', 'password': 'wrong'})
+    assert b'Login Unsuccessful' in response.data
+
+
+def test_hash_is_replaced_when_the_cost_changes(app, client, monkeypatch):
+    register_and_login(client)
+    client.get('/logout')
+    monkeypatch.setattr(passwords, 'rounds', 5)
+    response = client.post('/login', data={'email': 'iulia@gmail.com', 'password': 'testing'}, follow_redirects=True)
+    assert b'Welcome back, iulia!' in response.data
+    assert stored_hash(app).startswith('$2b$05$')
+
+
+def test_full_queue_answers_503(app, client, monkeypatch):
+    register_and_login(client)
+    client.get('/logout')
+    busy = PasswordHasher(rounds=4, workers=1, queue=0)
+    busy._slots.acquire()  # the only slot is taken by another login
+    monkeypatch.setattr('webapp.routes.passwords', busy)
+    response = client.post('/login', data={'email': 'iulia@gmail.com', 'password': 'testing'})
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '1'
+
+
+def test_pool_hashes_in_worker_processes():
+    hasher = PasswordHasher(rounds=4, workers=1, queue=2)
+    try:
+        password_hash = hasher.hash('testing')
+        assert hasher.check(password_hash, 'testing')
+        assert not hasher.check(password_hash, 'wrong')
+        assert not hasher.check('not a hash', 'testing')
+    finally:
+        hasher.shutdown()
+
+
+@pytest.mark.parametrize('password_hash, rounds, expected', [
+    ('$2b$12$abcdefghijklmnopqrstuu', 12, False),
+    ('$2b$10$abcdefghijklmnopqrstuu', 12, True),
+    ('plain', 12, True),
+])
+def test_needs_rehash(password_hash, rounds, expected):
+    assert PasswordHasher(rounds=rounds).needs_rehash(password_hash) is expected
@@ -0,0 +1,152 @@
+from datetime import datetime, timedelta, date, time
+
+import pytest
+from sqlalchemy import event
+
+from webapp import page_cache
+from webapp.models import Course, Assignment, StudyTime, Resource
+
+
+class QueryCounter:
+    # counts the SQL statements sent to the database while it is active
+    def __init__(self, engine):
+        self.engine = engine
+        self.statements = []
+
+    def _count(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+    def __enter__(self):
+        event.listen(self.engine, 'before_cursor_execute', self._count)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, 'before_cursor_execute', self._count)
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+
+def seed(app, db, user_id, n_courses, prefix='C', n_children=3):
+    start = datetime(2021, 1, 1, 12, 0)
+    with app.app_context():
+        for c in range(n_courses):
+            course = Course(code=f'{prefix}{c}', name=f'Course {c}', user_id=user_id)
+            db.session.add(course)
+            for a in range(n_children):
+                db.session.add(Assignment(name=f'A{c}.{a}', deadline=start + timedelta(days=(a * 7 + c) % 30), course=course))
+                db.session.add(StudyTime(date=date(2021, 1, a + 1), start_time=time(10), end_time=time(11), course=course))
+                db.session.add(Resource(name=f'R{c}.{a}', course=course))
+        db.session.commit()
+
+
+def queries_for(app, client, db, url, cached=False):
+    # the statements of one request; the cached pages of the courses are dropped first (unless cached), so the view runs
+    if not cached:
+        page_cache.clear()
+    with app.app_context():
+        engine = db.engine
+    with QueryCounter(engine) as counter:
+        response = client.get(url)
+    assert response.status_code == 200
+    assert response.headers.get('X-Cache', 'MISS') == ('HIT' if cached else 'MISS')  # the pages without a cache have no header
+    return counter.count
+
+
+@pytest.mark.parametrize('url', [
+    '/courses',
+    '/assignments',
+    '/course/C0',
+    '/course/C0/assignments',
+    '/course/C0/studytimes',
+    '/course/C0/resources',
+])
+def test_dashboard_query_count_does_not_grow_with_data(app, logged_in, db, user_id, url):
+    seed(app, db, user_id, 2)
+    logged_in.get(url)  # the user is cached after the first request
+    small = queries_for(app, logged_in, db, url)
+    seed(app, db, user_id, 30, prefix='X')
+    large = queries_for(app, logged_in, db, url)
+    assert large == small  # an N+1 view would issue one more query per course
+    assert large <= 3  # the user, the page and at most one collection
+
+
+@pytest.mark.parametrize('url', ['/course/C0', '/course/C0/assignments', '/course/C0/studytimes', '/course/C0/resources'])
+def test_cached_course_pages(app, logged_in, db, user_id, url):
+    seed(app, db, user_id, 2)
+    logged_in.get('/home')  # the user is cached after the first request
+    miss = queries_for(app, logged_in, db, url)
+    hit = queries_for(app, logged_in, db, url, cached=True)
+    assert hit == 1 < miss  # only the course's version
+    seed(app, db, user_id, 30, prefix='X')  # other courses, this one's version doesn't change
+    assert queries_for(app, logged_in, db, url, cached=True) == 1
+
+
+def test_all_assignments_sorted_by_deadline(app, logged_in, db, user_id):
+    seed(app, db, user_id, 3)
+    body = logged_in.get('/assignments').get_data(as_text=True)
+    with app.app_context():
+        deadlines = [a.deadline for a in Assignment.query.order_by(Assignment.deadline, Assignment.id)]
+    positions = [body.index(f'deadline: {d}') for d in dict.fromkeys(deadlines)]
+    assert positions == sorted(positions)
+
+
+@pytest.fixture
+def other_user_id(app, db):
+    from webapp.models import User
+    with app.app_context():
+        user = User(username='mihaela', email='mihaela@gmail.com', password='not-a-real-hash')
+        db.session.add(user)
+        db.session.commit()
+        return user.id
+
+
+@pytest.mark.parametrize('path', ['', '/update', '/delete', '/complete', '/incomplete'])
+def test_assignment_lookup_is_one_query(app, logged_in, db, user_id, path):
+    seed(app, db, user_id, 1)
+    logged_in.get('/home')  # the user is cached after the first request
+    with app.app_context():
+        engine = db.engine
+        assignment_id = Assignment.query.first().id
+    method = logged_in.post if path == '/delete' else logged_in.get
+    with QueryCounter(engine) as counter:
+        response = method(f'/course/C0/assignment/{assignment_id}{path}')
+    assert response.status_code in (200, 302)
+    lookups = [statement for statement in counter.statements
+               if statement.startswith('SELECT') and ('FROM assignment' in statement or 'FROM course' in statement)]
+    assert len(lookups) == 1 and 'JOIN course' in lookups[0]  # the assignment joined with its course
+
+
+@pytest.mark.parametrize('url', [
+    '/course/O0', '/course/O0/update', '/course/O0/assignments', '/course/O0/studytimes',
+    '/course/O0/resources', '/course/O0/statistics', '/course/O0/assignment/{assignment}',
+    '/course/O0/assignment/{assignment}/complete', '/course/O0/studytime/{study_time}/update',
+    '/course/O0/resource/{resource}',
+    # the user's own course with another user's records in the url
+    '/course/C0/assignment/{assignment}', '/course/C0/studytime/{study_time}', '/course/C0/resource/{resource}/update',
+])
+def test_other_users_records_are_not_found(app, logged_in, db, user_id, other_user_id, url):
+    # the other user's course is O0, the user's own is C0 (the codes are only unique per user, the user has no O0)
+    seed(app, db, user_id, 1)
+    seed(app, db, other_user_id, 1, prefix='O')
+    with app.app_context():
+        other_course = Course.query.filter_by(user_id=other_user_id).one().id
+        assignment = Assignment.query.filter_by(course_id=other_course).first()
+        study_time = StudyTime.query.filter_by(course_id=other_course).first()
+        resource = Resource.query.filter_by(course_id=other_course).first()
+        url = url.format(assignment=assignment.id, study_time=study_time.id, resource=resource.id)
+    assert logged_in.get(url).status_code == 404
+    for path in ('/course/O0/delete', '/course/O0/assignment/{assignment}/delete', '/course/C0/resource/{resource}/delete'):
+        assert logged_in.post(path.format(assignment=assignment.id, resource=resource.id)).status_code == 404
+    with app.app_context():
+        assert db.session.get(Course, other_course) is not None
+        assert db.session.get(Assignment, assignment.id).completion_date is None
+        assert db.session.get(Resource, resource.id) is not None
+
+
+def test_same_code_for_two_users(app, logged_in, db, user_id, other_user_id):
+    seed(app, db, other_user_id, 1)
+    assert logged_in.get('/course/C0').status_code == 404
+    seed(app, db, user_id, 1)
+    assert logged_in.get('/course/C0/assignments').status_code == 200
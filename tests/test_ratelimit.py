@@ -0,0 +1,116 @@
+import pytest
+from sqlalchemy import event
+
+from webapp import metrics, passwords, rate_limiter
+from webapp.cache import MemoryBackend
+from webapp.models import User
+from webapp.ratelimit import RateLimiter
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(app, monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(rate_limiter, 'clock', clock)
+    return clock
+
+
+@pytest.fixture
+def account(app, db):
+    with app.app_context():
+        db.session.add(User(username='iulia', email='iulia@gmail.com', password=passwords.hash('secret')))
+        db.session.commit()
+
+
+def log_in(client, password, email='iulia@gmail.com', address='10.0.0.1'):
+    return client.post('/login', data={'email': email, 'password': password}, environ_base={'REMOTE_ADDR': address})
+
+
+def test_token_bucket():
+    clock = Clock()
+    limiter = RateLimiter(clock)
+    limiter.limits['ip'] = (3, 1 / 10)  # 3 at once, then one every 10 seconds
+    assert [limiter.take('ip', 'a') for _ in range(3)] == [0, 0, 0]
+    assert limiter.take('ip', 'a') == pytest.approx(10)
+    assert limiter.take('ip', 'b') == 0  # every address has its own
+    clock.now += 4
+    assert limiter.take('ip', 'a') == pytest.approx(6)
+    clock.now += 6
+    assert limiter.take('ip', 'a') == 0
+
+
+def test_shared_buckets():
+    clock = Clock()
+    limiters = [RateLimiter(clock), RateLimiter(clock)]  # like two worker processes
+    MemoryBackend().clear()
+    for limiter in limiters:
+        limiter.shared = MemoryBackend()
+        limiter.limits['email'] = (2, 1 / 60)
+    assert limiters[0].take('email', 'shared@gmail.com') == 0
+    assert limiters[1].take('email', 'shared@gmail.com') == 0
+    assert limiters[0].take('email', 'shared@gmail.com') > 0
+
+
+def test_logins_over_the_address_limit(app, db, client, account, clock):
+    metrics.reset()
+    burst = app.config['RATELIMIT_IP_BURST']
+    for i in range(burst):
+        assert log_in(client, 'wrong', email=f'user{i}@gmail.com').status_code == 200
+    with app.app_context():
+        engine = db.engine
+    statements = []
+    record = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(engine, 'before_cursor_execute', record)
+    try:
+        response = log_in(client, 'wrong', email='another@gmail.com')
+    finally:
+        event.remove(engine, 'before_cursor_execute', record)
+    assert response.status_code == 429
+    assert response.headers['Retry-After'] == str(60 // app.config['RATELIMIT_IP_PER_MINUTE'])
+    assert statements == []  # no query for the user (and no bcrypt)
+    assert log_in(client, 'wrong', email='another@gmail.com', address='10.0.0.2').status_code == 200  # another address
+    assert metrics.RATE_LIMIT_CHECKS.value('ip', 'limited') == 1
+    assert metrics.RATE_LIMIT_CHECKS.value('ip', 'allowed') == burst + 1
+    assert 'webapp_rate_limit_checks_total{bucket="ip",result="limited"} 1' in metrics.exposition()
+
+
+def test_backoff_after_failed_logins(app, client, account, clock):
+    for i in range(app.config['RATELIMIT_BACKOFF_AFTER']):
+        assert log_in(client, 'wrong', address=f'10.0.1.{i}').status_code == 200
+    # the account waits, even with the right password and from another address
+    response = log_in(client, 'secret', email=' Iulia@gmail.com', address='10.0.2.1')
+    assert response.status_code == 429
+    assert response.headers['Retry-After'] == str(app.config['RATELIMIT_BACKOFF_SECONDS'])
+    clock.now += app.config['RATELIMIT_BACKOFF_SECONDS']
+    assert log_in(client, 'wrong', address='10.0.2.2').status_code == 200
+    assert rate_limiter.backoff('iulia@gmail.com') == 2 * app.config['RATELIMIT_BACKOFF_SECONDS']  # twice as long
+    clock.now += 2 * app.config['RATELIMIT_BACKOFF_SECONDS']
+    assert log_in(client, 'secret', address='10.0.2.3').status_code == 302
+    assert rate_limiter.backoff('iulia@gmail.com') == 0  # a successful login starts over
+
+
+def test_registrations_are_limited_by_email(app, client, clock):
+    for i in range(app.config['RATELIMIT_EMAIL_BURST']):
+        client.post('/register', data={'username': f'x{i}', 'email': 'taken@gmail.com', 'password': 'secret',
+                                       'confirm_password': 'secret'}, environ_base={'REMOTE_ADDR': f'10.0.3.{i}'})
+    response = client.post('/register', data={'username': 'y', 'email': 'taken@gmail.com', 'password': 'secret',
+                                              'confirm_password': 'secret'}, environ_base={'REMOTE_ADDR': '10.0.3.99'})
+    assert response.status_code == 429
+
+
+def test_disabled(app, client, account, clock):
+    app.config['RATELIMIT_ENABLED'] = False
+    rate_limiter.init_app(app)
+    try:
+        for _ in range(app.config['RATELIMIT_EMAIL_BURST'] + 1):
+            assert log_in(client, 'wrong').status_code == 200
+    finally:
+        app.config['RATELIMIT_ENABLED'] = True
+        rate_limiter.init_app(app)
@@ -0,0 +1,117 @@
+import json
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import event
+
+from webapp.models import Course, Assignment
+from webapp.reminders import FileSink, JobQueue, ReminderScheduler, due_assignments
+
+NOW = datetime(2021, 1, 10, 12, 0)
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class FlakySink:
+    # fails the first `failures` sends of every reminder
+    def __init__(self, failures):
+        self.failures = failures
+        self.calls = {}
+        self.sent = []
+
+    def send(self, key, reminder):
+        self.calls[key] = self.calls.get(key, 0) + 1
+        if self.calls[key] <= self.failures:
+            raise ConnectionError('mail server down')
+        self.sent.append(key)
+
+
+@pytest.fixture
+def assignments(app, db, user_id):
+    with app.app_context():
+        course = Course(code='MA2', name='Mathematics 2', user_id=user_id)
+        db.session.add(course)
+        for hours in (-1, 2, 5, 30):  # one is past, one is beyond the 24 hours
+            db.session.add(Assignment(name=f'In {hours} hours', deadline=NOW + timedelta(hours=hours), course=course))
+        db.session.add(Assignment(name='Done', deadline=NOW + timedelta(hours=3), completion_date=NOW, course=course))
+        db.session.commit()
+
+
+def test_schedule_and_deliver(app, assignments, tmp_path):
+    sink = FileSink(tmp_path / 'reminders.jsonl')
+    scheduler = ReminderScheduler(JobQueue(str(tmp_path / 'queue.db')), sink, workers=2)
+    with app.app_context():
+        assert scheduler.schedule(NOW) == 2
+        assert scheduler.schedule(NOW) == 0  # the idempotency keys keep the queue from getting the same reminder twice
+        assert scheduler.deliver() == {'sent': 2, 'retried': 0, 'failed': 0, 'skipped': 0}
+        assert scheduler.deliver()['sent'] == 0
+    lines = [json.loads(line) for line in (tmp_path / 'reminders.jsonl').read_text().splitlines()]
+    assert sorted(line['assignment'] for line in lines) == ['In 2 hours', 'In 5 hours']
+    assert lines[0]['email'] == 'iulia@gmail.com'
+    assert lines[0]['key'].startswith('deadline:')
+
+
+def test_retries_with_backoff(app, assignments, tmp_path):
+    clock = Clock()
+    sink = FlakySink(failures=2)
+    scheduler = ReminderScheduler(JobQueue(str(tmp_path / 'queue.db'), clock), sink, max_attempts=3, retry_delay=10)
+    with app.app_context():
+        scheduler.schedule(NOW)
+        assert scheduler.deliver()['retried'] == 2
+        assert scheduler.deliver()['retried'] == 0  # not before the delay
+        clock.now += 10
+        assert scheduler.deliver()['retried'] == 2
+        clock.now += 10
+        assert scheduler.deliver()['sent'] == 0  # the second delay is twice as long
+        clock.now += 10
+        assert scheduler.deliver()['sent'] == 2
+    assert scheduler.queue.counts() == {'done': 2}
+
+    failing = ReminderScheduler(JobQueue(str(tmp_path / 'other.db'), clock), FlakySink(failures=10), max_attempts=1)
+    with app.app_context():
+        failing.schedule(NOW)
+        assert failing.deliver()['failed'] == 2
+    assert failing.queue.counts() == {'failed': 2}
+
+
+def test_completed_assignments_are_skipped(app, db, assignments, tmp_path):
+    scheduler = ReminderScheduler(JobQueue(str(tmp_path / 'queue.db')), FlakySink(failures=0))
+    with app.app_context():
+        scheduler.schedule(NOW)
+        Assignment.query.filter_by(name='In 2 hours').one().completion_date = NOW
+        db.session.commit()
+        assert scheduler.deliver() == {'sent': 1, 'retried': 0, 'failed': 0, 'skipped': 1}
+
+
+def test_expired_lease_is_claimed_again(tmp_path):
+    clock = Clock()
+    queue = JobQueue(str(tmp_path / 'queue.db'), clock)
+    queue.enqueue([('a', {}), ('b', {})])
+    assert [job.key for job in queue.claim(10, lease=60)] == ['a', 'b']
+    assert queue.claim(10) == []  # both are running
+    clock.now += 61  # the worker died
+    assert [(job.key, job.attempts) for job in queue.claim(10)] == [('a', 2), ('b', 2)]
+
+
+def test_due_assignments_use_the_partial_index(app, db, assignments):
+    with app.app_context():
+        engine = db.engine
+        statements = []
+        record = lambda conn, cursor, statement, parameters, *args: statements.append((statement, parameters))
+        event.listen(engine, 'before_cursor_execute', record)
+        try:
+            rows = list(due_assignments(NOW, NOW + timedelta(hours=24), batch_size=1))
+        finally:
+            event.remove(engine, 'before_cursor_execute', record)
+        assert [row.name for row in rows] == ['In 2 hours', 'In 5 hours']
+        assert len(statements) == 3  # keyset batches of one
+        if engine.dialect.name == 'sqlite':
+            with engine.connect() as connection:
+                plan = ' '.join(row[3] for row in connection.exec_driver_sql('EXPLAIN QUERY PLAN ' + statements[-1][0], statements[-1][1]))
+            assert 'ix_assignment_open_deadline' in plan, plan
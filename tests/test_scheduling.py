@@ -0,0 +1,80 @@
+from datetime import date, time
+
+from sqlalchemy import event
+
+from webapp.models import Course, StudyTime
+from webapp.scheduling import free_slots, overlapping
+
+
+def add_courses(app, db, user_id):
+    with app.app_context():
+        math = Course(code='MA2', name='Mathematics 2', user_id=user_id)
+        physics = Course(code='PH1', name='Physics 1', user_id=user_id)
+        db.session.add_all([math, physics])
+        db.session.add(StudyTime(date=date(2021, 1, 5), start_time=time(10), end_time=time(11, 30), course=math))
+        db.session.add(StudyTime(date=date(2021, 1, 5), start_time=time(14), end_time=time(15), course=physics))
+        db.session.commit()
+        return math.id, physics.id
+
+
+def test_end_after_start(logged_in, app, db, user_id):
+    math, physics = add_courses(app, db, user_id)
+    response = logged_in.post('/course/MA2/studytime/new', data={'date': '06-01-2021', 'start': '11:00', 'end': '10:00'})
+    assert b'The study time has to end after it starts.' in response.data
+
+
+def test_overlap_with_another_course(logged_in, app, db, user_id):
+    math, physics = add_courses(app, db, user_id)
+    response = logged_in.post('/course/MA2/studytime/new', data={'date': '05-01-2021', 'start': '14:30', 'end': '16:00'})
+    assert response.status_code == 200
+    assert b'Overlaps with Physics 1 (14:00-15:00).' in response.data
+    # touching is fine
+    response = logged_in.post('/course/MA2/studytime/new', data={'date': '05-01-2021', 'start': '15:00', 'end': '16:00'})
+    assert response.status_code == 302
+    # a study time doesn't overlap its old self
+    response = logged_in.post('/course/MA2/studytime/1/update', data={'date': '05-01-2021', 'start': '10:30', 'end': '12:00'})
+    assert response.status_code == 302
+
+
+def test_overlap_check_reads_the_index_only(app, db, user_id):
+    math, physics = add_courses(app, db, user_id)
+    with app.app_context():
+        engine = db.engine
+        if engine.dialect.name != 'sqlite':
+            return
+        statements = []
+        record = lambda conn, cursor, statement, parameters, *args: statements.append((statement, parameters))
+        event.listen(engine, 'before_cursor_execute', record)
+        try:
+            assert [row.course_id for row in overlapping(user_id, date(2021, 1, 5), time(11), time(14, 30))] == [math, physics]
+        finally:
+            event.remove(engine, 'before_cursor_execute', record)
+        statement, parameters = statements[-1]
+        with engine.connect() as connection:
+            plan = ' '.join(row[3] for row in connection.exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, parameters))
+        assert 'COVERING INDEX ix_study_time_course_id_archived_interval' in plan, plan
+
+
+def test_bulk_api_rejects_overlaps(logged_in, app, db, user_id):
+    math, physics = add_courses(app, db, user_id)
+    response = logged_in.post('/api/v1/studytimes', json=[
+        {'course_id': math, 'date': '2021-01-05', 'start': '11:00', 'end': '12:00'},   # overlaps the 10:00-11:30
+        {'course_id': math, 'date': '2021-01-06', 'start': '11:00', 'end': '12:00'},
+        {'course_id': physics, 'date': '2021-01-06', 'start': '11:30', 'end': '12:30'},  # overlaps the one before
+    ])
+    assert response.status_code == 207
+    body = response.get_json()
+    assert [item['index'] for item in body['done']] == [1]
+    assert [item['index'] for item in body['errors']] == [0, 2]
+    assert body['errors'][0]['errors'] == {'start': ['Overlaps with Mathematics 2 (10:00-11:30).']}
+
+
+def test_free_slots(logged_in, app, db, user_id):
+    add_courses(app, db, user_id)
+    with app.app_context():
+        assert free_slots(user_id, date(2021, 1, 5), date(2021, 1, 6), time(9), time(18)) == [
+            (date(2021, 1, 5), time(9), time(10)), (date(2021, 1, 5), time(11, 30), time(14)),
+            (date(2021, 1, 5), time(15), time(18)), (date(2021, 1, 6), time(9), time(18))]
+    response = logged_in.get('/api/v1/freeslots?from=2021-01-05&to=2021-01-05&day_start=10:00&day_end=15:30&min_minutes=60')
+    assert response.get_json()['items'] == [{'date': '2021-01-05', 'start_time': '11:30:00', 'end_time': '14:00:00'}]
+    assert logged_in.get('/api/v1/freeslots?from=2021-01-05').status_code == 400
@@ -0,0 +1,153 @@
+import sqlite3
+from datetime import datetime, date, time
+
+import pytest
+from sqlalchemy import create_engine, event, inspect
+
+from webapp.migrations import upgrade, current_version, latest_version
+from webapp.models import Course, Assignment, StudyTime, Resource
+
+# the schema site.db had before the migrations existed
+OLD_SCHEMA = '''
+CREATE TABLE user (id INTEGER NOT NULL, username VARCHAR(20) NOT NULL, email VARCHAR(120) NOT NULL, password VARCHAR(60) NOT NULL,
+    PRIMARY KEY (id), UNIQUE (username), UNIQUE (email));
+CREATE TABLE course (id VARCHAR(60) NOT NULL, name VARCHAR(255) NOT NULL, user_id INTEGER,
+    PRIMARY KEY (id), FOREIGN KEY(user_id) REFERENCES user (id));
+CREATE TABLE assignment (id INTEGER NOT NULL, name VARCHAR(255) NOT NULL, deadline DATETIME NOT NULL, completion_date DATETIME, course_id INTEGER NOT NULL,
+    PRIMARY KEY (id), FOREIGN KEY(course_id) REFERENCES course (id));
+CREATE TABLE study_time (id INTEGER NOT NULL, date DATE NOT NULL, start_time TIME NOT NULL, end_time TIME NOT NULL, course_id INTEGER NOT NULL,
+    PRIMARY KEY (id), FOREIGN KEY(course_id) REFERENCES course (id));
+CREATE TABLE resource (id INTEGER NOT NULL, name VARCHAR NOT NULL, course_id INTEGER NOT NULL, assignment_id INTEGER,
+    PRIMARY KEY (id), FOREIGN KEY(course_id) REFERENCES course (id), FOREIGN KEY(assignment_id) REFERENCES assignment (id));
+INSERT INTO user VALUES (1, 'iulia', 'iulia@gmail.com', 'hash');
+INSERT INTO course VALUES ('MA2_1', 'Mathematics 2', 1);
+INSERT INTO assignment VALUES (1, 'Homework 1', '2021-01-10 12:00:00.000000', NULL, 'MA2_1');
+INSERT INTO study_time VALUES (1, '2021-01-05', '10:00:00.000000', '11:30:00.000000', 'MA2_1');
+INSERT INTO resource VALUES (1, 'Slides', 'MA2_1', 1);
+INSERT INTO assignment VALUES (3, 'Left behind', '2021-01-10 12:00:00.000000', NULL, 'OLD_1');
+INSERT INTO study_time VALUES (2, '2021-01-06', '10:00:00.000000', '11:00:00.000000', 'OLD_1');
+INSERT INTO resource VALUES (2, 'Left behind', 'OLD_1', 3);
+'''
+# the last three belong to a course that was deleted (delete_course used to leave its records behind)
+
+
+def test_upgrade_existing_database_in_place(tmp_path, caplog):
+    path = tmp_path / 'site.db'
+    with sqlite3.connect(path) as connection:
+        connection.executescript(OLD_SCHEMA)
+    engine = create_engine(f'sqlite:///{path}')
+
+    assert upgrade(engine) == [version for version in range(1, latest_version() + 1)]
+    # the records of the deleted course are deleted and logged, not dropped silently
+    assert 'Deleted the rows of courses that no longer exist: 1 from assignment, 1 from study_time, 1 from resource' in caplog.text
+    assert upgrade(engine) == []  # running it again does nothing
+
+    inspector = inspect(engine)
+    for table in ('assignment', 'study_time', 'resource', 'study_day'):
+        course_id = next(column for column in inspector.get_columns(table) if column['name'] == 'course_id')
+        assert str(course_id['type']) == 'INTEGER'
+    for table in ('course', 'assignment', 'study_time', 'resource'):
+        assert '_sentinel' in {column['name'] for column in inspector.get_columns(table)}
+    indexes = {index['name'] for table in inspector.get_table_names() for index in inspector.get_indexes(table)}
+    assert {'ix_course_user_id_archived_id', 'ix_assignment_course_id_archived_deadline', 'ix_assignment_deadline',
+            'ix_assignment_open_deadline', 'ix_study_time_course_id_archived_interval', 'ix_resource_course_id_archived_id',
+            'ix_resource_assignment_id', 'ix_resource_blob_sha256', 'ix_study_day_user_id_date', 'ix_search_document_course_id'} <= indexes
+    with engine.connect() as connection:
+        assert current_version(connection) == latest_version()
+        # the course got an integer id, and its code back without the _<user id>
+        assert connection.exec_driver_sql('SELECT id, code, name, user_id FROM course').all() == [(1, 'MA2', 'Mathematics 2', 1)]
+        assert connection.exec_driver_sql('SELECT course_id, name FROM assignment').all() == [(1, 'Homework 1')]
+        assert connection.exec_driver_sql('SELECT course_id, assignment_id FROM resource').all() == [(1, 1)]
+        assert connection.exec_driver_sql('SELECT count(*) FROM study_time WHERE course_id = 1').scalar() == 1
+        assert [connection.exec_driver_sql(f'SELECT count(*) FROM {table}').scalar() for table in ('assignment', 'study_time', 'resource')] == [1, 1, 1]
+        # the statistics' rollup is filled from the existing study times
+        assert connection.exec_driver_sql('SELECT course_id, date, user_id, seconds, sessions FROM study_day').all() == [
+            (1, '2021-01-05', 1, 5400, 1)]
+        # and the search index from the existing records
+        assert connection.exec_driver_sql("SELECT d.kind, d.record_id, d.course_id FROM search_index "
+                                          "JOIN search_document d ON d.id = search_index.rowid "
+                                          "WHERE search_index MATCH '\"u1x\"*' ORDER BY d.id").all() == [
+            ('course', 1, 1), ('assignment', 1, 1), ('resource', 1, 1)]
+
+
+def test_course_codes_of_the_migration(tmp_path):
+    # a code is only stripped of its _<user id> when that doesn't collide with another course of the user
+    path = tmp_path / 'site.db'
+    with sqlite3.connect(path) as connection:
+        connection.executescript(OLD_SCHEMA + '''
+            INSERT INTO user VALUES (2, 'ana', 'ana@gmail.com', 'hash');
+            INSERT INTO course VALUES ('MA2_2', 'Mathematics 2', 2);
+            INSERT INTO course VALUES ('MA2', 'Mathematics 2 (typed by hand)', 2);
+            INSERT INTO course VALUES ('PH1', 'Physics 1', 1);
+            INSERT INTO assignment VALUES (2, 'Homework 2', '2021-01-11 12:00:00.000000', NULL, 'MA2_2');
+        ''')
+    engine = create_engine(f'sqlite:///{path}')
+    upgrade(engine)
+    with engine.connect() as connection:
+        assert connection.exec_driver_sql('SELECT user_id, code, name FROM course ORDER BY user_id, code').all() == [
+            (1, 'MA2', 'Mathematics 2'), (1, 'PH1', 'Physics 1'),
+            (2, 'MA2', 'Mathematics 2 (typed by hand)'), (2, 'MA2_2', 'Mathematics 2')]
+        assert connection.exec_driver_sql('SELECT c.code FROM assignment a JOIN course c ON c.id = a.course_id '
+                                          'WHERE a.id = 2').scalar() == 'MA2_2'
+
+
+def test_new_database_is_created_at_latest_version(tmp_path):
+    engine = create_engine(f'sqlite:///{tmp_path / "new.db"}')
+    assert upgrade(engine) == []
+    with engine.connect() as connection:
+        assert current_version(connection) == latest_version()
+    assert 'assignment' in inspect(engine).get_table_names()
+
+
+@pytest.fixture
+def course_data(app, db, user_id):
+    with app.app_context():
+        course = Course(code='MA2', name='Mathematics 2', user_id=user_id)
+        db.session.add(course)
+        for i in range(20):
+            db.session.add(Assignment(name=f'A{i}', deadline=datetime(2021, 1, 1 + i), course=course))
+            db.session.add(StudyTime(date=date(2021, 1, 1 + i), start_time=time(10), end_time=time(11), course=course))
+            db.session.add(Resource(name=f'R{i}', course=course))
+        db.session.commit()
+        return course.code
+
+
+@pytest.mark.parametrize('url', [
+    '/courses',
+    '/assignments',
+    '/assignments?after=2021-01-05T00:00:00,4',
+    '/course/{code}',
+    '/course/{code}/assignments',
+    '/course/{code}/assignments?after=2021-01-05T00:00:00,4',
+    '/course/{code}/studytimes',
+    '/course/{code}/resources',
+    '/course/{code}/assignment/3',
+    '/course/{code}/studytime/3',
+    '/course/{code}/resource/3',
+    '/statistics?from=2021-01-01&to=2021-01-31',
+    '/course/{code}/statistics?from=2021-01-01&to=2021-01-31',
+])
+def test_route_queries_use_an_index(app, db, logged_in, course_data, url):
+    # every SELECT a route sends has to find its rows through an index: a "SCAN <table>" step is a full table scan
+    with app.app_context():
+        engine = db.engine
+    if engine.dialect.name != 'sqlite':
+        pytest.skip('EXPLAIN QUERY PLAN is SQLite syntax')
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith('SELECT'):
+            statements.append((statement, parameters))
+
+    event.listen(engine, 'before_cursor_execute', record)
+    try:
+        assert logged_in.get(url.format(code=course_data)).status_code == 200
+    finally:
+        event.remove(engine, 'before_cursor_execute', record)
+
+    assert statements
+    with engine.connect() as connection:
+        for statement, parameters in statements:
+            plan = [row[3] for row in connection.exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, parameters)]
+            # (scanning the result of a subquery is fine, only the tables must not be scanned)
+            assert not [step for step in plan if step.startswith('SCAN') and not step.startswith(('SCAN anon_', 'SCAN (subquery'))], (statement, plan)
@@ -0,0 +1,69 @@
+from datetime import datetime
+
+from webapp.models import User, Course, Assignment, Resource
+from webapp.search import search, reindex_all
+
+
+def add_records(app, db, user_id):
+    with app.app_context():
+        other = User(username='maria', email='maria@gmail.com', password='not-a-real-hash')
+        db.session.add(other)
+        db.session.flush()
+        math = Course(code='MA2', name='Mathematical Analysis', user_id=user_id)
+        algebra = Course(code='AL1', name='Linear Algebra', user_id=user_id)
+        db.session.add_all([math, algebra, Course(code='MA2', name='Mathematical Analysis', user_id=other.id)])
+        db.session.add(Assignment(name='Analysis homework 1', deadline=datetime(2021, 1, 10), course=math))
+        db.session.add(Resource(name='Lecture notes on matrices', course=algebra))
+        db.session.commit()
+        return math.id, algebra.id
+
+
+def test_prefix_matching_ranking_and_scope(app, db, user_id):
+    math, algebra = add_records(app, db, user_id)
+    with app.app_context():
+        assert [(r['kind'], r['id'], r['code'], r['name']) for r in search(user_id, 'mat')] == [
+            ('course', math, 'MA2', 'Mathematical Analysis'), ('resource', 1, 'AL1', 'Lecture notes on matrices')]  # not the other user's course
+        assert [r['name'] for r in search(user_id, 'anal')] == ['Mathematical Analysis', 'Analysis homework 1']
+        assert [r['name'] for r in search(user_id, 'mat an')] == ['Mathematical Analysis']  # every word has to match
+        assert [r['name'] for r in search(user_id, 'anal', kinds=['assignment'])] == ['Analysis homework 1']
+        assert search(user_id, '"*) OR (') == []  # no query syntax gets through
+        assert [r['name'] for r in search(user_id, 'LINEAR-algèbra')] == ['Linear Algebra']  # case, accents and punctuation
+
+
+def test_index_follows_the_models(app, db, user_id):
+    math, algebra = add_records(app, db, user_id)
+    with app.app_context():
+        course = db.session.get(Course, algebra)
+        course.name = 'Geometry'
+        db.session.commit()
+        assert [r['name'] for r in search(user_id, 'geo')] == ['Geometry']
+        assert search(user_id, 'linear') == []
+        db.session.delete(Resource.query.one())
+        db.session.commit()
+        assert search(user_id, 'matrices') == []
+
+
+def test_bulk_api_and_reindex(app, db, logged_in, user_id):
+    physics = logged_in.post('/api/v1/courses', json={'code': 'PH1', 'name': 'Physics'}).get_json()['done'][0]['id']
+    logged_in.post('/api/v1/assignments', json=[{'course_id': physics, 'name': f'Lab report {i}', 'deadline': '2021-01-10T12:00'}
+                                                 for i in range(3)])
+    logged_in.patch('/api/v1/assignments', json=[{'id': 1, 'name': 'Optics lab'}])
+    response = logged_in.get('/api/v1/search?q=lab&kind=assignment')
+    assert [item['name'] for item in response.get_json()['items']] == ['Optics lab', 'Lab report 1', 'Lab report 2']
+    assert response.get_json()['items'][0]['url'] == '/course/PH1/assignment/1'
+    logged_in.delete('/api/v1/assignments', json={'ids': [2]})
+    assert len(logged_in.get('/api/v1/search?q=lab').get_json()['items']) == 2
+    with app.app_context():
+        reindex_all(db.session)
+        db.session.commit()
+        assert len(search(user_id, 'lab')) == 2
+    logged_in.delete('/api/v1/courses', json={'ids': [physics]})
+    assert logged_in.get('/api/v1/search?q=lab').get_json()['items'] == []
+
+
+def test_search_page(app, db, logged_in, user_id):
+    add_records(app, db, user_id)
+    response = logged_in.get('/search?q=notes')
+    assert response.status_code == 200
+    assert b'Lecture notes on matrices' in response.data
+    assert b'Nothing found' in logged_in.get('/search?q=zzz').data
@@ -0,0 +1,27 @@
+from webapp import create_app
+from webapp.config import Config
+from webapp.templating import compile_templates
+
+
+def make_config(cache_dir):
+    return type('TestConfig', (Config,), {'SQLALCHEMY_DATABASE_URI': 'sqlite://', 'TEMPLATE_CACHE_DIR': cache_dir})
+
+
+def test_a_new_app_loads_the_compiled_templates(tmp_path):
+    names = compile_templates(create_app(make_config(str(tmp_path))))  # what `flask templates compile` does
+    assert {'layout.html', 'login.html', '_pagination.html'} <= set(names)
+    assert len(list(tmp_path.iterdir())) == len(names)
+
+    # like a worker process started after the build: nothing is compiled again
+    app = create_app(make_config(str(tmp_path)))
+    compiled = []
+    original = app.jinja_env.compile
+    app.jinja_env.compile = lambda *args, **kwargs: compiled.append(args) or original(*args, **kwargs)
+    for name in names:
+        app.jinja_env.get_template(name)
+    assert compiled == []
+
+
+def test_no_cache_dir_no_cache():
+    app = create_app(make_config(''))
+    assert app.jinja_env.bytecode_cache is None
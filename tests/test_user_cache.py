@@ -0,0 +1,70 @@
+from sqlalchemy import event
+
+from webapp import user_cache
+from webapp.cache import Cache, LRUCache, MemoryBackend
+
+
+def user_queries(app, db, client, url):
+    with app.app_context():
+        engine = db.engine
+    statements = []
+    record = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(engine, 'before_cursor_execute', record)
+    try:
+        response = client.get(url)
+    finally:
+        event.remove(engine, 'before_cursor_execute', record)
+    return response, [s for s in statements if 'FROM user' in s]
+
+
+def test_logged_in_requests_skip_the_user_query(app, db, logged_in, user_id):
+    response, queries = user_queries(app, db, logged_in, '/home')
+    assert b'Welcome back, iulia!' in response.data
+    assert len(queries) == 1  # the first request loads the user
+    response, queries = user_queries(app, db, logged_in, '/home')
+    assert b'Welcome back, iulia!' in response.data
+    assert queries == []  # the next ones rebuild it from the cache
+
+
+def test_account_update_invalidates_the_cache(app, db, logged_in, user_id):
+    logged_in.get('/home')
+    assert user_cache.get(str(user_id))['username'] == 'iulia'
+    response = logged_in.post('/account', data={'username': 'maria', 'email': 'maria@gmail.com'}, follow_redirects=True)
+    assert b'Your account has been updated!' in response.data
+    assert b'Welcome back, maria!' in logged_in.get('/home').data
+    assert user_cache.get(str(user_id))['email'] == 'maria@gmail.com'
+
+
+def test_cached_user_loads_other_columns_on_demand(app, db, logged_in, user_id):
+    from webapp.models import load_user
+    logged_in.get('/home')
+    with app.app_context():
+        user = load_user(str(user_id))
+        assert user.password == 'not-a-real-hash'
+
+
+def test_lru_entries_expire_and_get_evicted():
+    now = [0]
+    cache = LRUCache(maxsize=2, ttl=10, clock=lambda: now[0])
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.get('a')
+    cache.set('c', 3)  # 'b' is the least recently used one
+    assert cache.get('b') is None
+    assert cache.get('a') == 1
+    now[0] = 11
+    assert cache.get('a') is None
+    assert (cache.hits, cache.misses) == (2, 2)
+
+
+def test_shared_backend_is_seen_by_every_process():
+    backend = 'webapp.cache.MemoryBackend'
+    first, second = Cache('TEST'), Cache('TEST')  # as if they were in two worker processes
+    for cache in (first, second):
+        cache.init_app(type('App', (), {'config': {'TEST_CACHE_BACKEND': backend, 'TEST_CACHE_TTL': 60}})())
+    first.set('1', {'username': 'iulia'})
+    assert second.get('1') == {'username': 'iulia'}
+    second.delete('1')
+    first.local.clear()
+    assert first.get('1') is None
+    MemoryBackend().clear()
@@ -1,30 +1,63 @@
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
-from flask_bcrypt import Bcrypt
 from flask_login import LoginManager
 from webapp.config import Config
+from webapp.cache import Cache
+from webapp.passwords import PasswordHasher
+from webapp.ratelimit import RateLimiter
+from webapp.database import engine_options, configure_engine
 
 
-app = Flask(__name__)  # create Flask application
-app.config['SECRET_KEY']='7ef4aa839f699e98af3648ae74d32187'  # the number is from: import secrets; secrets.token_hex(16)
-# load the configuration and then create the SQLAlchemy object by passing it the application.
 # db provides a class called Model that is a declarative base which can be used to declare models
-app.config['SQLALCHEMY_DATABASE_URI']='sqlite:///site.db'
-db=SQLAlchemy(app)
+db=SQLAlchemy()
 
 # bcrypt is a hashing function for password,
 # it incorporates salt(additional input of random data that helps safeguard passwords when stored)
 # for protecting the application against any attacks
-bcrypt=Bcrypt(app)  # instantiate bcrypt object
+# the hashing runs on a bounded pool of worker processes (see passwords.py)
+passwords=PasswordHasher()
 
 #LoginManager provides user session management,
 # it handles the common tasks of logging in, logging out, and remembering your users’ sessions over extended periods of time
-login_manager=LoginManager(app)   # instantiate LoginManager object
+login_manager=LoginManager()   # instantiate LoginManager object
 # when a user attempts to access a login_required view without being logged in, Flask-Login will flash a message and redirect them to the log in view
-# here we set it up to 'login'
-login_manager.login_view='login'
+# here we set it up to 'main.login' (the login view of the main blueprint, see routes.py)
+login_manager.login_view='main.login'
 login_manager.login_message_category='info'  # customize login message category (for bootstrap)
 
-from webapp import routes
+# the logins and registrations of an address or an account over their limits get a 429 before any query or bcrypt (see ratelimit.py)
+rate_limiter=RateLimiter()
 
+# the identity (id, username, email) of the logged in users, so that a request doesn't have to query the user table
+user_cache=Cache('USER')
+# the rendered course pages, keyed by the course's data version (see pages.py)
+page_cache=Cache('PAGE')
 
+
+def create_app(config_class=Config):
+    # the views, the api and the commands are imported here and not with the package: `import webapp` (the models, the
+    # scripts) only makes the extensions, and every app made by the factory gets its blueprints registered on it
+    from webapp import routes, api, export, metrics, assets, templating, migrations, reminders, search, importer, files
+    from webapp import versioning, analytics  # (they only hook the session's events)
+    app = Flask(__name__)  # create Flask application
+    # load the configuration (the database url, the pool and the SQLite settings come from Config, see config.py)
+    app.config.from_object(config_class)
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config)
+    # bind the extensions to the application
+    db.init_app(app)
+    passwords.init_app(app)
+    login_manager.init_app(app)
+    rate_limiter.init_app(app)
+    user_cache.init_app(app)
+    page_cache.init_app(app)
+    templating.init_app(app)  # the compiled templates are kept on disk (see templating.py)
+    files.init_app(app)  # the uploads are written to the file storage (see files.py)
+    with app.app_context():
+        for engine in db.engines.values():
+            configure_engine(engine, app.config)
+    for blueprint in (routes.main, api.api, export.export, metrics.instrumentation, assets.assets):
+        app.register_blueprint(blueprint)
+    for command in (migrations.db_cli, reminders.reminders_cli, search.search_cli, importer.import_cli, assets.assets_cli,
+                    templating.templates_cli, files.files_cli):
+        app.cli.add_command(command)
+    return app
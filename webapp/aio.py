@@ -0,0 +1,75 @@
+import asyncio
+import weakref
+
+from flask import current_app
+from sqlalchemy import false, select
+from sqlalchemy.engine import make_url
+
+from webapp.database import configure_engine, engine_options
+from webapp.models import Course, Assignment, StudyTime, Resource
+from webapp.pagination import page, page_query
+from webapp.queries import COURSE_KEY, ASSIGNMENT_KEY, STUDY_TIME_KEY, RESOURCE_KEY
+
+# async database access for the read-only api lists (ASYNC_VIEWS, by default behind webapp.asgi with PostgreSQL)
+# the views await their queries on an AsyncEngine (aiosqlite for SQLite, asyncpg or psycopg's own async mode for
+# PostgreSQL) instead of holding a pooled connection in a blocking call; everything else keeps using db.session
+# needs the extra packages of the ASGI mode: pip install "flask[async]" uvicorn greenlet aiosqlite (or asyncpg)
+# an AsyncEngine and its pool belong to an event loop: under webapp.asgi every request's coroutines run on the server's
+# loop, so there is one engine per process; anywhere else (tests, the dev server) asgiref runs every async view on a
+# loop of its own, which gets a throwaway engine without a pool
+
+ASYNC_DRIVERS = {'sqlite': 'aiosqlite', 'postgresql': 'asyncpg'}
+SORT_KEYS = {Course: COURSE_KEY, Assignment: ASSIGNMENT_KEY, StudyTime: STUDY_TIME_KEY, Resource: RESOURCE_KEY}
+
+_engines = weakref.WeakKeyDictionary()  # event loop -> AsyncEngine
+
+
+def async_url(config):
+    # ASYNC_DATABASE_URI, or SQLALCHEMY_DATABASE_URI with the async driver of its database
+    url = make_url(config.get('ASYNC_DATABASE_URI') or config['SQLALCHEMY_DATABASE_URI'])
+    if url.drivername.partition('+')[2] in ('aiosqlite', 'asyncpg', 'psycopg', 'psycopg_async'):
+        return url  # psycopg 3 is async itself
+    return url.set(drivername=f'{url.get_backend_name()}+{ASYNC_DRIVERS[url.get_backend_name()]}')
+
+
+def async_engine():
+    from sqlalchemy.ext.asyncio import create_async_engine
+    from sqlalchemy.pool import NullPool
+    config = current_app.config
+    loop = asyncio.get_running_loop()
+    engine = _engines.get(loop)
+    if engine is None:
+        options = engine_options(dict(config, SQLALCHEMY_DATABASE_URI=str(async_url(config))))
+        if not config.get('ASYNC_SHARED_LOOP'):
+            options = {'poolclass': NullPool}  # the loop goes away with the request
+        engine = _engines[loop] = create_async_engine(async_url(config), **options)
+        configure_engine(engine.sync_engine, config)
+    return engine
+
+
+def session():
+    # async with aio.session() as session: ...
+    from sqlalchemy.ext.asyncio import AsyncSession
+    return AsyncSession(async_engine(), expire_on_commit=False)
+
+
+def user_records(model, user_id):
+    # like the lists in queries.py, without the archived records
+    if model is Course:
+        return select(Course).where(Course.user_id == user_id, Course.archived == false())
+    return select(model).join(Course, Course.id == model.course_id).where(Course.user_id == user_id, model.archived == false())
+
+
+def course_records(model, course_id):
+    return select(model).where(model.course_id == course_id, model.archived == false())
+
+
+async def owns_course(session, user_id, course_id):
+    return await session.scalar(select(Course.id).where(Course.id == course_id, Course.user_id == user_id)) is not None
+
+
+async def fetch_page(session, statement, model, page_request):
+    # paginate() for a select() of a model, awaited
+    key = SORT_KEYS[model]
+    rows = (await session.scalars(page_query(statement, key, page_request))).all()
+    return page(rows, key, page_request)
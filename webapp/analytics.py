@@ -0,0 +1,244 @@
+from datetime import date, timedelta
+
+from sqlalchemy import Date, Integer, and_, case, delete, event, func, inspect, insert, literal, select, tuple_
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.orm import Session
+from sqlalchemy.sql.functions import FunctionElement
+
+from webapp import db
+from webapp.models import Course, Assignment, StudyTime, StudyDay
+
+# study statistics: hours studied per day, week and course, streaks of days in a row, and the time studied before deadlines
+# everything is added up by the database from the study_day rollup (one row per course and day, see models.StudyDay),
+# so a statistics page reads O(days) rows whatever the number of study times
+# the rollup rows of the days a flush touched are recomputed from study_time in the same transaction (the after_flush
+# listener below, like versioning.py); the bulk statements that bypass the session call refresh_study_days themselves
+
+REFRESH_BATCH = 500  # (course, day) pairs per statement, well below SQLite's limit on bound parameters
+
+
+### dialect specific SQL ###
+
+class seconds_between(FunctionElement):
+    # end - start in seconds, for two TIME values
+    type = Integer()
+    inherit_cache = True
+
+
+@compiles(seconds_between)
+def _seconds_between(element, compiler, **kw):
+    start, end = list(element.clauses)
+    return f'CAST(EXTRACT(EPOCH FROM ({compiler.process(end, **kw)} - {compiler.process(start, **kw)})) AS INTEGER)'
+
+
+@compiles(seconds_between, 'sqlite')
+def _seconds_between_sqlite(element, compiler, **kw):
+    # SQLite keeps times as text, julianday reads them as a time on 2000-01-01
+    start, end = list(element.clauses)
+    return f'CAST(round((julianday({compiler.process(end, **kw)}) - julianday({compiler.process(start, **kw)})) * 86400) AS INTEGER)'
+
+
+class week_start(FunctionElement):
+    # the monday of the week of a date
+    type = Date()
+    inherit_cache = True
+
+
+@compiles(week_start)
+def _week_start(element, compiler, **kw):
+    return f"CAST(date_trunc('week', {compiler.process(element.clauses, **kw)}) AS DATE)"
+
+
+@compiles(week_start, 'sqlite')
+def _week_start_sqlite(element, compiler, **kw):
+    # the next sunday (the day itself if it is one), then 6 days back
+    return f"date({compiler.process(element.clauses, **kw)}, 'weekday 0', '-6 days')"
+
+
+class day_number(FunctionElement):
+    # a date as a number of days, so that consecutive days have consecutive numbers
+    type = Integer()
+    inherit_cache = True
+
+
+@compiles(day_number)
+def _day_number(element, compiler, **kw):
+    return f"(CAST({compiler.process(element.clauses, **kw)} AS DATE) - DATE '2000-01-01')"
+
+
+@compiles(day_number, 'sqlite')
+def _day_number_sqlite(element, compiler, **kw):
+    return f'CAST(julianday(date({compiler.process(element.clauses, **kw)})) AS INTEGER)'
+
+
+class add_days(FunctionElement):
+    # the date of a date or datetime, plus a number of days (add_days(Assignment.deadline, -7))
+    type = Date()
+    inherit_cache = True
+
+
+@compiles(add_days)
+def _add_days(element, compiler, **kw):
+    value, days = list(element.clauses)
+    return f'(CAST({compiler.process(value, **kw)} AS DATE) + {compiler.process(days, **kw)})'
+
+
+@compiles(add_days, 'sqlite')
+def _add_days_sqlite(element, compiler, **kw):
+    value, days = list(element.clauses)
+    return f"date({compiler.process(value, **kw)}, printf('%+d days', {compiler.process(days, **kw)}))"
+
+
+# the length of a study time; one that doesn't end after it starts counts as nothing
+STUDY_SECONDS = case((StudyTime.end_time > StudyTime.start_time, seconds_between(StudyTime.start_time, StudyTime.end_time)), else_=0)
+
+
+### the rollup ###
+
+def refresh_study_days(connection, days):
+    # recompute the study_day rows of the given (course id, date) pairs from study_time, in the current transaction
+    # connection: a Connection or a Session
+    days = sorted({(course_id, day) for course_id, day in days if course_id is not None and day is not None})
+    for i in range(0, len(days), REFRESH_BATCH):
+        batch = days[i:i + REFRESH_BATCH]
+        connection.execute(delete(StudyDay).where(tuple_(StudyDay.course_id, StudyDay.date).in_(batch)))
+        connection.execute(insert(StudyDay).from_select(
+            ['course_id', 'date', 'user_id', 'seconds', 'sessions'],
+            select(StudyTime.course_id, StudyTime.date, Course.user_id, func.sum(STUDY_SECONDS), func.count())
+            .join(Course, Course.id == StudyTime.course_id)
+            .where(tuple_(StudyTime.course_id, StudyTime.date).in_(batch), Course.user_id.isnot(None))
+            .group_by(StudyTime.course_id, StudyTime.date, Course.user_id)))
+
+
+def forget_study_days(connection, course_ids):
+    # the rollup of deleted courses (the foreign key cascades where foreign keys are enforced)
+    if course_ids:
+        connection.execute(delete(StudyDay).where(StudyDay.course_id.in_(course_ids)))
+
+
+def _changed_days(session):
+    # the (course, day) pairs that had or have a study time changed by the flush that just happened, and the deleted courses
+    days, deleted_courses = set(), set()
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, StudyTime):
+            if obj in session.dirty and not session.is_modified(obj):
+                continue
+            state = inspect(obj)
+            course_ids = {obj.course_id, *state.attrs.course_id.history.deleted}
+            dates = {obj.date, *state.attrs.date.history.deleted}
+            days.update((course_id, day) for course_id in course_ids for day in dates)
+        elif isinstance(obj, Course) and obj in session.deleted:
+            deleted_courses.add(obj.id)
+    return days, deleted_courses
+
+
+@event.listens_for(Session, 'after_flush')
+def refresh_after_flush(session, flush_context):
+    days, deleted_courses = _changed_days(session)
+    if days or deleted_courses:
+        connection = session.connection()
+        refresh_study_days(connection, days)
+        forget_study_days(connection, deleted_courses)
+
+
+### statistics ###
+
+def _hours(seconds):
+    return round((seconds or 0) / 3600, 2)
+
+
+def _days_of(user_id, course_id):
+    # the rollup rows of a user, or of one of their courses
+    condition = StudyDay.user_id == user_id
+    if course_id is not None:
+        condition = and_(condition, StudyDay.course_id == course_id)
+    return condition
+
+
+def total_hours(user_id, course_id, start, end):
+    return _hours(db.session.scalar(
+        select(func.sum(StudyDay.seconds)).where(_days_of(user_id, course_id), StudyDay.date.between(start, end))))
+
+
+def hours_per_day(user_id, course_id, start, end):
+    rows = db.session.execute(
+        select(StudyDay.date, func.sum(StudyDay.seconds), func.sum(StudyDay.sessions))
+        .where(_days_of(user_id, course_id), StudyDay.date.between(start, end))
+        .group_by(StudyDay.date).order_by(StudyDay.date))
+    return [{'date': day, 'hours': _hours(seconds), 'sessions': sessions} for day, seconds, sessions in rows]
+
+
+def hours_per_week(user_id, course_id, start, end):
+    week = week_start(StudyDay.date).label('week')
+    rows = db.session.execute(
+        select(week, func.sum(StudyDay.seconds), func.count(StudyDay.date.distinct()))
+        .where(_days_of(user_id, course_id), StudyDay.date.between(start, end))
+        .group_by(week).order_by(week))
+    return [{'week': week, 'hours': _hours(seconds), 'days': days} for week, seconds, days in rows]
+
+
+def hours_per_course(user_id, course_id, start, end):
+    rows = db.session.execute(
+        select(Course.id, Course.code, Course.name, func.sum(StudyDay.seconds), func.sum(StudyDay.sessions))
+        .join(Course, Course.id == StudyDay.course_id)
+        .where(_days_of(user_id, course_id), StudyDay.date.between(start, end))
+        .group_by(Course.id, Course.code, Course.name).order_by(func.sum(StudyDay.seconds).desc(), Course.id))
+    return [{'course_id': course_id, 'code': code, 'name': name, 'hours': _hours(seconds), 'sessions': sessions}
+            for course_id, code, name, seconds, sessions in rows]
+
+
+def streaks(user_id, course_id, today):
+    # gaps and islands: numbered in order, consecutive days keep the same difference between their day number
+    # and their row number, so every streak is one group
+    days = select(StudyDay.date).where(_days_of(user_id, course_id)).group_by(StudyDay.date).subquery()
+    numbered = select(days.c.date, (day_number(days.c.date) - func.row_number().over(order_by=days.c.date)).label('island')).subquery()
+    streak = (select(func.min(numbered.c.date).label('first'), func.max(numbered.c.date).label('last'),
+                     func.count().label('days'))
+              .group_by(numbered.c.island))
+    longest = db.session.execute(streak.order_by(func.count().desc(), func.max(numbered.c.date).desc()).limit(1)).first()
+    latest = db.session.execute(streak.order_by(func.max(numbered.c.date).desc()).limit(1)).first()
+    # the current streak is still going if the user studied today or yesterday
+    current = latest if latest is not None and latest.last >= today - timedelta(days=1) else None
+    return {name: {'days': row.days, 'first': row.first, 'last': row.last} if row is not None else {'days': 0, 'first': None, 'last': None}
+            for name, row in (('current', current), ('longest', longest))}
+
+
+def before_deadlines(user_id, course_id, start, end, window=7):
+    # the hours studied for the course in the `window` days up to each deadline (the day of the deadline included)
+    condition = Course.user_id == user_id
+    if course_id is not None:
+        condition = and_(condition, Assignment.course_id == course_id)
+    studied = func.coalesce(func.sum(StudyDay.seconds), 0)
+    rows = db.session.execute(
+        select(Assignment.id, Assignment.name, Assignment.deadline, Assignment.completion_date, Assignment.course_id, Course.code, studied)
+        .join(Course, Course.id == Assignment.course_id)
+        .outerjoin(StudyDay, and_(StudyDay.course_id == Assignment.course_id,
+                                  StudyDay.date > add_days(Assignment.deadline, literal(-window, Integer)),
+                                  StudyDay.date <= add_days(Assignment.deadline, literal(0, Integer))))
+        .where(condition, Assignment.deadline >= start, Assignment.deadline < end + timedelta(days=1))
+        .group_by(Assignment.id, Assignment.name, Assignment.deadline, Assignment.completion_date, Assignment.course_id, Course.code)
+        .order_by(Assignment.deadline, Assignment.id))
+    return [{'id': assignment_id, 'name': name, 'deadline': deadline, 'completion_date': completion_date, 'course_id': course_id,
+             'code': code, 'hours': _hours(seconds)} for assignment_id, name, deadline, completion_date, course_id, code, seconds in rows]
+
+
+def default_period(today):
+    # the last 12 weeks, from a monday
+    start = today - timedelta(days=83)
+    return start - timedelta(days=start.weekday()), today
+
+
+def statistics(user_id, course_id=None, start=None, end=None, today=None, window=7):
+    today = today or date.today()
+    default_start, default_end = default_period(today)
+    start, end = start or default_start, end or default_end
+    return {
+        'start': start, 'end': end,
+        'total_hours': total_hours(user_id, course_id, start, end),
+        'days': hours_per_day(user_id, course_id, start, end),
+        'weeks': hours_per_week(user_id, course_id, start, end),
+        'courses': hours_per_course(user_id, course_id, start, end),
+        'streaks': streaks(user_id, course_id, today),
+        'deadlines': before_deadlines(user_id, course_id, start, end, window),
+        'window': window,
+    }
@@ -0,0 +1,481 @@
+from contextlib import contextmanager
+from datetime import date, datetime, time, timedelta
+
+from flask import Blueprint, abort, current_app, jsonify, request
+from flask_login import current_user, login_required
+from sqlalchemy import delete, false, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from werkzeug.exceptions import HTTPException
+
+from webapp import aio, db, login_manager, queries, pages, page_cache, user_cache
+from webapp.analytics import refresh_study_days, statistics
+from webapp.courses import archive_courses, delete_courses
+from webapp.files import release_resources
+from webapp.forms import CreateCourseForm, CreateAssignmentForm, CreateStudyTimeForm, CreateResourceForm, validate_data
+from webapp.models import Course, Assignment, StudyTime, Resource
+from webapp.pagination import PageRequest
+from webapp.scheduling import MAX_FREE_SLOT_DAYS, batch_conflicts, free_slots
+from webapp.search import index_records, unindex_records, search, result_url
+from webapp.versioning import bump_data_version
+
+# JSON api, version 1: /api/v1/courses, /api/v1/assignments, /api/v1/studytimes and /api/v1/resources
+#   GET     a page of the user's records (?course_id= to keep one course, ?after=/?before=/?limit= like the html lists), with an ETag
+#   POST    create a list of records (or a single one)          [{"course_id": 1, "name": "...", "deadline": "..."}, ...]
+#   PATCH   update a list of records, identified by their id     [{"id": 3, "name": "..."}, ...]
+#   DELETE  delete records                                       {"ids": [3, 4, 5]}
+# the records are validated with the rules of the html forms (dates and times can also be ISO 8601), and every bulk request
+# is written with batched statements in one transaction; the records that fail are reported by their index in the request
+# and don't stop the others
+
+api = Blueprint('api', __name__, url_prefix='/api/v1')
+login_manager.blueprint_login_views['api'] = None  # answer 401 instead of redirecting to the login page
+
+
+@api.errorhandler(HTTPException)
+def json_error(error):
+    return jsonify(error=error.name, message=error.description), error.code
+
+
+def _isoformat(value):
+    return value.isoformat() if value is not None else None
+
+
+def _etagged(payload):
+    # the client can send the ETag back in If-None-Match and get a 304 without a body if nothing changed
+    response = jsonify(payload)
+    response.add_etag()
+    response.cache_control.private = True
+    response.cache_control.no_cache = True  # always revalidate, but keep the copy
+    return response.make_conditional(request)
+
+
+def _items():
+    # the JSON body of a create/update request: a list of objects, or a single object
+    data = request.get_json(silent=True)
+    if isinstance(data, dict):
+        data = [data]
+    if not isinstance(data, list) or not all(isinstance(item, dict) for item in data):
+        abort(400, 'Expected a JSON object or a list of objects.')
+    if len(data) > current_app.config.get('API_MAX_ITEMS', 5000):
+        abort(413, f"At most {current_app.config.get('API_MAX_ITEMS', 5000)} records per request.")
+    return data
+
+
+def _ids():
+    data = request.get_json(silent=True)
+    ids = data.get('ids') if isinstance(data, dict) else None
+    if not isinstance(ids, list):
+        abort(400, 'Expected {"ids": [...]}.')
+    if len(ids) > current_app.config.get('API_MAX_ITEMS', 5000):
+        abort(413, f"At most {current_app.config.get('API_MAX_ITEMS', 5000)} records per request.")
+    return ids
+
+
+@contextmanager
+def _saving():
+    # around the statements of a bulk write and their _commit: the database checks the constraints when a statement
+    # runs, not only at the commit, and a record that conflicts with existing ones (a code a concurrent request took
+    # after _taken_codes looked, a course deleted meanwhile) rolls the whole write back
+    try:
+        yield
+    except IntegrityError:
+        db.session.rollback()
+        abort(409, 'The records conflict with existing ones, nothing was saved.')
+
+
+def _commit(course_ids=()):
+    # the bulk statements bypass the session's change tracking, so the data versions of the user and of the courses
+    # that changed are bumped here (inside _saving)
+    bump_data_version(db.session, user_ids=[current_user.id], course_ids=course_ids)
+    db.session.commit()
+
+
+def _bulk_response(done, errors, success_status=200):
+    # every record succeeded: 200/201, some failed: 207, all failed: 422
+    status = success_status if not errors else 207 if done else 422
+    return jsonify(done=done, errors=errors), status
+
+
+def _is_id(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def _owned_courses(course_ids, archived=True):
+    # the ids among course_ids that are courses of the current user, in one query (archived=False: not the archived ones)
+    course_ids = [course_id for course_id in course_ids if _is_id(course_id)]
+    if not course_ids:
+        return set()
+    statement = select(Course.id).where(Course.id.in_(course_ids), Course.user_id == current_user.id)
+    if not archived:
+        statement = statement.where(Course.archived == false())
+    return set(db.session.scalars(statement))
+
+
+def _course_arg():
+    # ?course_id=: None if it isn't there, 404 if it isn't one of the user's courses
+    course_id = request.args.get('course_id')
+    if course_id is None:
+        return None
+    if not course_id.isdigit() or int(course_id) not in _owned_courses([int(course_id)]):
+        abort(404)
+    return int(course_id)
+
+
+class CourseChildren:
+    # the api of one kind of record that belongs to a course (assignments, study times, resources)
+    def __init__(self, model, form, columns, user_page, course_page, serialize):
+        self.model = model
+        self.form = form
+        self.columns = columns  # form field -> model column
+        self.user_page = user_page
+        self.course_page = course_page
+        self.serialize = serialize
+
+    def form_data(self, item):
+        # the fields can be named like the form's (start) or like the model's (start_time)
+        fields = {column: field for field, column in self.columns.items()}
+        return {fields.get(name, name): value for name, value in item.items()}
+
+    def values(self, form):
+        return {column: form[field].data for field, column in self.columns.items()}
+
+    def _owned(self, ids):
+        # the records with the given ids that belong to the current user, in one joined query
+        ids = [record_id for record_id in ids if _is_id(record_id)]
+        if not ids:
+            return []
+        return (self.model.query.join(self.model.course)
+                .filter(self.model.id.in_(ids), Course.user_id == current_user.id).all())
+
+    def list(self):
+        course_id = _course_arg()
+        if course_id is None:
+            page = self.user_page(current_user.id, PageRequest.from_request())
+        else:
+            page = self.course_page(course_id, PageRequest.from_request())
+        return self.list_response(page)
+
+    async def list_async(self):
+        # list() on the async driver (ASYNC_VIEWS, see aio.py)
+        course_id = request.args.get('course_id')
+        async with aio.session() as session:
+            if course_id is None:
+                statement = aio.user_records(self.model, current_user.id)
+            elif course_id.isdigit() and await aio.owns_course(session, current_user.id, int(course_id)):
+                statement = aio.course_records(self.model, int(course_id))
+            else:
+                abort(404)
+            page = await aio.fetch_page(session, statement, self.model, PageRequest.from_request())
+        return self.list_response(page)
+
+    def list_response(self, page):
+        return _etagged({'items': [self.serialize(record) for record in page],
+                         'prev': page.prev_cursor, 'next': page.next_cursor})
+
+    def create(self):
+        items = _items()
+        # the ids and codes come from the client: anything else (a list, an object) is an error of its item, not a set member
+        courses = _owned_courses([item.get('course_id') for item in items], archived=False)  # nothing is added to an archived course
+        rows, indexes, errors = [], [], []
+        for index, item in enumerate(items):
+            form, item_errors = validate_data(self.form, self.form_data(item))
+            if not _is_id(item.get('course_id')) or item['course_id'] not in courses:
+                item_errors = dict(item_errors, course_id=['No such course.'])
+            if item_errors:
+                errors.append({'index': index, 'errors': item_errors})
+                continue
+            rows.append(dict(self.values(form), course_id=item['course_id']))
+            indexes.append(index)
+        rows, indexes = self._without_conflicts(rows, indexes, errors)
+        done = []
+        if rows:
+            with _saving():
+                # one multi-row INSERT ... RETURNING id (SQLAlchemy batches the rows) instead of a flush per object;
+                # sort_by_parameter_order: the ids come back in the order of the rows, whatever order the database gives them out in
+                ids = db.session.scalars(insert(self.model).returning(self.model.id, sort_by_parameter_order=True), rows).all()
+                self.refresh_rollups(self.rollup_keys(ids))
+                index_records(db.session, self.model, ids)  # the bulk statements skip the search's mapper events
+                _commit({row['course_id'] for row in rows})
+                done = [{'index': index, 'id': record_id} for index, record_id in zip(indexes, ids)]
+        return _bulk_response(done, errors, 201)
+
+    def update(self):
+        items = _items()
+        current = {record.id: record for record in self._owned([item.get('id') for item in items])}
+        rows, indexes, errors = [], [], []
+        for index, item in enumerate(items):
+            record = current.get(item['id']) if _is_id(item.get('id')) else None
+            if record is None:
+                errors.append({'index': index, 'errors': {'id': ['No such record.']}})
+                continue
+            # the fields that are not in the request keep their current value
+            data = {field: getattr(record, column) for field, column in self.columns.items()}
+            data.update({field: value for field, value in self.form_data(item).items() if field in self.columns})
+            form, item_errors = validate_data(self.form, data)
+            if item_errors:
+                errors.append({'index': index, 'errors': item_errors})
+                continue
+            rows.append(dict(self.values(form), id=record.id))
+            indexes.append(index)
+        rows, indexes = self._without_conflicts(rows, indexes, errors, ids=[row['id'] for row in rows])
+        done = [{'index': index, 'id': row['id']} for index, row in zip(indexes, rows)]
+        if rows:
+            with _saving():
+                ids = [row['id'] for row in rows]
+                keys = self.rollup_keys(ids)  # before and after the update
+                db.session.execute(update(self.model), rows)  # a bulk UPDATE ... WHERE id = ? (executemany)
+                self.refresh_rollups(keys | self.rollup_keys(ids))
+                index_records(db.session, self.model, ids)
+                _commit({current[record_id].course_id for record_id in ids})
+        return _bulk_response(done, errors)
+
+    def conflicts(self, rows, ids=()):
+        # {position in rows: errors} for rows that are valid on their own but clash with other records (see StudyTimeApi)
+        # ids: the records being updated, which can't clash with their old selves
+        return {}
+
+    def _without_conflicts(self, rows, indexes, errors, ids=()):
+        conflicts = self.conflicts(rows, ids)
+        errors.extend({'index': indexes[position], 'errors': row_errors} for position, row_errors in conflicts.items())
+        errors.sort(key=lambda error: error['index'])
+        keep = [position for position in range(len(rows)) if position not in conflicts]
+        return [rows[position] for position in keep], [indexes[position] for position in keep]
+
+    def rollup_keys(self, ids):
+        # the rollup rows that depend on these records, refreshed after a write (see StudyTimeApi)
+        return set()
+
+    def refresh_rollups(self, keys):
+        pass
+
+    def before_delete(self, ids):
+        pass
+
+    def delete(self):
+        ids = _ids()
+        records = self._owned(ids)
+        found = {record.id for record in records}
+        if found:
+            with _saving():
+                self.before_delete(found)
+                keys = self.rollup_keys(found)
+                db.session.execute(delete(self.model).where(self.model.id.in_(found)))
+                self.refresh_rollups(keys)
+                unindex_records(db.session, self.model, found)
+                _commit({record.course_id for record in records})
+        deleted = [_is_id(record_id) and record_id in found for record_id in ids]
+        errors = [{'index': index, 'errors': {'id': ['No such record.']}} for index, ok in enumerate(deleted) if not ok]
+        return _bulk_response([{'index': index, 'id': record_id} for index, (record_id, ok) in enumerate(zip(ids, deleted)) if ok], errors)
+
+
+class AssignmentApi(CourseChildren):
+    def before_delete(self, ids):
+        # the resources of a deleted assignment stay in the course
+        db.session.execute(update(Resource).where(Resource.assignment_id.in_(ids)).values(assignment_id=None))
+
+
+class ResourceApi(CourseChildren):
+    def before_delete(self, ids):
+        release_resources(db.session, Resource.id.in_(ids))  # the references to their files (see files.py)
+
+
+class StudyTimeApi(CourseChildren):
+    # the study times of a user can't overlap (see scheduling.py), with one query for the whole request
+    def conflicts(self, rows, ids=()):
+        sessions = [(row['date'], row['start_time'], row['end_time']) for row in rows]
+        return {position: {'start': [message]}
+                for position, message in batch_conflicts(current_user.id, sessions, exclude_ids=ids).items()}
+
+    # the statistics' rollup of the days that had or have one of the study times (see analytics.py)
+    def rollup_keys(self, ids):
+        return {tuple(row) for row in db.session.execute(select(StudyTime.course_id, StudyTime.date).where(StudyTime.id.in_(ids)))}
+
+    def refresh_rollups(self, keys):
+        refresh_study_days(db.session, keys)
+
+
+class CourseApi:
+    # courses are identified by their id, the code (unique among the user's courses, it's in the urls) can change
+    def list(self):
+        return self.list_response(queries.user_courses(current_user.id, PageRequest.from_request()))
+
+    async def list_async(self):
+        async with aio.session() as session:
+            page = await aio.fetch_page(session, aio.user_records(Course, current_user.id), Course, PageRequest.from_request())
+        return self.list_response(page)
+
+    def list_response(self, page):
+        return _etagged({'items': [{'id': course.id, 'code': course.code, 'name': course.name} for course in page],
+                         'prev': page.prev_cursor, 'next': page.next_cursor})
+
+    def _taken_codes(self, codes):
+        # code -> id of the user's courses with one of these codes, in one query (through the unique (user_id, code) index)
+        codes = [code for code in codes if isinstance(code, str)]
+        if not codes:
+            return {}
+        return dict(db.session.execute(select(Course.code, Course.id).where(Course.user_id == current_user.id, Course.code.in_(codes))).all())
+
+    def create(self):
+        items = _items()
+        taken = self._taken_codes([item.get('code') for item in items])
+        rows, indexes, errors = [], [], []
+        for index, item in enumerate(items):
+            form, item_errors = validate_data(CreateCourseForm, item)
+            if not isinstance(item.get('code'), str):
+                item_errors = dict(item_errors, code=['Expected a string.'])
+            elif not item_errors and form.code.data in taken:
+                item_errors = {'code': ['This course already exists.']}
+            if item_errors:
+                errors.append({'index': index, 'errors': item_errors})
+                continue
+            taken[form.code.data] = None  # the same course twice in one request
+            rows.append({'code': form.code.data, 'name': form.name.data, 'user_id': current_user.id})
+            indexes.append(index)
+        done = []
+        if rows:
+            with _saving():
+                ids = db.session.scalars(insert(Course).returning(Course.id, sort_by_parameter_order=True), rows).all()  # like CourseChildren.create
+                index_records(db.session, Course, ids)
+                _commit(ids)
+                done = [{'index': index, 'id': course_id} for index, course_id in zip(indexes, ids)]
+        return _bulk_response(done, errors, 201)
+
+    def update(self):
+        items = _items()
+        ids = [item.get('id') for item in items]
+        current = {course.id: course for course in Course.query.filter(
+            Course.id.in_([course_id for course_id in ids if _is_id(course_id)]), Course.user_id == current_user.id)}
+        taken = self._taken_codes([item.get('code') for item in items])
+        rows, done, errors, archiving = [], [], [], {True: [], False: []}
+        for index, item in enumerate(items):
+            course = current.get(item['id']) if _is_id(item.get('id')) else None
+            if course is None:
+                errors.append({'index': index, 'errors': {'id': ['No such course.']}})
+                continue
+            code = item.get('code', course.code)
+            form, item_errors = validate_data(CreateCourseForm, {'code': code, 'name': item.get('name', course.name)})
+            if not isinstance(code, str):
+                item_errors = dict(item_errors, code=['Expected a string.'])
+            elif not item_errors and taken.get(form.code.data, course.id) != course.id:
+                item_errors = {'code': ['This course already exists.']}
+            archived = item.get('archived', course.archived)  # {"archived": true} archives the course and everything in it
+            if not isinstance(archived, bool):
+                item_errors = dict(item_errors, archived=['Expected true or false.'])
+            if item_errors:
+                errors.append({'index': index, 'errors': item_errors})
+                continue
+            taken[form.code.data] = course.id
+            rows.append({'id': course.id, 'code': form.code.data, 'name': form.name.data})
+            if archived != course.archived:
+                archiving[archived].append(course.id)
+            done.append({'index': index, 'id': course.id})
+        if rows:
+            with _saving():
+                db.session.execute(update(Course), rows)
+                index_records(db.session, Course, [row['id'] for row in rows])
+                for archived, course_ids in archiving.items():
+                    archive_courses(db.session, course_ids, archived)
+                _commit([row['id'] for row in rows])
+        return _bulk_response(done, errors)
+
+    def delete(self):
+        ids = _ids()
+        found = _owned_courses(ids)
+        if found:
+            with _saving():
+                delete_courses(db.session, found)
+                _commit()
+        deleted = [_is_id(course_id) and course_id in found for course_id in ids]
+        errors = [{'index': index, 'errors': {'id': ['No such course.']}} for index, ok in enumerate(deleted) if not ok]
+        return _bulk_response([{'index': index, 'id': course_id} for index, (course_id, ok) in enumerate(zip(ids, deleted)) if ok], errors)
+
+
+COLLECTIONS = {
+    'courses': CourseApi(),
+    'assignments': AssignmentApi(
+        Assignment, CreateAssignmentForm, {'name': 'name', 'deadline': 'deadline'},
+        queries.user_assignments, queries.course_assignments,
+        lambda a: {'id': a.id, 'course_id': a.course_id, 'name': a.name,
+                   'deadline': _isoformat(a.deadline), 'completion_date': _isoformat(a.completion_date)}),
+    'studytimes': StudyTimeApi(
+        StudyTime, CreateStudyTimeForm, {'date': 'date', 'start': 'start_time', 'end': 'end_time'},
+        queries.user_study_times, queries.course_study_times,
+        lambda s: {'id': s.id, 'course_id': s.course_id, 'date': _isoformat(s.date),
+                   'start_time': _isoformat(s.start_time), 'end_time': _isoformat(s.end_time)}),
+    'resources': ResourceApi(
+        Resource, CreateResourceForm, {'name': 'name'},
+        queries.user_resources, queries.course_resources,
+        lambda r: {'id': r.id, 'course_id': r.course_id, 'assignment_id': r.assignment_id, 'name': r.name}),
+}
+
+@api.record
+def add_collection_rules(state):
+    # added when the blueprint is registered, the app's config decides about the lists
+    for name, collection in COLLECTIONS.items():
+        # the lists are read-only, with ASYNC_VIEWS they await the async driver (see aio.py and asgi.py)
+        list_view = collection.list_async if state.app.config.get('ASYNC_VIEWS') else collection.list
+        state.add_url_rule(f'/{name}', f'list_{name}', login_required(list_view), methods=['GET'])
+        state.add_url_rule(f'/{name}', f'create_{name}', login_required(collection.create), methods=['POST'])
+        state.add_url_rule(f'/{name}', f'update_{name}', login_required(collection.update), methods=['PATCH'])
+        state.add_url_rule(f'/{name}', f'delete_{name}', login_required(collection.delete), methods=['DELETE'])
+
+
+@api.route('/statistics')
+@login_required
+def get_statistics():
+    # the hours studied per day, week and course, the streaks and the time studied before the deadlines (see analytics.py)
+    # ?course_id= for one course, ?from=/?to= (ISO dates) for another period than the last 12 weeks, ?window= days before a deadline
+    course_id = _course_arg()
+    window = request.args.get('window', 7, type=int)
+    if not 1 <= window <= 365:
+        abort(400, 'The window is between 1 and 365 days.')
+    result = statistics(current_user.id, course_id, request.args.get('from', type=date.fromisoformat),
+                        request.args.get('to', type=date.fromisoformat), window=window)
+    return _etagged(_jsonable(result))
+
+
+def _jsonable(value):
+    if isinstance(value, dict):
+        return {key: _jsonable(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_jsonable(item) for item in value]
+    return _isoformat(value) if isinstance(value, (date, datetime)) else value
+
+
+@api.route('/freeslots')
+@login_required
+def get_free_slots():
+    # the open study windows of the user: ?from=&to= (ISO dates, at most a year), ?day_start=08:00&day_end=22:00
+    # the hours of the day to plan in, ?min_minutes=30 the shortest window worth listing
+    first_day = request.args.get('from', type=date.fromisoformat)
+    last_day = request.args.get('to', type=date.fromisoformat)
+    day_start = request.args.get('day_start', time(8), type=time.fromisoformat)
+    day_end = request.args.get('day_end', time(22), type=time.fromisoformat)
+    min_minutes = request.args.get('min_minutes', 30, type=int)
+    if first_day is None or last_day is None or not 0 <= (last_day - first_day).days < MAX_FREE_SLOT_DAYS:
+        abort(400, f'Expected ?from= and ?to= dates, at most {MAX_FREE_SLOT_DAYS} days apart.')
+    if day_end <= day_start or min_minutes < 1:
+        abort(400, 'Expected day_start before day_end and min_minutes of at least 1.')
+    slots = free_slots(current_user.id, first_day, last_day, day_start, day_end, timedelta(minutes=min_minutes))
+    return _etagged({'items': [{'date': day.isoformat(), 'start_time': start.isoformat(), 'end_time': end.isoformat()}
+                               for day, start, end in slots]})
+
+
+@api.route('/search')
+@login_required
+def get_search():
+    # ?q= the words to look for (each one a prefix), ?kind= course, assignment or resource (can be repeated), ?limit=
+    kinds = request.args.getlist('kind')
+    if set(kinds) - {'course', 'assignment', 'resource'}:
+        abort(400, 'The kind is course, assignment or resource.')
+    limit = max(1, min(request.args.get('limit', 20, type=int), 100))
+    results = search(current_user.id, request.args.get('q', ''), kinds, limit)
+    return _etagged({'items': [dict(result, url=result_url(result)) for result in results]})
+
+
+@api.route('/cache')
+@login_required
+def get_cache_stats():
+    # the hit and miss counters of this process's caches: the course pages (see pages.py) and the logged in users
+    return jsonify(pages=dict(pages.stats(), entries=len(page_cache.local)),
+                   users={'hits': user_cache.hits, 'misses': user_cache.misses, 'entries': len(user_cache.local)})
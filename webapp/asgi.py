@@ -0,0 +1,45 @@
+import asyncio
+import os
+
+# the production entry point for ASGI servers:
+#     uvicorn webapp.asgi:application --workers 4 --host 0.0.0.0 --port 8000
+# (pip install "flask[async]" uvicorn greenlet aiosqlite, or asyncpg for PostgreSQL)
+# every request runs the Flask app in a thread of its own, so the sync views (forms, bulk writes) work as they are;
+# the read-only api lists can be async views (ASYNC_VIEWS, see aio.py) whose queries run on the server's event loop;
+# that pays off when the queries wait on the network (PostgreSQL), so it's on by default for those only: with SQLite
+# every aiosqlite call is one more hop between threads and the lists got slower under load (benchmarks/asgi.py)
+# concurrency: --workers processes (about one per core), each one handling up to ASGI_MAX_REQUESTS requests at a time
+# (the others wait in line); with PostgreSQL every worker has its own pool of DB_POOL_SIZE + DB_MAX_OVERFLOW connections
+# for the sync views, plus the pool of its async engine
+
+# before the app reads its config
+os.environ.setdefault('ASYNC_VIEWS', '0' if os.environ.get('SQLALCHEMY_DATABASE_URI', 'sqlite').startswith('sqlite') else '1')
+
+from asgiref.sync import ThreadSensitiveContext
+from asgiref.wsgi import WsgiToAsgi
+
+from webapp import create_app
+
+app = create_app()
+app.config['ASYNC_SHARED_LOOP'] = True  # one AsyncEngine per worker, on the server's loop (see aio.py)
+
+
+class Application:
+    def __init__(self, wsgi_app, max_requests):
+        self.wsgi = WsgiToAsgi(wsgi_app)
+        self.max_requests = max_requests
+        self._slots = None
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.wsgi(scope, receive, send)
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_requests)  # created on the server's loop
+        async with self._slots:
+            # WsgiToAsgi runs the app as a "thread sensitive" function, which would put every request in the same
+            # thread, one after the other; a context per request gives each one its own thread
+            async with ThreadSensitiveContext():
+                await self.wsgi(scope, receive, send)
+
+
+application = Application(app, app.config['ASGI_MAX_REQUESTS'])
@@ -0,0 +1,132 @@
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import shutil
+
+import click
+from flask import Blueprint, current_app, url_for, send_from_directory, request, abort
+from flask.cli import AppGroup
+
+# the files in static/ are copied to the asset folder (ASSET_DIR, by default static/dist) by `flask assets build`
+# under a name with a hash of their content in it (main.css -> main.4f1c9a0b2d3e.css), next to a .gz and a .br of them.
+# a name like that never gets other content, so the browser can keep it for a year without asking again (immutable)
+# and a new build changes the urls the pages link to instead
+
+MANIFEST = 'manifest.json'  # the original name -> the hashed name, read when the blueprint is registered
+HASH_LENGTH = 12
+MAX_AGE = 365 * 24 * 3600
+COMPRESSED_TYPES = ('text/', 'application/javascript', 'application/json', 'image/svg+xml')
+# the encodings that are built, in the order they are preferred
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+# /assets/<hashed name> and asset_url() in the templates, registered on the app by create_app
+assets = Blueprint('assets', __name__)
+
+
+def asset_dir(app):
+    return app.config.get('ASSET_DIR') or os.path.join(app.static_folder, 'dist')
+
+
+def load_manifest(app):
+    try:
+        with open(os.path.join(asset_dir(app), MANIFEST)) as file:
+            manifest = json.load(file)
+    except FileNotFoundError:
+        manifest = {}  # not built (yet), the pages link to static/ as before
+    app.extensions['assets'] = manifest
+    return manifest
+
+
+@assets.record
+def _load_manifest(state):
+    load_manifest(state.app)
+
+
+@assets.app_template_global()
+def asset_url(filename, **values):
+    # use it like url_for('static', filename=...): asset_url('main.css') is the url of the built main.<hash>.css,
+    # or the plain static url if the file isn't in the build (or the app runs in debug mode, where the files change)
+    hashed = None if current_app.debug else current_app.extensions['assets'].get(filename)
+    if hashed is None:
+        return url_for('static', filename=filename, **values)
+    return url_for('assets.asset', filename=hashed, **values)
+
+
+def hashed_name(filename, content):
+    digest = hashlib.sha256(content).hexdigest()[:HASH_LENGTH]
+    directory, name = os.path.split(filename)
+    stem, extension = os.path.splitext(name)
+    return os.path.join(directory, f'{stem}.{digest}{extension}').replace(os.sep, '/')
+
+
+def compressible(filename):
+    mimetype = mimetypes.guess_type(filename)[0] or ''
+    return mimetype.startswith(COMPRESSED_TYPES)
+
+
+def build(static_folder, out):
+    # returns the new manifest; the files of the previous builds stay, a page rendered before the build can still load them
+    try:
+        import brotli  # optional, without it there are only .gz variants
+    except ImportError:
+        brotli = None
+    built = {}
+    out = os.path.abspath(out)
+    for root, dirs, files in os.walk(static_folder):
+        dirs[:] = sorted(d for d in dirs if os.path.abspath(os.path.join(root, d)) != out)
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            filename = os.path.relpath(path, static_folder).replace(os.sep, '/')
+            with open(path, 'rb') as file:
+                content = file.read()
+            target = os.path.join(out, hashed_name(filename, content))
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            shutil.copyfile(path, target)
+            if compressible(filename):
+                variants = {'.gz': gzip.compress(content, 9, mtime=0)}  # mtime=0: the same file gives the same bytes
+                if brotli is not None:
+                    variants['.br'] = brotli.compress(content, quality=11)
+                for suffix, compressed in variants.items():
+                    if len(compressed) < len(content):
+                        with open(target + suffix, 'wb') as file:
+                            file.write(compressed)
+            built[filename] = hashed_name(filename, content)
+    with open(os.path.join(out, MANIFEST), 'w') as file:
+        json.dump(built, file, indent=1, sort_keys=True)
+    return built
+
+
+@assets.route('/assets/<path:filename>')
+def asset(filename):
+    if filename == MANIFEST or filename.endswith(tuple(suffix for encoding, suffix in ENCODINGS)):
+        abort(404)
+    directory = asset_dir(current_app)
+    # the smallest variant the client takes, the files are compressed once by the build and not for every request
+    for encoding, suffix in ENCODINGS:
+        if request.accept_encodings[encoding] and os.path.isfile(os.path.join(directory, filename + suffix)):
+            # (the hash in the name is the version of the content, so it makes the etag too)
+            response = send_from_directory(directory, filename + suffix, mimetype=mimetypes.guess_type(filename)[0],
+                                           etag=f'{filename}-{encoding}', max_age=MAX_AGE)
+            response.headers['Content-Encoding'] = encoding
+            break
+    else:
+        response = send_from_directory(directory, filename, etag=filename, max_age=MAX_AGE)
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    response.vary.add('Accept-Encoding')
+    return response
+
+
+### command line ###
+
+assets_cli = AppGroup('assets', help='Build the fingerprinted and compressed static files.')  # added to the app's commands by create_app
+
+
+@assets_cli.command('build')
+def build_command():
+    # flask --app webapp assets build   (after changing anything in static/, and before starting the app)
+    built = build(current_app.static_folder, asset_dir(current_app))
+    load_manifest(current_app)
+    click.echo(f'{len(built)} files built in {asset_dir(current_app)}.')
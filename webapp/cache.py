@@ -0,0 +1,145 @@
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+from werkzeug.utils import import_string
+
+# caches: a per-process LRU with expiring entries, optionally backed by a cache shared between the worker processes
+# (anything with get/set/delete, e.g. RedisBackend), configured through <NAME>_CACHE_SIZE, <NAME>_CACHE_TTL and <NAME>_CACHE_BACKEND
+
+
+class LRUCache:
+    # a size-bounded, thread-safe LRU cache whose entries expire `ttl` seconds after they were set (never if ttl is None)
+    def __init__(self, maxsize=1024, ttl=None, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self._entries = OrderedDict()  # key -> (expires, value), the least recently used first
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (entry[0] is None or entry[0] > self.clock()):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]  # expired
+            self.misses += 1
+            return default
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        with self._lock:
+            self._entries[key] = (None if ttl is None else self.clock() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)  # evict the least recently used entry
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class MemoryBackend:
+    # an in-process stand-in for a shared cache server, for development and tests:
+    # every cache of the process that uses it sees the same entries, and values are pickled like they would be on the wire
+    _store = LRUCache(maxsize=100000)
+
+    @classmethod
+    def from_config(cls, config):
+        return cls()
+
+    def get(self, key):
+        data = self._store.get(key)
+        return None if data is None else pickle.loads(data)
+
+    def set(self, key, value, ttl=None):
+        self._store.set(key, pickle.dumps(value), ttl)
+
+    def delete(self, key):
+        self._store.delete(key)
+
+    def clear(self):
+        self._store.clear()
+
+
+class RedisBackend:
+    # a cache shared by all the worker processes (and servers), needs the redis package and CACHE_REDIS_URL
+    def __init__(self, url):
+        import redis  # only needed when this backend is configured
+        self._redis = redis.Redis.from_url(url)
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(config.get('CACHE_REDIS_URL', 'redis://localhost:6379/0'))
+
+    def get(self, key):
+        data = self._redis.get(key)
+        return None if data is None else pickle.loads(data)
+
+    def set(self, key, value, ttl=None):
+        self._redis.set(key, pickle.dumps(value), ex=None if ttl is None else max(1, int(ttl)))
+
+    def delete(self, key):
+        self._redis.delete(key)
+
+
+class Cache:
+    # a named cache, bound to the application like the other extensions: user_cache = Cache('USER'); user_cache.init_app(app)
+    # reads go to the local LRU first, then to the shared backend (if there is one); writes and deletes go to both
+    def __init__(self, name, maxsize=1024, ttl=None):
+        self.name = name
+        self.local = LRUCache(maxsize, ttl)
+        self.shared = None
+
+    def init_app(self, app):
+        config = app.config
+        self.local = LRUCache(config.get(f'{self.name}_CACHE_SIZE', self.local.maxsize),
+                              config.get(f'{self.name}_CACHE_TTL', self.local.ttl))
+        backend = config.get(f'{self.name}_CACHE_BACKEND')
+        self.shared = import_string(backend).from_config(config) if backend else None
+
+    def _shared_key(self, key):
+        return f'{self.name.lower()}:{key}'  # the caches share the backend, so their keys are namespaced
+
+    def get(self, key, default=None):
+        value = self.local.get(key)
+        if value is None and self.shared is not None:
+            value = self.shared.get(self._shared_key(key))
+            if value is not None:
+                self.local.set(key, value)
+        return default if value is None else value
+
+    def set(self, key, value, ttl=None):
+        self.local.set(key, value, ttl)
+        if self.shared is not None:
+            self.shared.set(self._shared_key(key), value, self.local.ttl if ttl is None else ttl)
+
+    def delete(self, key):
+        self.local.delete(key)
+        if self.shared is not None:
+            self.shared.delete(self._shared_key(key))
+
+    def clear(self):
+        # only the local entries: the shared ones expire by themselves
+        self.local.clear()
+
+    @property
+    def hits(self):
+        return self.local.hits
+
+    @property
+    def misses(self):
+        return self.local.misses
@@ -0,0 +1,44 @@
+from sqlalchemy import delete, select, update
+
+from webapp.analytics import forget_study_days
+from webapp.files import release_resources
+from webapp.models import Course, Assignment, StudyTime, Resource
+from webapp.search import index_records, unindex_courses
+
+# deleting and archiving courses together with everything in them, a few set-based statements whatever their size
+# (db.session.delete(course) would load every record of the course to cascade it, and the relationships don't cascade)
+# an archived course keeps its records, flagged too: the lists leave them out through the `archived` column of their
+# indexes (see queries.py), the search forgets them until the course is brought back, and no records can be added to it;
+# the statistics still count its study times, they happened
+# these are bulk statements: the callers bump the data versions (see versioning.py), in the same transaction
+
+CHILDREN = (Resource, StudyTime, Assignment)  # the resources first, they can point to an assignment
+
+
+def delete_courses(connection, course_ids):
+    # connection: a Connection or a Session
+    course_ids = list(course_ids)
+    if not course_ids:
+        return
+    forget_study_days(connection, course_ids)
+    unindex_courses(connection, course_ids)
+    release_resources(connection, Resource.course_id.in_(course_ids))  # their files are removed by `flask files gc`
+    for model in CHILDREN:
+        connection.execute(delete(model).where(model.course_id.in_(course_ids)))
+    connection.execute(delete(Course).where(Course.id.in_(course_ids)))
+
+
+def archive_courses(connection, course_ids, archived=True):
+    # archive the courses and their records, or bring them back with archived=False
+    course_ids = list(course_ids)
+    if not course_ids:
+        return
+    connection.execute(update(Course).where(Course.id.in_(course_ids)).values(archived=archived))
+    for model in CHILDREN:
+        connection.execute(update(model).where(model.course_id.in_(course_ids)).values(archived=archived))
+    if archived:
+        unindex_courses(connection, course_ids)
+    else:
+        index_records(connection, Course, course_ids)
+        for model in (Assignment, Resource):
+            index_records(connection, model, select(model.id).where(model.course_id.in_(course_ids)))
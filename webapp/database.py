@@ -0,0 +1,39 @@
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+# engine settings for the database in Config: a connection pool for server databases (PostgreSQL)
+# and WAL, synchronous=NORMAL, a busy timeout and mmap for SQLite
+
+
+def _is_memory_sqlite(url):
+    return url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:')
+
+
+def engine_options(config):
+    # the SQLALCHEMY_ENGINE_OPTIONS for the database in the config
+    url = make_url(config['SQLALCHEMY_DATABASE_URI'])
+    options = dict(config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+    if _is_memory_sqlite(url):
+        return options  # an in-memory database lives in a single connection (Flask-SQLAlchemy gives it a StaticPool)
+    options.setdefault('pool_size', config['DB_POOL_SIZE'])
+    options.setdefault('max_overflow', config['DB_MAX_OVERFLOW'])
+    options.setdefault('pool_timeout', config['DB_POOL_TIMEOUT'])
+    options.setdefault('pool_recycle', config['DB_POOL_RECYCLE'])
+    options.setdefault('pool_pre_ping', url.get_backend_name() != 'sqlite')  # drop connections the server closed
+    return options
+
+
+def configure_engine(engine, config):
+    # called once per engine, before it opens its first connection
+    if engine.dialect.name != 'sqlite':
+        return
+
+    @event.listens_for(engine, 'connect')
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        if not _is_memory_sqlite(engine.url):
+            cursor.execute(f"PRAGMA journal_mode={config['SQLITE_JOURNAL_MODE']}")  # stored in the file, but cheap to repeat
+            cursor.execute(f"PRAGMA mmap_size={int(config['SQLITE_MMAP_SIZE'])}")
+        cursor.execute(f"PRAGMA synchronous={config['SQLITE_SYNCHRONOUS']}")
+        cursor.execute(f"PRAGMA busy_timeout={int(config['SQLITE_BUSY_TIMEOUT'])}")
+        cursor.close()
@@ -0,0 +1,163 @@
+import csv
+from datetime import datetime, timezone
+
+from flask import Blueprint, Response, abort, current_app, request, stream_with_context
+from flask_login import current_user
+from itsdangerous import BadSignature, URLSafeSerializer
+from sqlalchemy import false, select
+
+from webapp import db
+from webapp.models import User, Course, Assignment, StudyTime
+
+# exports of a user's assignments (deadlines) and study times, as iCalendar (.ics) or CSV:
+#   /export/assignments.ics  /export/assignments.csv  /export/studytimes.ics  /export/studytimes.csv
+# the rows are streamed from a server-side cursor in batches, so the memory used doesn't depend on how much data there is
+# the ETag and Last-Modified come from the user's data version (see versioning.py): a client polling with
+# If-None-Match / If-Modified-Since gets a 304 from a single primary key lookup while nothing changed
+# calendar apps can't log in, so the exports also accept the user's feed token (?token=..., see feed_token)
+
+export = Blueprint('export', __name__, url_prefix='/export')
+
+BATCH_SIZE = 500  # rows fetched from the cursor (and sent to the client) at a time
+
+
+def _serializer():
+    return URLSafeSerializer(current_app.config['SECRET_KEY'], salt='export-feed')
+
+
+def feed_token(user_id):
+    # a secret link for calendar apps, valid until the SECRET_KEY changes
+    return _serializer().dumps(user_id)
+
+
+def _export_user_id():
+    token = request.args.get('token')
+    if token:
+        try:
+            return _serializer().loads(token)
+        except BadSignature:
+            abort(404)
+    if current_user.is_authenticated:
+        return current_user.id
+    abort(401)
+
+
+### iCalendar ###
+
+def _ics_text(value):
+    # TEXT values escape backslashes, semicolons, commas and newlines (RFC 5545 3.3.11)
+    return value.replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,').replace('\r\n', '\\n').replace('\n', '\\n')
+
+
+def _ics_line(line):
+    # lines longer than 75 octets are folded: CRLF and a space before the rest (RFC 5545 3.1)
+    data = line.encode('utf-8')
+    if len(data) <= 75:
+        return line + '\r\n'
+    parts = []
+    while len(data) > 75:
+        cut = 75 if not parts else 74  # the space at the start of a continuation line counts
+        while cut and (data[cut] & 0xC0) == 0x80:  # don't cut a utf-8 character in two
+            cut -= 1
+        parts.append(data[:cut].decode('utf-8'))
+        data = data[cut:]
+    parts.append(data.decode('utf-8'))
+    return '\r\n '.join(parts) + '\r\n'
+
+
+def _ics_time(value):
+    return value.strftime('%Y%m%dT%H%M%S')  # floating time, like the times the users type in
+
+
+def _calendar(name, events):
+    stamp = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+    yield ''.join(_ics_line(line) for line in ('BEGIN:VCALENDAR', 'VERSION:2.0', 'PRODID:-//Project-2//webapp//EN',
+                                                'CALSCALE:GREGORIAN', 'X-WR-CALNAME:' + _ics_text(name)))
+    for batch in events:
+        yield ''.join(_ics_line(line) for event in batch for line in ('BEGIN:VEVENT', f'DTSTAMP:{stamp}', *event, 'END:VEVENT'))
+    yield _ics_line('END:VCALENDAR')
+
+
+def _assignment_event(row):
+    lines = [f'UID:assignment-{row.id}@webapp', f'DTSTART:{_ics_time(row.deadline)}',
+             'SUMMARY:' + _ics_text(f'{row.name} ({row.course_name})')]
+    if row.completion_date:
+        lines.append('STATUS:CONFIRMED')
+        lines.append('DESCRIPTION:' + _ics_text(f'Completed {row.completion_date:%Y-%m-%d %H:%M}'))
+    return lines
+
+
+def _study_time_event(row):
+    return [f'UID:studytime-{row.id}@webapp',
+            f'DTSTART:{_ics_time(datetime.combine(row.date, row.start_time))}',
+            f'DTEND:{_ics_time(datetime.combine(row.date, row.end_time))}',
+            'SUMMARY:' + _ics_text(f'Study: {row.course_name}')]
+
+
+### CSV ###
+
+class _Line:
+    # csv.writer writes into this and gets the line back, so every row is formatted without a growing buffer
+    def write(self, value):
+        return value
+
+
+def _csv(header, batches):
+    writer = csv.writer(_Line())
+    yield writer.writerow(header)
+    for batch in batches:
+        yield ''.join(writer.writerow(row) for row in batch)
+
+
+### queries ###
+
+def _assignment_rows(user_id):
+    return (select(Assignment.id, Assignment.name, Assignment.deadline, Assignment.completion_date,
+                   Course.code.label('course_code'), Course.name.label('course_name'))
+            .join(Assignment.course).where(Course.user_id == user_id, Assignment.archived == false())
+            .order_by(Assignment.deadline, Assignment.id))
+
+
+def _study_time_rows(user_id):
+    return (select(StudyTime.id, StudyTime.date, StudyTime.start_time, StudyTime.end_time,
+                   Course.code.label('course_code'), Course.name.label('course_name'))
+            .join(StudyTime.course).where(Course.user_id == user_id, StudyTime.archived == false())
+            .order_by(StudyTime.date, StudyTime.start_time, StudyTime.id))
+
+
+def _batches(statement, convert):
+    # yield_per streams the result from a server-side cursor (a named cursor on PostgreSQL) BATCH_SIZE rows at a time
+    result = db.session.execute(statement.execution_options(yield_per=BATCH_SIZE))
+    for partition in result.partitions():
+        yield [convert(row) for row in partition]
+
+
+EXPORTS = {
+    ('assignments', 'ics'): lambda user_id: _calendar('Deadlines', _batches(_assignment_rows(user_id), _assignment_event)),
+    ('assignments', 'csv'): lambda user_id: _csv(
+        ('id', 'course_code', 'course', 'name', 'deadline', 'completion_date'),
+        _batches(_assignment_rows(user_id), lambda r: (r.id, r.course_code, r.course_name, r.name, r.deadline.isoformat(),
+                                                       r.completion_date.isoformat() if r.completion_date else ''))),
+    ('studytimes', 'ics'): lambda user_id: _calendar('Study times', _batches(_study_time_rows(user_id), _study_time_event)),
+    ('studytimes', 'csv'): lambda user_id: _csv(
+        ('id', 'course_code', 'course', 'date', 'start_time', 'end_time'),
+        _batches(_study_time_rows(user_id), lambda r: (r.id, r.course_code, r.course_name, r.date.isoformat(),
+                                                       r.start_time.isoformat(), r.end_time.isoformat()))),
+}
+MIMETYPES = {'ics': 'text/calendar', 'csv': 'text/csv'}
+
+
+@export.route('/<any(assignments, studytimes):kind>.<any(ics, csv):extension>')
+def export_data(kind, extension):
+    user_id = _export_user_id()
+    version, modified = db.session.execute(
+        select(User.data_version, User.data_modified).where(User.id == user_id)).one_or_none() or abort(404)
+    response = Response(stream_with_context(EXPORTS[kind, extension](user_id)),
+                        mimetype=MIMETYPES[extension], headers={'Content-Disposition': f'inline; filename={kind}.{extension}'})
+    response.set_etag(f'{user_id}-{version}-{kind}.{extension}')
+    if modified:
+        response.last_modified = modified.replace(tzinfo=timezone.utc)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    # a 304 never starts the generator, so the rows are not even queried
+    return response.make_conditional(request)
@@ -0,0 +1,280 @@
+import hashlib
+import mimetypes
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+import click
+from flask import Request, current_app, send_file
+from flask.cli import AppGroup
+from sqlalchemy import case, delete, event, func, inspect, select, update
+from sqlalchemy.orm import Session
+
+from webapp import db
+from webapp.models import Blob, Resource
+
+# the files attached to the resources, content-addressed: a file is stored once under the SHA-256 of its content
+# (FILE_STORAGE/ab/cd/abcd..., relative to the instance folder) however many resources point to it, e.g. the same
+# slides uploaded by every student of a course; a blob row per file counts the resources pointing to it
+#   upload:   werkzeug writes the uploaded file to a temporary file next to the blobs, in chunks, hashing it on the way
+#             (UploadRequest), so a file is never held in memory; attach() links that file into place, without a copy
+#   download: send_file() of the blob, with its hash as the ETag, so Range requests (a PDF viewer jumping to a page,
+#             a resumed download) and If-None-Match are answered by werkzeug, and the body is sent with
+#             wsgi.file_wrapper (sendfile(2) under gunicorn) or X-Sendfile (USE_X_SENDFILE) behind a web server
+#   delete:   the reference counts follow the resources in the same transaction (the before_flush listener below; the
+#             bulk statements that bypass the session call release_resources themselves), and `flask files gc` removes
+#             the files nothing points to anymore
+# the count of a blob is changed before its file is put in place and the gc deletes the row before the file, both
+# holding the row's lock until they commit, so the gc never removes a file an upload has just counted on
+
+CHUNK_SIZE = 64 * 1024
+# the types a browser may show in the page, the others are always downloaded (an uploaded html file is not run)
+INLINE_TYPES = {'application/pdf', 'image/png', 'image/jpeg', 'image/gif', 'image/webp', 'text/plain'}
+
+
+def _utcnow():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def storage_dir(app):
+    return os.path.join(app.instance_path, app.config.get('FILE_STORAGE') or 'files')
+
+
+def blob_path(directory, sha256):
+    # two levels of folders, so none of them gets too many files
+    return os.path.join(directory, sha256[:2], sha256[2:4], sha256)
+
+
+def _upload_dir(directory):
+    path = os.path.join(directory, 'tmp')
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+### upload ###
+
+class UploadFile:
+    # a temporary file that hashes what is written to it; everything else is the file's
+    def __init__(self, file):
+        self.file = file
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data):
+        self.sha256.update(data)
+        self.size += len(data)
+        return self.file.write(data)
+
+    def __getattr__(self, name):
+        return getattr(self.file, name)
+
+    def __iter__(self):
+        return iter(self.file)
+
+
+def _upload_file(directory):
+    # removed when closed (werkzeug closes the uploaded files at the end of the request)
+    return UploadFile(tempfile.NamedTemporaryFile(dir=_upload_dir(directory), prefix='upload-'))
+
+
+class UploadRequest(Request):
+    # the request class of the app (see init_app): the files of a form go to FILE_STORAGE/tmp whatever their size,
+    # werkzeug's default keeps the small ones in memory and the others in the system's temporary folder
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return _upload_file(storage_dir(current_app))
+
+
+def _spool(stream, directory):
+    # the same for a stream that didn't come from an UploadRequest, copied in chunks
+    upload = _upload_file(directory)
+    for chunk in iter(lambda: stream.read(CHUNK_SIZE), b''):
+        upload.write(chunk)
+    return upload
+
+
+def attach(session, resource, upload):
+    # stores the uploaded file (a werkzeug FileStorage) and points the resource to it, replacing its file if it had one;
+    # in the session's transaction, the caller commits
+    directory = storage_dir(current_app)
+    stream = upload.stream if isinstance(upload.stream, UploadFile) else _spool(upload.stream, directory)
+    stream.flush()
+    resource.blob_sha256 = stream.sha256.hexdigest()
+    resource.size = stream.size
+    resource.filename = os.path.basename(upload.filename or 'file')[-255:]
+    resource.content_type = mimetypes.guess_type(resource.filename)[0] or upload.mimetype or 'application/octet-stream'
+    session.add(resource)
+    session.flush()  # counts the reference (see count_references), which locks the blob's row until the commit
+    path = blob_path(directory, resource.blob_sha256)
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        try:
+            os.link(stream.name, path)  # the temporary file becomes the blob
+        except FileExistsError:
+            pass  # the same content, put there by another upload
+    if stream is not upload.stream:
+        stream.close()
+
+
+### download ###
+
+def send_resource_file(resource):
+    response = send_file(blob_path(storage_dir(current_app), resource.blob_sha256), mimetype=resource.content_type,
+                         as_attachment=resource.content_type not in INLINE_TYPES, download_name=resource.filename,
+                         etag=resource.blob_sha256, conditional=True)
+    # the browser asks again every time (the resource may get another file) and gets a 304 while it's the same one
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    response.headers['X-Content-Type-Options'] = 'nosniff'
+    return response
+
+
+### reference counts ###
+
+def _insert(connection):
+    # the dialect's INSERT, for its ON CONFLICT; imported when used, like the dialect itself
+    if connection.dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert
+
+
+def acquire(connection, sha256, size, count=1):
+    # count more references to a blob, its row is made if it's new
+    statement = _insert(connection)(Blob).values(sha256=sha256, size=size, refcount=count, released=None)
+    connection.execute(statement.on_conflict_do_update(
+        index_elements=[Blob.sha256], set_={'refcount': Blob.refcount + statement.excluded.refcount, 'released': None}))
+
+
+def _released(refcount):
+    return case((refcount <= 0, _utcnow()), else_=None)
+
+
+def release(connection, counts):
+    # {sha256: references less}
+    for sha256, count in sorted(counts.items()):
+        connection.execute(update(Blob).where(Blob.sha256 == sha256).values(
+            refcount=Blob.refcount - count, released=_released(Blob.refcount - count)))
+
+
+def release_resources(connection, condition):
+    # before a bulk DELETE of the resources matching condition (e.g. Resource.course_id.in_(ids)): their blobs lose
+    # those references, in one statement whatever their number
+    # connection: a Connection or a Session
+    references = select(func.count()).where(Resource.blob_sha256 == Blob.sha256, condition).scalar_subquery()
+    connection.execute(update(Blob).where(Blob.sha256.in_(select(Resource.blob_sha256).where(condition))).values(
+        refcount=Blob.refcount - references, released=_released(Blob.refcount - references)))
+
+
+def _changed_references(session):
+    # {sha256: references more or less} of the resources the flush is about to add, change or delete, and the sizes
+    changes, sizes = {}, {}
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if not isinstance(obj, Resource):
+            continue
+        history = inspect(obj).attrs.blob_sha256.history
+        if obj in session.deleted:
+            added, removed = (), history.deleted or history.unchanged
+        else:
+            added, removed = history.added, history.deleted
+        for sha256 in added:
+            if sha256:
+                changes[sha256] = changes.get(sha256, 0) + 1
+                sizes[sha256] = obj.size
+        for sha256 in removed:
+            if sha256:
+                changes[sha256] = changes.get(sha256, 0) - 1
+    return {sha256: count for sha256, count in changes.items() if count}, sizes
+
+
+@event.listens_for(Session, 'before_flush')
+def count_references(session, flush_context, instances):
+    # before the flush, so a new resource's blob row is there when the resource's foreign key is checked
+    changes, sizes = _changed_references(session)
+    if changes:
+        connection = session.connection()
+        for sha256, count in sorted(changes.items()):  # the rows in the same order in every transaction
+            if count > 0:
+                acquire(connection, sha256, sizes[sha256], count)
+        release(connection, {sha256: -count for sha256, count in changes.items() if count < 0})
+
+
+### garbage collection ###
+
+def _stored_blobs(directory):
+    # (sha256, path) of the files in the storage
+    for parent, folders, names in os.walk(directory):
+        if parent == directory:
+            folders[:] = [folder for folder in folders if folder != 'tmp']
+        for name in names:
+            if len(name) == 64 and os.path.dirname(blob_path(directory, name)) == parent:
+                yield name, os.path.join(parent, name)
+
+
+def _claim_orphans(engine, directory, before):
+    # the files older than `before` without a blob row (their upload was rolled back) get a row with no references
+    files = {sha256: path for sha256, path in _stored_blobs(directory) if os.path.getmtime(path) < before}
+    claimed = 0
+    with engine.begin() as connection:
+        known = set()
+        hashes = list(files)
+        for i in range(0, len(hashes), 500):
+            known.update(connection.scalars(select(Blob.sha256).where(Blob.sha256.in_(hashes[i:i + 500]))))
+        insert = _insert(connection)
+        for sha256 in sorted(files.keys() - known):
+            released = datetime.fromtimestamp(os.path.getmtime(files[sha256]), timezone.utc).replace(tzinfo=None)
+            # nothing happens if an upload made the row in the meantime
+            claimed += connection.execute(insert(Blob).values(
+                sha256=sha256, size=os.path.getsize(files[sha256]), refcount=0, released=released,
+            ).on_conflict_do_nothing(index_elements=[Blob.sha256])).rowcount
+    return claimed
+
+
+def collect_garbage(app, grace=None):
+    # removes the files of the blobs that have had no references for `grace` seconds (FILE_GC_GRACE by default),
+    # the files without a row and the temporary files of the uploads as old; returns the numbers of each
+    directory = storage_dir(app)
+    grace = app.config.get('FILE_GC_GRACE', 3600) if grace is None else grace
+    engine = db.engine
+    orphans = _claim_orphans(engine, directory, time.time() - grace)
+    cutoff = _utcnow() - timedelta(seconds=grace)
+    with engine.connect() as connection:
+        candidates = connection.scalars(select(Blob.sha256).where(Blob.refcount <= 0, Blob.released < cutoff)).all()
+    removed = 0
+    for sha256 in candidates:
+        with engine.begin() as connection:
+            # the count is checked again: an upload that counted the blob since keeps it, one that comes now waits
+            # for this transaction and puts the file back after it
+            if connection.execute(delete(Blob).where(Blob.sha256 == sha256, Blob.refcount <= 0)).rowcount:
+                try:
+                    os.remove(blob_path(directory, sha256))
+                except FileNotFoundError:
+                    pass
+                removed += 1
+    temporary = 0
+    uploads = os.path.join(directory, 'tmp')
+    if os.path.isdir(uploads):
+        for entry in os.scandir(uploads):
+            if entry.is_file() and entry.stat().st_mtime < time.time() - grace:  # left by a worker that died
+                os.remove(entry.path)
+                temporary += 1
+    return {'removed': removed, 'orphans': orphans, 'temporary': temporary}
+
+
+def init_app(app):
+    app.request_class = UploadRequest
+
+
+### command line ###
+
+files_cli = AppGroup('files', help='Manage the files attached to the resources.')  # added to the app's commands by create_app
+
+
+@files_cli.command('gc')
+@click.option('--grace', type=int, default=None, help='Seconds a file stays after its last reference is gone (FILE_GC_GRACE).')
+def gc_command(grace):
+    # flask --app webapp files gc   (from cron)
+    result = collect_garbage(current_app, grace)
+    click.echo(f"{result['removed']} files removed, {result['orphans']} orphans found, "
+               f"{result['temporary']} temporary files removed.")
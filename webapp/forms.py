@@ -1,5 +1,10 @@
+from datetime import datetime, date, time
+
 from flask_wtf import FlaskForm
-from wtforms import StringField, PasswordField, SubmitField, BooleanField, DateTimeField, IntegerField, DateField, TimeField
+from flask_wtf.file import FileField, FileRequired, FileAllowed
+from werkzeug.datastructures import MultiDict
+from wtforms import StringField, PasswordField, SubmitField, BooleanField, DateTimeField, IntegerField, DateField, TimeField, SelectField
+from wtforms.fields.core import UnboundField
 from wtforms.validators import DataRequired, Length, Email, EqualTo, ValidationError
 from webapp.models import User
 from flask_login import current_user
@@ -56,7 +61,7 @@ class UpdateAccountForm(FlaskForm):
                 raise ValidationError('This email is taken! Please choose a different one.')
 
 class CreateCourseForm(FlaskForm):
-    id = StringField('Id', validators=[DataRequired()])
+    code = StringField('Code', validators=[DataRequired(), Length(max=60)])
     name=StringField('Name',validators=[DataRequired()])
     submit=SubmitField('Create')
 
@@ -71,7 +76,57 @@ class CreateStudyTimeForm(FlaskForm):
     end=TimeField('Finish Hour', format='%H:%M',validators=[DataRequired()])
     submit=SubmitField('Create')
 
+    def validate_end(self, end):
+        if self.start.data and end.data and end.data <= self.start.data:  # the overlaps with other study times are checked in scheduling.py
+            raise ValidationError('The study time has to end after it starts.')
+
 class CreateResourceForm(FlaskForm):
     name=StringField('Name',validators=[DataRequired()])
+    file=FileField('File')  # optional, replaces the resource's file on an update (see files.py)
     # assignment_id=IntegerField('Assignment ID')
     submit=SubmitField('Create')
+
+
+# validation of data that doesn't come from an html form (the JSON api, the csv import) with the same rules as the forms
+
+_ISO_PARSERS = ((TimeField, time.fromisoformat), (DateField, date.fromisoformat), (DateTimeField, datetime.fromisoformat))  # subclasses first
+
+
+def _form_format(unbound):
+    form_format = unbound.kwargs.get('format', '%Y-%m-%d %H:%M:%S')
+    return form_format[0] if isinstance(form_format, (list, tuple)) else form_format
+
+
+def _form_text(unbound, value):
+    # the text a browser would have sent for the value: dates and times can also be given as date/time objects
+    # or in ISO 8601 (2021-03-01T12:00)
+    if value is None:
+        return ''
+    if isinstance(unbound, UnboundField):
+        for field_class, parse in _ISO_PARSERS:
+            if issubclass(unbound.field_class, field_class):
+                if isinstance(value, (datetime, date, time)):
+                    return value.strftime(_form_format(unbound))
+                try:
+                    return parse(str(value)).strftime(_form_format(unbound))
+                except ValueError:
+                    break  # not ISO, the form checks its own format
+    return str(value)
+
+
+def validate_data(form_class, data, form=None):
+    # returns the validated form (read the converted values from form.<field>.data) and its errors ({} if there are none)
+    # a form returned by an earlier call can be passed back in to be reused, which is about twice as fast as a new one
+    formdata = MultiDict({name: _form_text(getattr(form_class, name, None), value) for name, value in data.items()})
+    if form is None:
+        form = form_class(formdata=formdata, meta={'csrf': False})
+    else:
+        form.process(formdata)
+    form.validate()
+    return form, form.errors
+
+
+class ImportForm(FlaskForm):
+    kind=SelectField('Import', choices=[('courses', 'Courses (code, name)'), ('assignments', 'Assignments (course, name, deadline)')])
+    file=FileField('CSV file', validators=[FileRequired(), FileAllowed(['csv', 'txt'], 'Only CSV files!')])
+    submit=SubmitField('Import')
@@ -0,0 +1,158 @@
+import csv
+import io
+import time
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import false, insert, select
+
+from webapp import db
+from webapp.forms import CreateCourseForm, CreateAssignmentForm, validate_data
+from webapp.models import User, Course, Assignment
+from webapp.search import index_records
+from webapp.versioning import bump_data_version
+
+# bulk import of courses and assignments from CSV, for the upload page (/import) and the command line (flask import ...)
+#   courses:      code,name               (code like in the new course form; files from before the codes have id,name)
+#   assignments:  course,name,deadline    (course is that code, deadline like in the form, 10-01-2021 12:00, or ISO 8601)
+# the file is read row by row and the valid rows are inserted in chunks, one multi-row INSERT and one commit per chunk,
+# so memory stays flat and a bad row only costs its own line in the report
+
+CHUNK_SIZE = 2000
+MAX_REPORTED_ERRORS = 1000  # the ones after that are only counted
+
+
+class ImportReport:
+    def __init__(self):
+        self.rows = 0
+        self.imported = 0
+        self.failed = 0
+        self.errors = []  # (line number, {field: [messages]})
+        self.file_error = None  # why the file could not be read to the end, if it couldn't
+        self.seconds = 0.0
+
+    def error(self, line, errors):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((line, errors))
+
+    def stop(self, line, reason):
+        self.file_error = f'{reason}, only its first {line} lines were read'
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.seconds if self.seconds else 0.0
+
+    def __str__(self):
+        return (f'{self.imported} of {self.rows} rows imported, {self.failed} failed, '
+                f'in {self.seconds:.2f} s ({self.rows_per_second:,.0f} rows/s)' + (f'; {self.file_error}' if self.file_error else ''))
+
+
+def _text(stream):
+    # uploads and files opened in binary mode are decoded on the fly (utf-8, with or without a byte order mark)
+    if isinstance(stream, io.TextIOBase):
+        return stream
+    return io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+
+
+def _user_courses(user_id, archived=True):
+    # code -> id of the user's courses (archived=False: not the archived ones, like api._owned_courses)
+    statement = select(Course.code, Course.id).where(Course.user_id == user_id)
+    if not archived:
+        statement = statement.where(Course.archived == false())
+    return dict(db.session.execute(statement).all())
+
+
+def _import(stream, user_id, model, check_row, chunk_size):
+    report = ImportReport()
+    started = time.perf_counter()
+    chunk = []
+
+    def flush():
+        if chunk:
+            ids = db.session.scalars(insert(model).returning(model.id), chunk).all()
+            index_records(db.session, model, ids)  # the bulk insert skips the search's mapper events
+            bump_data_version(db.session, user_ids=[user_id], course_ids=ids if model is Course else {row['course_id'] for row in chunk})
+            db.session.commit()
+            report.imported += len(chunk)
+            chunk.clear()
+
+    reader = csv.DictReader(_text(stream))
+    try:
+        for row in reader:
+            report.rows += 1
+            values, errors = check_row({key.strip().lower(): (value or '').strip() for key, value in row.items() if key})
+            if errors:
+                report.error(reader.line_num, errors)
+                continue
+            chunk.append(values)
+            if len(chunk) >= chunk_size:
+                flush()
+    except UnicodeDecodeError:
+        # a file saved in another encoding (Latin-1, UTF-16, ...): the rows before the first bytes that aren't UTF-8
+        # are imported like the earlier chunks already were, the report says where it stopped
+        report.stop(reader.line_num, 'the file is not UTF-8 text (save it as "CSV UTF-8")')
+    flush()
+    report.seconds = time.perf_counter() - started
+    return report
+
+
+def import_courses(stream, user_id, chunk_size=CHUNK_SIZE):
+    courses = _user_courses(user_id)
+    form = None
+
+    def check_row(row):
+        nonlocal form
+        if 'code' not in row and 'id' in row:
+            row['code'] = row.pop('id')
+        form, errors = validate_data(CreateCourseForm, row, form)
+        if errors:
+            return None, errors
+        if form.code.data in courses:
+            return None, {'code': ['This course already exists.']}
+        courses[form.code.data] = None  # also catches the same course twice in the file
+        return {'code': form.code.data, 'name': form.name.data, 'user_id': user_id}, None
+
+    return _import(stream, user_id, Course, check_row, chunk_size)
+
+
+def import_assignments(stream, user_id, chunk_size=CHUNK_SIZE):
+    courses = _user_courses(user_id, archived=False)  # nothing is added to an archived course
+    form = None
+
+    def check_row(row):
+        nonlocal form
+        form, errors = validate_data(CreateAssignmentForm, row, form)
+        course_id = courses.get(row.get('course', ''))
+        if course_id is None:
+            errors = dict(errors, course=['No such course.'])
+        if errors:
+            return None, errors
+        return {'name': form.name.data, 'deadline': form.deadline.data, 'course_id': course_id}, None
+
+    return _import(stream, user_id, Assignment, check_row, chunk_size)
+
+
+IMPORTERS = {'courses': import_courses, 'assignments': import_assignments}
+
+
+### command line ###
+
+import_cli = AppGroup('import', help='Import courses or assignments from a CSV file.')  # added to the app's commands by create_app
+
+
+@import_cli.command('csv')
+@click.argument('kind', type=click.Choice(sorted(IMPORTERS)))
+@click.argument('file', type=click.File('rb'))
+@click.option('--user', 'email', required=True, help='The email of the user the data is imported for.')
+def import_command(kind, file, email):
+    # flask --app webapp import csv assignments deadlines.csv --user iulia@gmail.com
+    user_id = db.session.scalar(select(User.id).where(User.email == email))
+    if user_id is None:
+        raise click.ClickException(f'No user with the email {email}.')
+    report = IMPORTERS[kind](file, user_id)
+    for line, errors in report.errors:
+        click.echo(f'line {line}: ' + '; '.join(f'{field}: {" ".join(messages)}' for field, messages in errors.items()), err=True)
+    click.echo(str(report))
+    if report.file_error:
+        raise click.ClickException(report.file_error)
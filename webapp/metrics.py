@@ -0,0 +1,284 @@
+import logging
+import sys
+import threading
+import time
+import traceback
+from bisect import bisect_left
+from collections import Counter, defaultdict
+
+from flask import Blueprint, Response, abort, before_render_template, current_app, g, has_app_context, request, template_rendered
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from webapp import pages, passwords, rate_limiter, user_cache
+
+# request instrumentation, exported in the Prometheus text format at /metrics:
+#   webapp_request_duration_seconds{endpoint,method}   latency histogram of every view (by endpoint, not by url)
+#   webapp_requests_total{endpoint,method,status}
+#   webapp_request_sql_statements{endpoint}            histogram of the number of SQL statements per request
+#   webapp_sql_duration_seconds_total{endpoint}        time spent in the database, with webapp_sql_statements_total
+#   webapp_template_render_seconds{template}
+#   webapp_password_hash_seconds{operation}            bcrypt, hashpw and checkpw (with the wait for the pool, see passwords.py)
+#   webapp_cache_hits_total / webapp_cache_misses_total{cache}
+#   webapp_rate_limit_checks_total{bucket,result}      the logins and registrations let through or limited (see ratelimit.py)
+# the numbers are kept per process: with several server workers every one of them has to be scraped (or use one worker
+# per container); METRICS_TOKEN, when set, has to be sent as a bearer token
+# requests slower than SLOW_REQUEST_MS are logged (the webapp.metrics logger) with their SQL statements and, if
+# SLOW_REQUEST_PROFILE is on, the stacks a sampling profiler saw most often while they ran
+
+logger = logging.getLogger(__name__)
+
+# the request hooks and /metrics, registered on the app by create_app
+instrumentation = Blueprint('metrics', __name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+BCRYPT_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+SLOW_LOG_STATEMENTS = 20  # the slowest statements of a slow request that go into the log
+SLOW_LOG_STACKS = 5
+
+
+### metric types ###
+
+def _labels(names, values):
+    if not names:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for value in values)
+    return '{' + ','.join(f'{name}="{value}"' for name, value in zip(names, escaped)) + '}'
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class CounterMetric:
+    def __init__(self, name, help, labels=()):
+        self.name, self.help, self.labels = name, help, tuple(labels)
+        self._values = defaultdict(float)
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] += amount
+
+    def value(self, *labels):
+        return self._values.get(labels, 0)
+
+    def collect(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        yield f'# HELP {self.name} {self.help}'
+        yield f'# TYPE {self.name} counter'
+        for labels, value in values:
+            yield f'{self.name}{_labels(self.labels, labels)} {_number(value)}'
+
+
+class HistogramMetric:
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name, self.help, self.labels = name, help, tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {}  # labels -> [count per bucket (the last one is +Inf), sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][bisect_left(self.buckets, value)] += 1
+            series[1] += value
+
+    def count(self, *labels):
+        series = self._series.get(labels)
+        return sum(series[0]) if series else 0
+
+    def collect(self):
+        with self._lock:
+            series = sorted((labels, (list(counts), total)) for labels, (counts, total) in self._series.items())
+        yield f'# HELP {self.name} {self.help}'
+        yield f'# TYPE {self.name} histogram'
+        for labels, (counts, total) in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += count
+                yield f'{self.name}_bucket{_labels(self.labels + ("le",), labels + (_number(bound),))} {cumulative}'
+            yield f'{self.name}_sum{_labels(self.labels, labels)} {_number(total)}'
+            yield f'{self.name}_count{_labels(self.labels, labels)} {cumulative}'
+
+
+REQUEST_DURATION = HistogramMetric('webapp_request_duration_seconds', 'Time to handle a request.', ('endpoint', 'method'))
+REQUESTS = CounterMetric('webapp_requests_total', 'Requests handled.', ('endpoint', 'method', 'status'))
+REQUEST_SQL = HistogramMetric('webapp_request_sql_statements', 'SQL statements run by a request.', ('endpoint',), COUNT_BUCKETS)
+SQL_STATEMENTS = CounterMetric('webapp_sql_statements_total', 'SQL statements run by requests.', ('endpoint',))
+SQL_DURATION = CounterMetric('webapp_sql_duration_seconds_total', 'Time requests spent waiting for SQL statements.', ('endpoint',))
+TEMPLATE_DURATION = HistogramMetric('webapp_template_render_seconds', 'Time to render a template.', ('template',))
+PASSWORD_HASH_DURATION = HistogramMetric('webapp_password_hash_seconds', 'Time of a bcrypt hash or check.', ('operation',),
+                                         BCRYPT_BUCKETS)
+RATE_LIMIT_CHECKS = CounterMetric('webapp_rate_limit_checks_total', 'Rate limit checks by bucket, allowed or limited.',
+                                  ('bucket', 'result'))
+METRICS = [REQUEST_DURATION, REQUESTS, REQUEST_SQL, SQL_STATEMENTS, SQL_DURATION, TEMPLATE_DURATION, PASSWORD_HASH_DURATION,
+           RATE_LIMIT_CHECKS]
+
+
+def _cache_metrics():
+    # read from the caches when scraped
+    page_stats = pages.stats()
+    caches = {'pages': (page_stats['hits'], page_stats['misses']), 'users': (user_cache.hits, user_cache.misses)}
+    for kind, position in (('hits', 0), ('misses', 1)):
+        yield f'# HELP webapp_cache_{kind}_total Cache {kind}.'
+        yield f'# TYPE webapp_cache_{kind}_total counter'
+        for cache, values in caches.items():
+            yield f'webapp_cache_{kind}_total{_labels(("cache",), (cache,))} {values[position]}'
+
+
+def exposition():
+    lines = [line for metric in METRICS for line in metric.collect()]
+    lines.extend(_cache_metrics())
+    return '\n'.join(lines) + '\n'
+
+
+def reset():
+    for metric in METRICS:
+        with metric._lock:
+            (metric._values if isinstance(metric, CounterMetric) else metric._series).clear()
+
+
+### sampling profiler ###
+
+class StackSampler:
+    # one thread samples the stacks of the threads that are handling a request, every `interval` seconds, while there are any
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self._samples = {}  # thread id -> Counter of stacks
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self, thread_id):
+        with self._lock:
+            self._samples[thread_id] = Counter()
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+                self._thread.start()
+
+    def stop(self, thread_id):
+        with self._lock:
+            return self._samples.pop(thread_id, Counter())
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                if not self._samples:
+                    self._thread = None
+                    return
+                frames = sys._current_frames()
+                for thread_id, samples in self._samples.items():
+                    frame = frames.get(thread_id)
+                    if frame is not None:
+                        samples[''.join(traceback.format_stack(frame, limit=12))] += 1
+
+
+sampler = StackSampler()
+
+
+### request hooks ###
+
+@instrumentation.before_app_request
+def start_request():
+    g.metrics = {'started': time.perf_counter(), 'statements': 0, 'sql_seconds': 0.0, 'log': [], 'status': 500}
+    if current_app.config.get('SLOW_REQUEST_MS') and current_app.config.get('SLOW_REQUEST_PROFILE'):
+        sampler.start(threading.get_ident())
+
+
+@instrumentation.after_app_request
+def record_status(response):
+    if 'metrics' in g:
+        g.metrics['status'] = response.status_code
+    return response
+
+
+@instrumentation.teardown_app_request
+def finish_request(error=None):
+    state = g.pop('metrics', None)
+    if state is None:
+        return
+    seconds = time.perf_counter() - state['started']
+    endpoint = request.endpoint or 'unmatched'  # 404s are not labelled by url, there would be no end to them
+    REQUEST_DURATION.observe(seconds, endpoint, request.method)
+    REQUESTS.inc(endpoint, request.method, str(state['status']))
+    REQUEST_SQL.observe(state['statements'], endpoint)
+    SQL_STATEMENTS.inc(endpoint, amount=state['statements'])
+    SQL_DURATION.inc(endpoint, amount=state['sql_seconds'])
+    stacks = sampler.stop(threading.get_ident()) if current_app.config.get('SLOW_REQUEST_PROFILE') else None
+    threshold = current_app.config.get('SLOW_REQUEST_MS')
+    if threshold and seconds * 1000 >= threshold:
+        _log_slow_request(endpoint, seconds, state, stacks)
+
+
+def _log_slow_request(endpoint, seconds, state, stacks):
+    lines = [f'Slow request: {request.method} {request.full_path.rstrip("?")} ({endpoint}) took {seconds * 1000:.0f} ms, '
+             f'{state["statements"]} SQL statements in {state["sql_seconds"] * 1000:.0f} ms']
+    for statement_seconds, statement in sorted(state['log'], key=lambda entry: -entry[0])[:SLOW_LOG_STATEMENTS]:
+        lines.append(f'  {statement_seconds * 1000:8.2f} ms  {" ".join(statement.split())}')
+    if stacks:
+        total = sum(stacks.values())
+        for stack, samples in stacks.most_common(SLOW_LOG_STACKS):
+            lines.append(f'  {samples} of {total} samples in:\n' + stack.rstrip())
+    logger.warning('\n'.join(lines))
+
+
+def _request_state():
+    return g.get('metrics') if has_app_context() else None
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_statement(connection, cursor, statement, parameters, context, executemany):
+    connection.info.setdefault('metrics_started', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_statement(connection, cursor, statement, parameters, context, executemany):
+    started = connection.info.get('metrics_started')
+    if not started:
+        return
+    seconds = time.perf_counter() - started.pop()
+    state = _request_state()
+    if state is not None:
+        state['statements'] += 1
+        state['sql_seconds'] += seconds
+        if current_app.config.get('SLOW_REQUEST_MS'):
+            state['log'].append((seconds, statement))
+
+
+@event.listens_for(Engine, 'handle_error')
+def _failed_statement(context):
+    started = context.connection.info.get('metrics_started') if context.connection is not None else None
+    if started:
+        started.pop()
+
+
+@before_render_template.connect
+def _before_render(sender, template, context, **extra):
+    if has_app_context():
+        g.setdefault('template_started', []).append(time.perf_counter())
+
+
+@template_rendered.connect
+def _after_render(sender, template, context, **extra):
+    started = g.get('template_started') if has_app_context() else None
+    if started:
+        TEMPLATE_DURATION.observe(time.perf_counter() - started.pop(), template.name or 'string')
+
+
+passwords.listeners.append(lambda operation, seconds: PASSWORD_HASH_DURATION.observe(seconds, operation))
+rate_limiter.listeners.append(lambda bucket, allowed: RATE_LIMIT_CHECKS.inc(bucket, 'allowed' if allowed else 'limited'))
+
+
+### the endpoint ###
+
+@instrumentation.route('/metrics')
+def metrics():
+    token = current_app.config.get('METRICS_TOKEN')
+    if token and request.headers.get('Authorization') != f'Bearer {token}':
+        abort(401)
+    return Response(exposition(), mimetype='text/plain; version=0.0.4')
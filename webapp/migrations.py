@@ -0,0 +1,504 @@
+import logging
+from contextlib import contextmanager
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import inspect, text
+from webapp import db
+from webapp import models  # the metadata has to know every table before a new database is created
+
+# versioned schema migrations
+# the schema version of a database is stored in the schema_version table, `flask db upgrade` runs the migrations
+# newer than it, in order, each one in its own transaction (so a failed migration leaves the database as it was)
+# a new database is created straight from the models and stamped with the latest version
+# a migration must only use SQL, never the models: they describe the newest schema, not the one the migration starts from
+
+MIGRATIONS = []  # (version, function) pairs, sorted by version
+logger = logging.getLogger(__name__)
+
+
+def migration(version):
+    # decorator that registers a function taking a connection as the migration to the given version
+    def register(function):
+        MIGRATIONS.append((version, function))
+        MIGRATIONS.sort(key=lambda item: item[0])
+        return function
+    return register
+
+
+def latest_version():
+    return MIGRATIONS[-1][0] if MIGRATIONS else 0
+
+
+def current_version(connection):
+    # None if the database has never been migrated
+    if not inspect(connection).has_table('schema_version'):
+        return None
+    return connection.execute(text('SELECT version FROM schema_version')).scalar() or 0
+
+
+def _stamp(connection, version):
+    connection.execute(text('DELETE FROM schema_version'))
+    connection.execute(text('INSERT INTO schema_version (version) VALUES (:version)'), {'version': version})
+
+
+@contextmanager
+def _transaction(engine):
+    if engine.dialect.name == 'sqlite':
+        # the sqlite3 driver only opens a transaction before INSERT/UPDATE/DELETE, not before CREATE/DROP/ALTER,
+        # so the transaction is opened by hand to make the DDL of a migration atomic as well
+        with engine.connect() as connection:
+            connection = connection.execution_options(isolation_level='AUTOCOMMIT')
+            connection.exec_driver_sql('BEGIN')
+            try:
+                yield connection
+            except BaseException:
+                connection.exec_driver_sql('ROLLBACK')
+                raise
+            connection.exec_driver_sql('COMMIT')
+    else:
+        with engine.begin() as connection:
+            yield connection
+
+
+def upgrade(engine=None):
+    # bring the database up to the latest version, returns the versions that were applied
+    engine = engine or db.engine
+    with _transaction(engine) as connection:
+        tables = inspect(connection).get_table_names()
+        if 'schema_version' not in tables:
+            connection.execute(text('CREATE TABLE schema_version (version INTEGER NOT NULL)'))
+            if 'user' not in tables:  # a new database
+                db.metadata.create_all(connection)
+                _stamp(connection, latest_version())
+                return []
+            _stamp(connection, 0)  # a database created before the migrations existed
+    applied = []
+    for version, function in MIGRATIONS:
+        with _transaction(engine) as connection:
+            if version <= current_version(connection):
+                continue
+            function(connection)
+            _stamp(connection, version)
+        applied.append(version)
+    return applied
+
+
+def _rebuild_sqlite_table(connection, table, create_sql, columns):
+    # SQLite can't change the type of a column, so the table is copied into a new one with the right definition
+    # (the procedure from https://www.sqlite.org/lang_altertable.html#otheralter)
+    connection.exec_driver_sql(create_sql.format(table=table + '_new'))
+    connection.exec_driver_sql(f'INSERT INTO {table}_new ({", ".join(name for name, _ in columns)}) '
+                               f'SELECT {", ".join(expression for _, expression in columns)} FROM {table}')
+    connection.exec_driver_sql(f'DROP TABLE {table}')
+    connection.exec_driver_sql(f'ALTER TABLE {table}_new RENAME TO {table}')
+
+
+@migration(1)
+def course_foreign_keys_and_indexes(connection):
+    # the course_id of the children was an INTEGER pointing at the VARCHAR course.id,
+    # and none of the per-user / per-course listings had an index
+    if connection.dialect.name == 'sqlite':
+        _rebuild_sqlite_table(connection, 'assignment', '''CREATE TABLE {table} (
+            id INTEGER NOT NULL,
+            name VARCHAR(255) NOT NULL,
+            deadline DATETIME NOT NULL,
+            completion_date DATETIME,
+            course_id VARCHAR(60) NOT NULL,
+            PRIMARY KEY (id),
+            FOREIGN KEY(course_id) REFERENCES course (id))''',
+            [('id', 'id'), ('name', 'name'), ('deadline', 'deadline'), ('completion_date', 'completion_date'),
+             ('course_id', 'CAST(course_id AS TEXT)')])
+        _rebuild_sqlite_table(connection, 'study_time', '''CREATE TABLE {table} (
+            id INTEGER NOT NULL,
+            date DATE NOT NULL,
+            start_time TIME NOT NULL,
+            end_time TIME NOT NULL,
+            course_id VARCHAR(60) NOT NULL,
+            PRIMARY KEY (id),
+            FOREIGN KEY(course_id) REFERENCES course (id))''',
+            [('id', 'id'), ('date', 'date'), ('start_time', 'start_time'), ('end_time', 'end_time'),
+             ('course_id', 'CAST(course_id AS TEXT)')])
+        _rebuild_sqlite_table(connection, 'resource', '''CREATE TABLE {table} (
+            id INTEGER NOT NULL,
+            name VARCHAR NOT NULL,
+            course_id VARCHAR(60) NOT NULL,
+            assignment_id INTEGER,
+            PRIMARY KEY (id),
+            FOREIGN KEY(course_id) REFERENCES course (id),
+            FOREIGN KEY(assignment_id) REFERENCES assignment (id))''',
+            [('id', 'id'), ('name', 'name'), ('course_id', 'CAST(course_id AS TEXT)'), ('assignment_id', 'assignment_id')])
+    else:
+        for table in ('assignment', 'study_time', 'resource'):
+            connection.exec_driver_sql(f'ALTER TABLE {table} ALTER COLUMN course_id TYPE VARCHAR(60)')
+    for statement in (
+            'CREATE INDEX IF NOT EXISTS ix_course_user_id_id ON course (user_id, id)',
+            'CREATE INDEX IF NOT EXISTS ix_assignment_course_id_deadline ON assignment (course_id, deadline, id)',
+            'CREATE INDEX IF NOT EXISTS ix_assignment_deadline ON assignment (deadline, id)',
+            'CREATE INDEX IF NOT EXISTS ix_study_time_course_id_date ON study_time (course_id, date, start_time, id)',
+            'CREATE INDEX IF NOT EXISTS ix_resource_course_id_id ON resource (course_id, id)',
+            'CREATE INDEX IF NOT EXISTS ix_resource_assignment_id ON resource (assignment_id)'):
+        connection.exec_driver_sql(statement)
+
+
+@migration(2)
+def user_data_version(connection):
+    connection.exec_driver_sql('ALTER TABLE "user" ADD COLUMN data_version INTEGER NOT NULL DEFAULT 0')
+    connection.exec_driver_sql('ALTER TABLE "user" ADD COLUMN data_modified DATETIME' if connection.dialect.name == 'sqlite'
+                               else 'ALTER TABLE "user" ADD COLUMN data_modified TIMESTAMP WITHOUT TIME ZONE')
+
+
+
+@migration(3)
+def study_day_rollup(connection):
+    # the study times added up per course and day, for the statistics (see analytics.py), filled from the existing study times
+    connection.exec_driver_sql('''CREATE TABLE study_day (
+        course_id VARCHAR(60) NOT NULL,
+        date DATE NOT NULL,
+        user_id INTEGER NOT NULL,
+        seconds INTEGER NOT NULL,
+        sessions INTEGER NOT NULL,
+        PRIMARY KEY (course_id, date),
+        FOREIGN KEY(course_id) REFERENCES course (id) ON DELETE CASCADE,
+        FOREIGN KEY(user_id) REFERENCES "user" (id))''')
+    connection.exec_driver_sql('CREATE INDEX ix_study_day_user_id_date ON study_day (user_id, date)')
+    if connection.dialect.name == 'sqlite':
+        seconds = 'CAST(round((julianday(s.end_time) - julianday(s.start_time)) * 86400) AS INTEGER)'
+    else:
+        seconds = 'CAST(EXTRACT(EPOCH FROM (s.end_time - s.start_time)) AS INTEGER)'
+    connection.exec_driver_sql(f'''INSERT INTO study_day (course_id, date, user_id, seconds, sessions)
+        SELECT s.course_id, s.date, c.user_id, sum(CASE WHEN s.end_time > s.start_time THEN {seconds} ELSE 0 END), count(*)
+        FROM study_time s JOIN course c ON c.id = s.course_id
+        WHERE c.user_id IS NOT NULL
+        GROUP BY s.course_id, s.date, c.user_id''')
+
+
+
+@migration(4)
+def study_time_interval_index(connection):
+    # the listing index of the study times gets end_time, so the overlap checks are answered from the index alone
+    connection.exec_driver_sql('DROP INDEX IF EXISTS ix_study_time_course_id_date')
+    connection.exec_driver_sql('CREATE INDEX ix_study_time_course_id_interval ON study_time (course_id, date, start_time, id, end_time)')
+
+
+
+@migration(5)
+def open_assignment_index(connection):
+    # a partial index of the assignments that are not completed, for the reminders
+    connection.exec_driver_sql('CREATE INDEX ix_assignment_open_deadline ON assignment (deadline, id) WHERE completion_date IS NULL')
+
+
+
+@migration(6)
+def search_index(connection):
+    # the full-text search (see search.py): the documents, their full-text index, and the existing records in it
+    connection.exec_driver_sql('''CREATE TABLE search_document (
+        id INTEGER NOT NULL,
+        kind VARCHAR(20) NOT NULL,
+        record_id VARCHAR(60) NOT NULL,
+        user_id INTEGER NOT NULL,
+        course_id VARCHAR(60) NOT NULL,
+        name TEXT NOT NULL,
+        PRIMARY KEY (id),
+        CONSTRAINT uq_search_document_kind_record_id UNIQUE (kind, record_id))''' if connection.dialect.name == 'sqlite' else
+        '''CREATE TABLE search_document (
+        id SERIAL NOT NULL,
+        kind VARCHAR(20) NOT NULL,
+        record_id VARCHAR(60) NOT NULL,
+        user_id INTEGER NOT NULL,
+        course_id VARCHAR(60) NOT NULL,
+        name TEXT NOT NULL,
+        PRIMARY KEY (id),
+        CONSTRAINT uq_search_document_kind_record_id UNIQUE (kind, record_id))''')
+    connection.exec_driver_sql('CREATE INDEX ix_search_document_user_id ON search_document (user_id)')
+    connection.exec_driver_sql('CREATE INDEX ix_search_document_course_id ON search_document (course_id)')
+    if connection.dialect.name == 'sqlite':
+        # search_terms is a function of the app's SQLite connections (search.py)
+        connection.exec_driver_sql("CREATE VIRTUAL TABLE search_index USING fts5(terms, content='', "
+                                   "tokenize='unicode61 remove_diacritics 2')")
+        connection.exec_driver_sql("CREATE TRIGGER search_document_insert AFTER INSERT ON search_document BEGIN "
+                                   "INSERT INTO search_index (rowid, terms) VALUES (new.id, search_terms(new.user_id, new.name)); END")
+        connection.exec_driver_sql("CREATE TRIGGER search_document_delete AFTER DELETE ON search_document BEGIN "
+                                   "INSERT INTO search_index (search_index, rowid, terms) "
+                                   "VALUES ('delete', old.id, search_terms(old.user_id, old.name)); END")
+        connection.exec_driver_sql("CREATE TRIGGER search_document_update AFTER UPDATE ON search_document BEGIN "
+                                   "INSERT INTO search_index (search_index, rowid, terms) "
+                                   "VALUES ('delete', old.id, search_terms(old.user_id, old.name)); "
+                                   "INSERT INTO search_index (rowid, terms) VALUES (new.id, search_terms(new.user_id, new.name)); END")
+    else:
+        connection.exec_driver_sql("ALTER TABLE search_document ADD COLUMN document tsvector "
+                                   "GENERATED ALWAYS AS (to_tsvector('simple', name)) STORED")
+        connection.exec_driver_sql('CREATE INDEX ix_search_document_document ON search_document USING gin (document)')
+    connection.exec_driver_sql('''INSERT INTO search_document (kind, record_id, user_id, course_id, name)
+        SELECT 'course', id, user_id, id, name FROM course WHERE user_id IS NOT NULL''')
+    for kind, table in (('assignment', 'assignment'), ('resource', 'resource')):
+        connection.exec_driver_sql(f'''INSERT INTO search_document (kind, record_id, user_id, course_id, name)
+            SELECT '{kind}', CAST(t.id AS VARCHAR(60)), c.user_id, t.course_id, t.name
+            FROM {table} t JOIN course c ON c.id = t.course_id WHERE c.user_id IS NOT NULL''')
+
+
+@migration(7)
+def course_data_version(connection):
+    # the version of every course, for the page cache (see pages.py); the existing courses start from their user's version
+    connection.exec_driver_sql('ALTER TABLE course ADD COLUMN data_version INTEGER NOT NULL DEFAULT 0')
+    connection.exec_driver_sql('UPDATE course SET data_version = (SELECT data_version FROM "user" WHERE "user".id = course.user_id) '
+                               'WHERE user_id IS NOT NULL')
+
+
+@migration(8)
+def archived_courses(connection):
+    # courses and everything in them can be archived (see courses.py); the listing indexes get the flag after their first column
+    for table in ('course', 'assignment', 'study_time', 'resource'):
+        connection.exec_driver_sql(f'ALTER TABLE {table} ADD COLUMN archived BOOLEAN NOT NULL DEFAULT false')
+    for old, new in (('ix_course_user_id_id', 'ix_course_user_id_archived_id ON course (user_id, archived, id)'),
+                     ('ix_assignment_course_id_deadline',
+                      'ix_assignment_course_id_archived_deadline ON assignment (course_id, archived, deadline, id)'),
+                     ('ix_study_time_course_id_interval',
+                      'ix_study_time_course_id_archived_interval ON study_time (course_id, archived, date, start_time, id, end_time)'),
+                     ('ix_resource_course_id_id', 'ix_resource_course_id_archived_id ON resource (course_id, archived, id)')):
+        connection.exec_driver_sql(f'DROP INDEX IF EXISTS {old}')
+        connection.exec_driver_sql(f'CREATE INDEX {new}')
+
+
+MIGRATION_BATCH = 10_000  # rows copied per statement by the migrations that rewrite whole tables
+
+
+def _course_keys(connection):
+    # course_key: the old VARCHAR id of every course -> its new INTEGER id and its code, which is the old id without the
+    # _<user id> the app used to append (unless that leaves two courses of a user with the same code)
+    connection.exec_driver_sql('CREATE TABLE course_key (old_id VARCHAR(60) NOT NULL PRIMARY KEY, new_id INTEGER NOT NULL, '
+                               'code VARCHAR(60) NOT NULL)')
+    courses = connection.exec_driver_sql('SELECT id, user_id FROM course ORDER BY id').all()
+    taken = {(user_id, course_id) for course_id, user_id in courses}
+    rows = []
+    for new_id, (course_id, user_id) in enumerate(courses, 1):
+        code, suffix = course_id, f'_{user_id}'
+        if user_id is not None and course_id.endswith(suffix) and (user_id, course_id[:-len(suffix)]) not in taken:
+            code = course_id[:-len(suffix)]
+            taken.add((user_id, code))
+        rows.append({'old_id': course_id, 'new_id': new_id, 'code': code})
+    for start in range(0, len(rows), MIGRATION_BATCH):
+        connection.execute(text('INSERT INTO course_key (old_id, new_id, code) VALUES (:old_id, :new_id, :code)'),
+                           rows[start:start + MIGRATION_BATCH])
+
+
+def _delete_orphans(connection):
+    # the assignments, study times, resources... of courses that no longer exist (delete_course used to leave them
+    # behind): their course_id can't become an INTEGER that points to a course, so they are deleted here, on purpose
+    # and logged, before the tables are copied (the copy joins course_key and would drop them without a word)
+    orphans = {}
+    for table in ('assignment', 'study_time', 'resource', 'study_day', 'search_document'):
+        condition = f'NOT EXISTS (SELECT 1 FROM course_key k WHERE k.old_id = {table}.course_id)'
+        count = connection.exec_driver_sql(f'SELECT count(*) FROM {table} WHERE {condition}').scalar()
+        if count:
+            connection.exec_driver_sql(f'DELETE FROM {table} WHERE {condition}')
+            orphans[table] = count
+    if orphans:
+        logger.warning('Deleted the rows of courses that no longer exist: %s',
+                       ', '.join(f'{count} from {table}' for table, count in orphans.items()))
+    return orphans
+
+
+def _copy_sqlite_table(connection, table, create_sql, columns):
+    # like _rebuild_sqlite_table, but the course id is looked up in course_key (as k) and the rows are copied
+    # MIGRATION_BATCH at a time, so a big table doesn't go through one huge statement; the old table is dropped by the caller
+    connection.exec_driver_sql(create_sql.format(table=table + '_new'))
+    last = connection.exec_driver_sql(f'SELECT max(rowid) FROM {table}').scalar() or 0
+    key = 't.id' if table == 'course' else 't.course_id'
+    for start in range(0, last, MIGRATION_BATCH):
+        connection.exec_driver_sql(
+            f'INSERT INTO {table}_new ({", ".join(name for name, _ in columns)}) '
+            f'SELECT {", ".join(expression for _, expression in columns)} FROM {table} t JOIN course_key k ON k.old_id = {key} '
+            f'WHERE t.rowid > {start} AND t.rowid <= {start + MIGRATION_BATCH}')
+
+
+def _course_surrogate_keys_sqlite(connection):
+    tables = {
+        'course': ('''CREATE TABLE {table} (
+            id INTEGER NOT NULL,
+            code VARCHAR(60) NOT NULL,
+            name VARCHAR(255) NOT NULL,
+            user_id INTEGER,
+            data_version INTEGER DEFAULT '0' NOT NULL,
+            archived BOOLEAN DEFAULT 0 NOT NULL,
+            PRIMARY KEY (id),
+            CONSTRAINT uq_course_user_id_code UNIQUE (user_id, code),
+            FOREIGN KEY(user_id) REFERENCES "user" (id))''',
+            [('id', 'k.new_id'), ('code', 'k.code'), ('name', 't.name'), ('user_id', 't.user_id'),
+             ('data_version', 't.data_version'), ('archived', 't.archived')]),
+        'assignment': ('''CREATE TABLE {table} (
+            id INTEGER NOT NULL,
+            name VARCHAR(255) NOT NULL,
+            deadline DATETIME NOT NULL,
+            completion_date DATETIME,
+            course_id INTEGER NOT NULL,
+            archived BOOLEAN DEFAULT 0 NOT NULL,
+            PRIMARY KEY (id),
+            FOREIGN KEY(course_id) REFERENCES course (id))''',
+            [('id', 't.id'), ('name', 't.name'), ('deadline', 't.deadline'), ('completion_date', 't.completion_date'),
+             ('course_id', 'k.new_id'), ('archived', 't.archived')]),
+        'study_time': ('''CREATE TABLE {table} (
+            id INTEGER NOT NULL,
+            date DATE NOT NULL,
+            start_time TIME NOT NULL,
+            end_time TIME NOT NULL,
+            course_id INTEGER NOT NULL,
+            archived BOOLEAN DEFAULT 0 NOT NULL,
+            PRIMARY KEY (id),
+            FOREIGN KEY(course_id) REFERENCES course (id))''',
+            [('id', 't.id'), ('date', 't.date'), ('start_time', 't.start_time'), ('end_time', 't.end_time'),
+             ('course_id', 'k.new_id'), ('archived', 't.archived')]),
+        'resource': ('''CREATE TABLE {table} (
+            id INTEGER NOT NULL,
+            name VARCHAR NOT NULL,
+            course_id INTEGER NOT NULL,
+            assignment_id INTEGER,
+            archived BOOLEAN DEFAULT 0 NOT NULL,
+            PRIMARY KEY (id),
+            FOREIGN KEY(course_id) REFERENCES course (id),
+            FOREIGN KEY(assignment_id) REFERENCES assignment (id))''',
+            [('id', 't.id'), ('name', 't.name'), ('course_id', 'k.new_id'), ('assignment_id', 't.assignment_id'),
+             ('archived', 't.archived')]),
+        'study_day': ('''CREATE TABLE {table} (
+            course_id INTEGER NOT NULL,
+            date DATE NOT NULL,
+            user_id INTEGER NOT NULL,
+            seconds INTEGER NOT NULL,
+            sessions INTEGER NOT NULL,
+            PRIMARY KEY (course_id, date),
+            FOREIGN KEY(course_id) REFERENCES course (id) ON DELETE CASCADE,
+            FOREIGN KEY(user_id) REFERENCES "user" (id))''',
+            [('course_id', 'k.new_id'), ('date', 't.date'), ('user_id', 't.user_id'), ('seconds', 't.seconds'),
+             ('sessions', 't.sessions')]),
+        # the documents keep their ids, which are the rowids of the full-text index, so the index itself stays as it is
+        'search_document': ('''CREATE TABLE {table} (
+            id INTEGER NOT NULL,
+            kind VARCHAR(20) NOT NULL,
+            record_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            course_id INTEGER NOT NULL,
+            name TEXT NOT NULL,
+            PRIMARY KEY (id),
+            CONSTRAINT uq_search_document_kind_record_id UNIQUE (kind, record_id))''',
+            [('id', 't.id'), ('kind', 't.kind'),
+             ('record_id', "CASE WHEN t.kind = 'course' THEN k.new_id ELSE CAST(t.record_id AS INTEGER) END"),
+             ('user_id', 't.user_id'), ('course_id', 'k.new_id'), ('name', 't.name')]),
+    }
+    for table, (create_sql, columns) in tables.items():
+        _copy_sqlite_table(connection, table, create_sql, columns)
+    for table in tables:
+        connection.exec_driver_sql(f'DROP TABLE {table}')
+        connection.exec_driver_sql(f'ALTER TABLE {table}_new RENAME TO {table}')
+    # the triggers that keep the full-text index in step went with the old search_document (same as migration 6)
+    connection.exec_driver_sql("CREATE TRIGGER search_document_insert AFTER INSERT ON search_document BEGIN "
+                               "INSERT INTO search_index (rowid, terms) VALUES (new.id, search_terms(new.user_id, new.name)); END")
+    connection.exec_driver_sql("CREATE TRIGGER search_document_delete AFTER DELETE ON search_document BEGIN "
+                               "INSERT INTO search_index (search_index, rowid, terms) "
+                               "VALUES ('delete', old.id, search_terms(old.user_id, old.name)); END")
+    connection.exec_driver_sql("CREATE TRIGGER search_document_update AFTER UPDATE ON search_document BEGIN "
+                               "INSERT INTO search_index (search_index, rowid, terms) "
+                               "VALUES ('delete', old.id, search_terms(old.user_id, old.name)); "
+                               "INSERT INTO search_index (rowid, terms) VALUES (new.id, search_terms(new.user_id, new.name)); END")
+
+
+def _course_surrogate_keys_postgresql(connection):
+    # the new columns are filled next to the old ones, MIGRATION_BATCH rows at a time, then take their place
+    # (dropping the old columns drops the keys and the indexes on them as well)
+    connection.exec_driver_sql('ALTER TABLE course ADD COLUMN new_id INTEGER, ADD COLUMN code VARCHAR(60)')
+    connection.exec_driver_sql('UPDATE course SET new_id = k.new_id, code = k.code FROM course_key k WHERE k.old_id = course.id')
+    for table in ('assignment', 'study_time', 'resource', 'search_document'):
+        connection.exec_driver_sql(f'ALTER TABLE {table} ADD COLUMN new_course_id INTEGER')
+        last = connection.exec_driver_sql(f'SELECT max(id) FROM {table}').scalar() or 0
+        for start in range(0, last, MIGRATION_BATCH):
+            connection.exec_driver_sql(f'UPDATE {table} SET new_course_id = k.new_id FROM course_key k '
+                                       f'WHERE k.old_id = {table}.course_id AND {table}.id > {start} AND {table}.id <= {start + MIGRATION_BATCH}')
+    connection.exec_driver_sql('ALTER TABLE study_day ADD COLUMN new_course_id INTEGER')
+    connection.exec_driver_sql('UPDATE study_day SET new_course_id = k.new_id FROM course_key k WHERE k.old_id = study_day.course_id')
+    connection.exec_driver_sql("UPDATE search_document SET record_id = CAST(new_course_id AS VARCHAR) WHERE kind = 'course'")
+    connection.exec_driver_sql('ALTER TABLE search_document ALTER COLUMN record_id TYPE INTEGER USING CAST(record_id AS INTEGER)')
+    for table in ('assignment', 'study_time', 'resource', 'study_day', 'search_document'):
+        connection.exec_driver_sql(f'ALTER TABLE {table} DROP COLUMN course_id CASCADE')
+        connection.exec_driver_sql(f'ALTER TABLE {table} RENAME COLUMN new_course_id TO course_id')
+        connection.exec_driver_sql(f'ALTER TABLE {table} ALTER COLUMN course_id SET NOT NULL')
+    connection.exec_driver_sql('ALTER TABLE course DROP COLUMN id CASCADE')
+    connection.exec_driver_sql('ALTER TABLE course RENAME COLUMN new_id TO id')
+    connection.exec_driver_sql('ALTER TABLE course ALTER COLUMN id SET NOT NULL, ALTER COLUMN code SET NOT NULL, ADD PRIMARY KEY (id), '
+                               'ADD CONSTRAINT uq_course_user_id_code UNIQUE (user_id, code)')
+    connection.exec_driver_sql('CREATE SEQUENCE course_id_seq OWNED BY course.id')
+    connection.exec_driver_sql("SELECT setval('course_id_seq', (SELECT coalesce(max(id), 0) + 1 FROM course), false)")
+    connection.exec_driver_sql("ALTER TABLE course ALTER COLUMN id SET DEFAULT nextval('course_id_seq')")
+    for table in ('assignment', 'study_time', 'resource'):
+        connection.exec_driver_sql(f'ALTER TABLE {table} ADD FOREIGN KEY (course_id) REFERENCES course (id)')
+    connection.exec_driver_sql('ALTER TABLE study_day ADD PRIMARY KEY (course_id, date), '
+                               'ADD FOREIGN KEY (course_id) REFERENCES course (id) ON DELETE CASCADE')
+
+
+@migration(9)
+def course_surrogate_keys(connection):
+    # course.id was the code the user typed with _<user id> appended, and changing the code rewrote the primary key and
+    # every row that pointed to it; now it's an INTEGER that never changes and the code is a column of its own
+    _course_keys(connection)
+    _delete_orphans(connection)
+    if connection.dialect.name == 'sqlite':
+        _course_surrogate_keys_sqlite(connection)
+    else:
+        _course_surrogate_keys_postgresql(connection)
+    # the indexes went with the old tables (SQLite) or the old columns (PostgreSQL)
+    for index in ('ix_course_user_id_archived_id ON course (user_id, archived, id)',
+                  'ix_assignment_course_id_archived_deadline ON assignment (course_id, archived, deadline, id)',
+                  'ix_assignment_deadline ON assignment (deadline, id)',
+                  'ix_assignment_open_deadline ON assignment (deadline, id) WHERE completion_date IS NULL',
+                  'ix_study_time_course_id_archived_interval ON study_time (course_id, archived, date, start_time, id, end_time)',
+                  'ix_resource_course_id_archived_id ON resource (course_id, archived, id)',
+                  'ix_resource_assignment_id ON resource (assignment_id)',
+                  'ix_study_day_user_id_date ON study_day (user_id, date)',
+                  'ix_search_document_user_id ON search_document (user_id)',
+                  'ix_search_document_course_id ON search_document (course_id)'):
+        connection.exec_driver_sql(f'CREATE INDEX IF NOT EXISTS {index}')
+    connection.exec_driver_sql('DROP TABLE course_key')
+
+
+@migration(10)
+def resource_files(connection):
+    # the files attached to the resources, stored once per content (see files.py)
+    timestamp = 'DATETIME' if connection.dialect.name == 'sqlite' else 'TIMESTAMP WITHOUT TIME ZONE'
+    connection.exec_driver_sql(f'''CREATE TABLE blob (
+        sha256 VARCHAR(64) NOT NULL,
+        size BIGINT NOT NULL,
+        refcount INTEGER NOT NULL,
+        released {timestamp},
+        PRIMARY KEY (sha256))''')
+    connection.exec_driver_sql('ALTER TABLE resource ADD COLUMN blob_sha256 VARCHAR(64) REFERENCES blob (sha256)')
+    connection.exec_driver_sql('ALTER TABLE resource ADD COLUMN filename VARCHAR(255)')
+    connection.exec_driver_sql('ALTER TABLE resource ADD COLUMN content_type VARCHAR(255)')
+    connection.exec_driver_sql('ALTER TABLE resource ADD COLUMN size BIGINT')
+    connection.exec_driver_sql('CREATE INDEX ix_resource_blob_sha256 ON resource (blob_sha256)')
+
+
+
+@migration(11)
+def insert_sentinels(connection):
+    # the column the bulk inserts of the api number their rows in, to get the new ids back in the order of the rows
+    for table in ('course', 'assignment', 'study_time', 'resource'):
+        connection.exec_driver_sql(f'ALTER TABLE {table} ADD COLUMN _sentinel INTEGER')
+
+
+### command line ###
+
+db_cli = AppGroup('db', help='Manage the database schema.')  # added to the app's commands by create_app
+
+
+@db_cli.command('upgrade')
+def upgrade_command():
+    # flask --app webapp db upgrade
+    applied = upgrade()
+    if applied:
+        click.echo('Applied migrations: ' + ', '.join(str(version) for version in applied))
+    click.echo(f'The database is at version {latest_version()}.')
+
+
+@db_cli.command('version')
+def version_command():
+    with db.engine.connect() as connection:
+        version = current_version(connection)
+    click.echo('The database has never been migrated.' if version is None else f'The database is at version {version}.')
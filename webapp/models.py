@@ -1,11 +1,30 @@
-from webapp import db, login_manager
+from webapp import db, login_manager, user_cache
 from datetime import datetime
 from flask_login import UserMixin
+from sqlalchemy import DDL, event
+from sqlalchemy.orm import make_transient_to_detached
+
+CACHED_USER_COLUMNS = ('id', 'username', 'email')  # the password hash is left out of the cache
 
 @login_manager.user_loader  # tells Flask-login how to load users given an id
 def load_user(user_id):
     # Given an user_id, it returns the associated User object
-    return User.query.get(int(user_id))
+    identity = user_cache.get(user_id)
+    if identity is None:
+        user = User.query.get(int(user_id))
+        if user:
+            user_cache.set(user_id, {column: getattr(user, column) for column in CACHED_USER_COLUMNS})
+        return user
+    # rebuild the user from the cache and attach it to the session as if it had been loaded, without a query
+    # (it behaves like a loaded user: changes to it are saved on commit, and its other attributes are loaded when used)
+    user = User(**identity)
+    make_transient_to_detached(user)
+    return db.session.merge(user, load=False)
+
+
+def forget_user(user_id):
+    # drop the cached identity, e.g. after the username or the email changed
+    user_cache.delete(str(user_id))
 
 
 class User(db.Model,UserMixin):  # UserMixin class provides the implementation of properties: is_authenticated(), is_active(), is_anonymous(), get_id()
@@ -14,6 +33,10 @@ class User(db.Model,UserMixin):  # UserMixin class provides the implementation o
     username=db.Column(db.String(20),unique=True,nullable=False)
     email = db.Column(db.String(120), unique=True, nullable=False)
     password=db.Column(db.String(60),nullable=False)
+    # bumped (see versioning.py) whenever one of the user's courses or anything in them changes,
+    # so that exports and caches can tell if they are still up to date without reading the data
+    data_version=db.Column(db.Integer,nullable=False,default=0,server_default='0')
+    data_modified=db.Column(db.DateTime)
     courses=db.relationship('Course',backref='user',lazy=True)
     # db.relationship return a new property, it point to Course, so it loads multiple courses in a list
     # backref is a way to declare a new property on the Course class; you can call course.user to get the user object
@@ -22,39 +45,118 @@ class User(db.Model,UserMixin):  # UserMixin class provides the implementation o
         return f"User('{self.username}','{self.email}')"
 
 class Course(db.Model):
-    id = db.Column(db.String(60), primary_key=True)
+    # the composite indexes match the sort keys of the paginated lists (see queries.py),
+    # so the database can seek straight to the cursor of a page instead of scanning the rows before it
+    # (their first column also serves the plain lookups by user_id / course_id)
+    # any change to the tables or indexes needs a migration in migrations.py, so that existing databases get it too
+    # archived is in them right after the user / course, so the lists (which leave the archived rows out) still seek to their page
+    __table_args__ = (db.UniqueConstraint('user_id', 'code', name='uq_course_user_id_code'),
+                      db.Index('ix_course_user_id_archived_id', 'user_id', 'archived', 'id'))
+    id = db.Column(db.Integer, primary_key=True)
+    # what the user typed in the new course form (e.g. MA2), unique among the user's courses; the urls of a course use it
+    # (it can change, the id never does, so nothing that points to the course has to be rewritten)
+    code = db.Column(db.String(60), nullable=False)
     name = db.Column(db.String(255), nullable=False)
     user_id=db.Column(db.Integer,db.ForeignKey('user.id'))
-    assignments=db.relationship('Assignment',backref='course',lazy=True)
-    study_times = db.relationship('StudyTime', backref='course', lazy=True)
-    resources=db.relationship('Resource',backref='course',lazy=True)
+    # the user's data_version of the last change to the course or anything in it (see versioning.py),
+    # the rendered pages of the course are cached under it (see pages.py)
+    data_version=db.Column(db.Integer,nullable=False,default=0,server_default='0')
+    # an archived course and everything in it are kept but left out of the lists and the search (see courses.py)
+    archived=db.Column(db.Boolean,nullable=False,default=False,server_default=db.false())
+    # the position of the row in a bulk INSERT ... RETURNING (see api.py): SQLite gives no guarantee about the order of the
+    # ids it returns, SQLAlchemy matches them to the rows by it (NULL for the rows added one at a time)
+    _sentinel=db.insert_sentinel('_sentinel')
+    # order_by makes the database sort the children, whichever way they are loaded (lazy or selectin)
+    assignments=db.relationship('Assignment',backref='course',lazy=True,order_by='(Assignment.deadline, Assignment.id)')
+    study_times = db.relationship('StudyTime', backref='course', lazy=True,order_by='(StudyTime.date, StudyTime.start_time, StudyTime.id)')
+    resources=db.relationship('Resource',backref='course',lazy=True,order_by='Resource.id')
     def __repr__(self):
-        return f"Course('{self.id}','{self.name}')"
+        return f"Course('{self.code}','{self.name}')"
 
 
 class Assignment(db.Model):
+    __table_args__ = (db.Index('ix_assignment_course_id_archived_deadline', 'course_id', 'archived', 'deadline', 'id'),
+                      db.Index('ix_assignment_deadline', 'deadline', 'id'))
     id = db.Column(db.Integer, primary_key=True)
     name=db.Column(db.String(255),nullable=False)
     deadline=db.Column(db.DateTime,nullable=False)
     completion_date=db.Column(db.DateTime)
     course_id=db.Column(db.Integer, db.ForeignKey('course.id'), nullable=False)
+    archived=db.Column(db.Boolean,nullable=False,default=False,server_default=db.false())  # with its course
+    _sentinel=db.insert_sentinel('_sentinel')  # like Course._sentinel
     resources = db.relationship('Resource', backref='assignment', lazy=True)
     def __repr__(self):
         return f"Assignment('{self.name}','{self.course_id}','{self.deadline}')"
 
+# only the incomplete assignments, in the order their reminders are due (see reminders.py); created with the table in SQL
+# both SQLite and PostgreSQL take, as an Index with sqlite_where/postgresql_where SQLAlchemy would import its whole
+# PostgreSQL dialect in every process to check the argument
+event.listen(Assignment.__table__, 'after_create',
+             DDL('CREATE INDEX ix_assignment_open_deadline ON assignment (deadline, id) WHERE completion_date IS NULL'))
+
 
 class StudyTime(db.Model):
+    # end_time at the end makes the index cover the overlap checks too (see scheduling.py)
+    __table_args__ = (db.Index('ix_study_time_course_id_archived_interval', 'course_id', 'archived', 'date', 'start_time', 'id', 'end_time'),)
     id = db.Column(db.Integer, primary_key=True)
     date=db.Column(db.Date,nullable=False)
     start_time=db.Column(db.Time,nullable=False)
     end_time=db.Column(db.Time,nullable=False)
     course_id=db.Column(db.Integer, db.ForeignKey('course.id'), nullable=False)
+    archived=db.Column(db.Boolean,nullable=False,default=False,server_default=db.false())
+    _sentinel=db.insert_sentinel('_sentinel')  # like Course._sentinel
     def __repr__(self):
-        return f"StudyTime('{self.date}','{self.spent_time}','{self.course_id}')"
+        return f"StudyTime('{self.date}','{self.start_time}','{self.end_time}','{self.course_id}')"
+
+
+class StudyDay(db.Model):
+    # the study times of a course added up per day, so the statistics read one row per day instead of every study time
+    # it is kept up to date by analytics.py in the same transaction as the study times (never write to it directly)
+    __table_args__ = (db.Index('ix_study_day_user_id_date', 'user_id', 'date'),)
+    course_id=db.Column(db.Integer, db.ForeignKey('course.id', ondelete='CASCADE'), primary_key=True)
+    date=db.Column(db.Date, primary_key=True)
+    user_id=db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)  # the course's user, to sum up all the courses of a user
+    seconds=db.Column(db.Integer, nullable=False)  # the time studied that day
+    sessions=db.Column(db.Integer, nullable=False)  # the number of study times that day
+    def __repr__(self):
+        return f"StudyDay('{self.course_id}','{self.date}','{self.seconds}')"
 
 
 class Resource(db.Model):
+    __table_args__ = (db.Index('ix_resource_course_id_archived_id', 'course_id', 'archived', 'id'),
+                      db.Index('ix_resource_assignment_id', 'assignment_id'),
+                      db.Index('ix_resource_blob_sha256', 'blob_sha256'))
     id= db.Column(db.Integer, primary_key=True)
     name=db.Column(db.String,nullable=False)
     course_id = db.Column(db.Integer, db.ForeignKey('course.id'), nullable=False)
     assignment_id = db.Column(db.Integer, db.ForeignKey('assignment.id'))
+    archived = db.Column(db.Boolean, nullable=False, default=False, server_default=db.false())
+    # the attached file, if any: its content is a Blob, the name and the type are the ones it was uploaded with (see files.py)
+    blob_sha256 = db.Column(db.String(64), db.ForeignKey('blob.sha256'))
+    filename = db.Column(db.String(255))
+    content_type = db.Column(db.String(255))
+    size = db.Column(db.BigInteger)
+    _sentinel = db.insert_sentinel('_sentinel')  # like Course._sentinel
+
+
+class Blob(db.Model):
+    # the content of the attached files, stored once on disk under its SHA-256 however many resources point to it (see files.py)
+    # refcount is the number of resources pointing to it, the file is removed by `flask files gc` once it dropped to 0
+    sha256 = db.Column(db.String(64), primary_key=True)
+    size = db.Column(db.BigInteger, nullable=False)
+    refcount = db.Column(db.Integer, nullable=False, default=0)
+    released = db.Column(db.DateTime)  # when refcount dropped to 0
+
+
+class SearchDocument(db.Model):
+    # the names of the courses, assignments and resources, one row per record, for the full-text search (see search.py)
+    # kept up to date by search.py, the full-text index over it (FTS5 on SQLite, a tsvector on PostgreSQL) follows by itself
+    __table_args__ = (db.UniqueConstraint('kind', 'record_id', name='uq_search_document_kind_record_id'),
+                      db.Index('ix_search_document_user_id', 'user_id'),
+                      db.Index('ix_search_document_course_id', 'course_id'))
+    id=db.Column(db.Integer, primary_key=True)
+    kind=db.Column(db.String(20), nullable=False)  # course, assignment or resource
+    record_id=db.Column(db.Integer, nullable=False)  # the id of the record
+    user_id=db.Column(db.Integer, nullable=False)
+    course_id=db.Column(db.Integer, nullable=False)
+    name=db.Column(db.Text, nullable=False)
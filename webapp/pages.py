@@ -0,0 +1,84 @@
+import hashlib
+import threading
+from collections import Counter
+from functools import wraps
+from urllib.parse import urlencode
+
+from flask import Response, make_response, request, session
+from flask_login import current_user
+from sqlalchemy import select
+
+from webapp import db, page_cache
+from webapp.models import Course
+
+# a cache of the rendered course pages (the course, its assignments, study times and resources)
+# an entry is keyed by the page, the user, the course and the course's data_version (see versioning.py), so any change to the
+# course or to anything in it makes a new key and the old entries are never read again (the LRU evicts them in time):
+# nothing has to be deleted when the data changes, which also holds with a shared backend (PAGE_CACHE_BACKEND)
+# a hit costs a primary key lookup of the course's version instead of the page's queries and the templates;
+# the responses carry an ETag, so a browser that still has the page gets a 304 without a body
+# pages with flashed messages are rendered every time (a message is shown once) and never cached
+
+_counters = Counter()
+_lock = threading.Lock()
+
+
+def _count(name):
+    with _lock:
+        _counters[name] += 1
+
+
+def stats():
+    # the counters of this process: hits, misses, not_modified (304s) and bypassed (flashed messages)
+    with _lock:
+        return {name: _counters[name] for name in ('hits', 'misses', 'not_modified', 'bypassed')}
+
+
+def reset_stats():
+    with _lock:
+        _counters.clear()
+
+
+def _key(course_id, version):
+    arguments = urlencode(sorted(request.args.items(multi=True)))  # the page of a paginated list
+    return f'{request.endpoint}:{current_user.id}:{course_id}:{version}:{arguments}'
+
+
+def _response(entry, status):
+    etag, body, mimetype = entry
+    response = Response(body, mimetype=mimetype)
+    response.set_etag(etag)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True  # always revalidate, but keep the copy
+    response.headers['X-Cache'] = status
+    response = response.make_conditional(request)
+    if response.status_code == 304:
+        _count('not_modified')
+    return response
+
+
+def cached_page(view):
+    # for the views of a course's pages, after login_required: @cached_page
+    @wraps(view)
+    def wrapper(code, **kwargs):
+        if '_flashes' in session:
+            _count('bypassed')
+            return view(code=code, **kwargs)
+        # through the unique (user_id, code) index
+        row = db.session.execute(select(Course.id, Course.data_version).where(Course.user_id == current_user.id, Course.code == code)).first()
+        if row is None:
+            return view(code=code, **kwargs)  # the view answers the 404 (not the user's course, or none)
+        key = _key(*row)
+        entry = page_cache.get(key)
+        if entry is not None:
+            _count('hits')
+            return _response(entry, 'HIT')
+        _count('misses')
+        response = make_response(view(code=code, **kwargs))
+        if response.status_code != 200 or response.is_streamed:
+            return response
+        body = response.get_data()
+        entry = (hashlib.sha1(body).hexdigest(), body, response.mimetype)
+        page_cache.set(key, entry)
+        return _response(entry, 'MISS')
+    return wrapper
@@ -0,0 +1,128 @@
+from datetime import date, datetime, time
+
+from flask import abort, current_app, request
+from sqlalchemy import Date, DateTime, Integer, Time, tuple_
+
+# keyset (cursor) pagination for the list views
+# a page is "the next `limit` rows after (or before) a key", where the key is the values of the sort columns of a row,
+# e.g. ?after=2021-03-01T12:00:00,42&limit=50 for assignments sorted by (deadline, id)
+# the database seeks straight to the key through a composite index, so a deep page costs the same as the first one
+# (unlike OFFSET, which reads and throws away every row before the page)
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+def _parse_value(column, text):
+    # turn the text of a cursor back into a value of the column's type
+    if isinstance(column.type, DateTime):
+        return datetime.fromisoformat(text)
+    if isinstance(column.type, Date):
+        return date.fromisoformat(text)
+    if isinstance(column.type, Time):
+        return time.fromisoformat(text)
+    if isinstance(column.type, Integer):
+        return int(text)
+    return text
+
+
+def _format_value(value):
+    if isinstance(value, (date, datetime, time)):
+        return value.isoformat()
+    return str(value)
+
+
+class PageRequest:
+    # the ?after= / ?before= / ?limit= arguments of a list view
+    def __init__(self, after=None, before=None, limit=None):
+        self.after = after
+        self.before = before
+        self.limit = limit
+
+    @classmethod
+    def from_request(cls):
+        default = current_app.config.get('PAGE_SIZE', DEFAULT_PAGE_SIZE)
+        limit = request.args.get('limit', default, type=int)
+        limit = max(1, min(limit, MAX_PAGE_SIZE))  # the client can't ask for an unbounded page
+        return cls(request.args.get('after') or None, request.args.get('before') or None, limit)
+
+
+class Page:
+    # one page of rows, with the cursors of the pages before and after it (None if there is no such page)
+    def __init__(self, items, key, limit, prev_cursor, next_cursor):
+        self.items = items
+        self.key = key
+        self.limit = limit
+        self.prev_cursor = prev_cursor
+        self.next_cursor = next_cursor
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+def encode_cursor(values):
+    return ','.join(_format_value(value) for value in values)
+
+
+def decode_cursor(key, cursor):
+    # a cursor is the sort values of a row ending in its integer id (e.g. 2021-03-01T12:00:00,42), the course's
+    # typed-in code is never part of one; split only as many times as there are columns, so a text column sorted
+    # last could still contain commas
+    parts = cursor.split(',', len(key) - 1)
+    if len(parts) != len(key):
+        abort(400)
+    try:
+        return tuple(_parse_value(column, part) for column, part in zip(key, parts))
+    except ValueError:
+        abort(400)  # a cursor that was tampered with is a bad request, not a server error
+
+
+def page_query(query, key, page_request):
+    # the query (a Query or a select()) of the rows of a page, plus one to tell if there are more;
+    # paginate() runs it, the async views (see aio.py) await it
+    limit = page_request.limit
+    if page_request.before:
+        # walk backwards from the cursor, page() puts the rows back in order
+        values = decode_cursor(key, page_request.before)
+        return query.where(tuple_(*key) < tuple_(*values)).order_by(*[column.desc() for column in key]).limit(limit + 1)
+    if page_request.after:
+        query = query.where(tuple_(*key) > tuple_(*decode_cursor(key, page_request.after)))
+    # one row more than asked for tells us if there is a next page, without a COUNT(*)
+    return query.order_by(*key).limit(limit + 1)
+
+
+def page(rows, key, page_request, row_key=None):
+    # the Page of the rows page_query() returned
+    # row_key: how to read the key of a row, by default the attributes with the same names as the columns
+    row_key = row_key or (lambda row: tuple(getattr(row, column.key) for column in key))
+    limit = page_request.limit
+    if page_request.before:
+        more_before = len(rows) > limit
+        rows = rows[:limit][::-1]
+        prev_cursor = encode_cursor(row_key(rows[0])) if rows and more_before else None
+        next_cursor = encode_cursor(row_key(rows[-1])) if rows else page_request.before
+    else:
+        more_after = len(rows) > limit
+        rows = rows[:limit]
+        next_cursor = encode_cursor(row_key(rows[-1])) if rows and more_after else None
+        if page_request.after:
+            prev_cursor = encode_cursor(row_key(rows[0])) if rows else page_request.after
+        else:
+            prev_cursor = None
+    return Page(rows, key, limit, prev_cursor, next_cursor)
+
+
+def paginate(query, key, page_request, row_key=None):
+    # key: the columns the rows are sorted by, the last ones have to make the order unique (e.g. the primary key)
+    return page(page_query(query, key, page_request).all(), key, page_request, row_key)
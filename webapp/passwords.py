@@ -0,0 +1,92 @@
+import threading
+import time
+
+import bcrypt as _bcrypt
+from werkzeug.exceptions import ServiceUnavailable
+
+# password hashing on a pool of worker processes
+# bcrypt takes ~250 ms of CPU at cost 12; run inline it holds the request's worker for that long, so a burst of logins
+# stalls every other request. The pool runs at most PASSWORD_HASH_WORKERS hashes at a time with at most
+# PASSWORD_HASH_QUEUE more waiting; past that a login gets a 503 right away instead of making everyone wait longer.
+# The hashes are the usual $2b$<cost>$ strings (the same ones Flask-Bcrypt made), a hash made with another cost
+# than BCRYPT_LOG_ROUNDS is replaced at the next successful login.
+
+MAX_PASSWORD_BYTES = 72  # bcrypt only uses the first 72 bytes (older versions cut the rest silently, newer ones refuse it)
+
+
+class PasswordHashingBusy(ServiceUnavailable):
+    description = 'Too many logins at the moment, please try again in a few seconds.'
+
+    def __init__(self):
+        super().__init__(retry_after=1)
+
+
+def _to_bytes(password):
+    return password.encode('utf-8')[:MAX_PASSWORD_BYTES]
+
+
+class PasswordHasher:
+    def __init__(self, rounds=12, workers=0, queue=0):
+        self.configure(rounds, workers, queue)
+        self._executor = None
+        self._executor_lock = threading.Lock()
+        self.listeners = []  # called with the operation (hashpw, checkpw) and its seconds, e.g. by metrics.py
+
+    def init_app(self, app):
+        self.configure(app.config.get('BCRYPT_LOG_ROUNDS', 12), app.config.get('PASSWORD_HASH_WORKERS', 0),
+                       app.config.get('PASSWORD_HASH_QUEUE', 0))
+
+    def configure(self, rounds, workers, queue):
+        self.rounds = rounds
+        self.workers = workers  # 0: hash in the request's own thread (tests, scripts)
+        self.queue = queue
+        self._slots = threading.BoundedSemaphore(max(1, workers + queue))  # hashes running or waiting
+
+    def _pool(self):
+        # created on first use, so that every server worker process gets its own pool after the fork
+        with self._executor_lock:
+            if self._executor is None:
+                from concurrent.futures import ProcessPoolExecutor  # (multiprocessing isn't imported by the processes that hash inline)
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            return self._executor
+
+    def _run(self, function, *args):
+        started = time.perf_counter()
+        try:
+            return self._call(function, *args)
+        finally:
+            for listener in self.listeners:
+                listener(function.__name__, time.perf_counter() - started)
+
+    def _call(self, function, *args):
+        if not self.workers:
+            return function(*args)
+        if not self._slots.acquire(blocking=False):
+            raise PasswordHashingBusy()
+        try:
+            # the pool runs the bcrypt functions themselves, so its processes don't have to import the application
+            return self._pool().submit(function, *args).result()
+        finally:
+            self._slots.release()
+
+    def hash(self, password):
+        return self._run(_bcrypt.hashpw, _to_bytes(password), _bcrypt.gensalt(self.rounds)).decode('utf-8')
+
+    def check(self, password_hash, password):
+        try:
+            return self._run(_bcrypt.checkpw, _to_bytes(password), password_hash.encode('utf-8'))
+        except ValueError:  # not a bcrypt hash
+            return False
+
+    def needs_rehash(self, password_hash):
+        # $2b$12$<salt and hash>: the cost is the second field
+        try:
+            return int(password_hash.split('$')[2]) != self.rounds
+        except (IndexError, ValueError):
+            return True
+
+    def shutdown(self):
+        with self._executor_lock:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
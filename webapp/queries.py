@@ -0,0 +1,70 @@
+from sqlalchemy import false
+from sqlalchemy.orm import contains_eager
+from webapp.models import Course, Assignment, StudyTime, Resource
+from webapp.pagination import paginate
+
+# data access for the dashboard views, always scoped to the logged in user
+# every function loads a page in a fixed number of queries (no matter how many courses the user has),
+# so the templates never trigger a lazy load while looping
+# the lists are paginated with keyset cursors (see pagination.py), their sort keys match the composite indexes in models.py
+# and they leave the archived records out (see courses.py), except for the lists of an archived course itself
+
+COURSE_KEY = (Course.id,)
+ASSIGNMENT_KEY = (Assignment.deadline, Assignment.id)
+STUDY_TIME_KEY = (StudyTime.date, StudyTime.start_time, StudyTime.id)
+RESOURCE_KEY = (Resource.id,)
+
+
+def user_course(user_id, code, archived=None):
+    # the user's course with this code (the urls use it), otherwise 404 (someone else's course looks the same as a missing one);
+    # archived=False: 404 for an archived course too
+    query = Course.query.filter_by(user_id=user_id, code=code)
+    if archived is not None:
+        query = query.filter_by(archived=archived)
+    return query.first_or_404()
+
+
+def course_record(model, user_id, code, record_id):
+    # an assignment, study time or resource together with its course, in one joined query;
+    # 404 if there's no such record, it's in another course, or the course isn't the user's
+    query = (model.query
+             .join(model.course)
+             .filter(model.id == record_id, Course.code == code, Course.user_id == user_id)
+             .options(contains_eager(model.course)))
+    return query.first_or_404()
+
+
+def user_courses(user_id, page_request, archived=False):
+    # a page of the courses of a user (or of the archived ones), in one query
+    return paginate(Course.query.filter_by(user_id=user_id, archived=archived), COURSE_KEY, page_request)
+
+
+def user_assignments(user_id, page_request):
+    # a page of the assignments of a user together with their course, in one joined query, earliest deadline first
+    query = (Assignment.query
+             .join(Assignment.course)
+             .filter(Course.user_id == user_id, Assignment.archived == false())
+             .options(contains_eager(Assignment.course)))
+    return paginate(query, ASSIGNMENT_KEY, page_request)
+
+
+def course_assignments(course_id, page_request, archived=False):
+    return paginate(Assignment.query.filter_by(course_id=course_id, archived=archived), ASSIGNMENT_KEY, page_request)
+
+
+def course_study_times(course_id, page_request, archived=False):
+    return paginate(StudyTime.query.filter_by(course_id=course_id, archived=archived), STUDY_TIME_KEY, page_request)
+
+
+def course_resources(course_id, page_request, archived=False):
+    return paginate(Resource.query.filter_by(course_id=course_id, archived=archived), RESOURCE_KEY, page_request)
+
+
+def user_study_times(user_id, page_request):
+    query = StudyTime.query.join(StudyTime.course).filter(Course.user_id == user_id, StudyTime.archived == false())
+    return paginate(query, STUDY_TIME_KEY, page_request)
+
+
+def user_resources(user_id, page_request):
+    query = Resource.query.join(Resource.course).filter(Course.user_id == user_id, Resource.archived == false())
+    return paginate(query, RESOURCE_KEY, page_request)
@@ -0,0 +1,128 @@
+import math
+import threading
+import time
+
+from flask import request
+from werkzeug.exceptions import TooManyRequests
+from werkzeug.utils import import_string
+
+from webapp.cache import LRUCache
+
+# rate limits of the logins and registrations, checked before their forms are validated, so a request over the limit
+# costs neither a query nor a bcrypt hash (see passwords.py) and gets a 429 with Retry-After:
+#   ip:      a token bucket per client address, RATELIMIT_IP_BURST requests at once, then RATELIMIT_IP_PER_MINUTE
+#   email:   the same per email address typed in the form (whatever the address the request comes from)
+#   backoff: after RATELIMIT_BACKOFF_AFTER failed logins in a row, the account has to wait RATELIMIT_BACKOFF_SECONDS
+#            before the next try, twice as long after every next failure, up to RATELIMIT_BACKOFF_MAX; a successful
+#            login starts it over, and so does a quiet RATELIMIT_BACKOFF_MAX
+# the buckets are kept in a bounded per-process LRU, or in RATELIMIT_BACKEND (the backends of cache.py, e.g.
+# webapp.cache.RedisBackend) so the worker processes share them; a shared bucket is read and written without a lock
+# across processes, so N processes can let through up to N requests more than the limit at the same moment
+# behind a proxy, wrap the app in werkzeug's ProxyFix so request.remote_addr is the client's address
+
+
+class RateLimited(TooManyRequests):
+    description = 'Too many attempts, please try again later.'
+
+    def __init__(self, bucket, retry_after):
+        super().__init__(retry_after=max(1, math.ceil(retry_after)))
+        self.bucket = bucket
+
+
+class RateLimiter:
+    def __init__(self, clock=time.time):
+        self.clock = clock  # wall clock time, it's compared between processes with a shared backend
+        self.enabled = True
+        self.limits = {'ip': (10, 5 / 60), 'email': (5, 2 / 60)}  # bucket -> (burst, tokens per second)
+        self.backoff_after, self.backoff_seconds, self.backoff_max = 3, 2, 900
+        self.local = LRUCache(100000)
+        self.shared = None
+        self._lock = threading.Lock()  # a bucket is read and written again by one thread at a time
+        self.listeners = []  # called with the bucket and whether the request went through, e.g. by metrics.py
+
+    def init_app(self, app):
+        config = app.config
+        self.enabled = config.get('RATELIMIT_ENABLED', True)
+        self.limits = {'ip': (config.get('RATELIMIT_IP_BURST', 10), config.get('RATELIMIT_IP_PER_MINUTE', 5) / 60),
+                       'email': (config.get('RATELIMIT_EMAIL_BURST', 5), config.get('RATELIMIT_EMAIL_PER_MINUTE', 2) / 60)}
+        self.backoff_after = config.get('RATELIMIT_BACKOFF_AFTER', 3)
+        self.backoff_seconds = config.get('RATELIMIT_BACKOFF_SECONDS', 2)
+        self.backoff_max = config.get('RATELIMIT_BACKOFF_MAX', 900)
+        self.local = LRUCache(config.get('RATELIMIT_SIZE', 100000))
+        backend = config.get('RATELIMIT_BACKEND')
+        self.shared = import_string(backend).from_config(config) if backend else None
+
+    def _get(self, key):
+        return self.local.get(key) if self.shared is None else self.shared.get(f'ratelimit:{key}')
+
+    def _set(self, key, value, ttl):
+        if self.shared is None:
+            self.local.set(key, value, ttl)
+        else:
+            self.shared.set(f'ratelimit:{key}', value, ttl)
+
+    def _delete(self, key):
+        if self.shared is None:
+            self.local.delete(key)
+        else:
+            self.shared.delete(f'ratelimit:{key}')
+
+    def clear(self):
+        # only the local buckets, the shared ones expire by themselves
+        self.local.clear()
+
+    def take(self, bucket, value):
+        # takes a token from the bucket of the value; returns 0, or the seconds until it has one if it's empty
+        burst, rate = self.limits[bucket]
+        key = f'{bucket}:{value}'
+        with self._lock:
+            now = self.clock()
+            tokens, updated = self._get(key) or (burst, now)
+            tokens = min(burst, tokens + (now - updated) * rate)
+            if tokens < 1:
+                return (1 - tokens) / rate
+            # kept until it would be full again, forgetting it then changes nothing
+            self._set(key, (tokens - 1, now), (burst - tokens + 1) / rate)
+            return 0
+
+    def backoff(self, email):
+        # the seconds the account still has to wait after its failed logins
+        failures, until = self._get(f'failures:{email}') or (0, 0)
+        return max(0, until - self.clock())
+
+    def login_failed(self, email):
+        email = _normalize(email)
+        if not self.enabled or not email:
+            return
+        with self._lock:
+            now = self.clock()
+            failures, until = self._get(f'failures:{email}') or (0, 0)
+            failures += 1
+            if failures >= self.backoff_after:
+                until = now + min(self.backoff_seconds * 2 ** (failures - self.backoff_after), self.backoff_max)
+            self._set(f'failures:{email}', (failures, until), max(0, until - now) + self.backoff_max)
+
+    def login_succeeded(self, email):
+        email = _normalize(email)
+        if self.enabled and email:
+            self._delete(f'failures:{email}')
+
+    def _check(self, bucket, wait):
+        for listener in self.listeners:
+            listener(bucket, not wait)
+        if wait:
+            raise RateLimited(bucket, wait)
+
+    def check(self, email=None):
+        # raises RateLimited when the request is over a limit; email: as it was typed in the form, not validated yet
+        if not self.enabled:
+            return
+        email = _normalize(email)
+        self._check('ip', self.take('ip', request.remote_addr))
+        if email:
+            self._check('backoff', self.backoff(email))  # before the bucket, a request that has to wait doesn't take from it
+            self._check('email', self.take('email', email))
+
+
+def _normalize(email):
+    return (email or '').strip().lower()[:120]
@@ -0,0 +1,280 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import false, select, tuple_
+from werkzeug.utils import import_string
+
+from webapp import db
+from webapp.models import User, Course, Assignment
+
+# reminders of upcoming deadlines
+#   schedule: every assignment that is not completed and is due in the next REMINDER_LEAD_HOURS gets a reminder job;
+#             the assignments come from a range query on ix_assignment_open_deadline, a partial index of the incomplete
+#             assignments sorted by deadline, so only the due ones are read (in keyset batches), not the whole table
+#   deliver:  a pool of threads hands the queued jobs to the sink (REMINDER_SINK, anything with send(key, reminder)),
+#             a job that fails is retried later with an exponential backoff, up to REMINDER_MAX_ATTEMPTS times
+# the jobs wait in a queue in a local SQLite file (REMINDER_QUEUE), so they survive restarts; every job has an
+# idempotency key (the assignment and its deadline): scheduling the same reminder again does nothing, and the sink gets
+# the key to drop a reminder it already got (a job whose worker died after sending it is sent again)
+# flask --app webapp reminders run   does both every minute (or schedule / deliver once, from cron)
+
+logger = logging.getLogger(__name__)
+
+QUEUED, RUNNING, DONE, FAILED, SKIPPED = 'queued', 'running', 'done', 'failed', 'skipped'
+
+
+### sinks ###
+
+class LogSink:
+    # writes the reminders to the log (the webapp.reminders logger)
+    @classmethod
+    def from_config(cls, config):
+        return cls()
+
+    def send(self, key, reminder):
+        logger.info('Reminder for %s: %s (%s) is due %s [%s]',
+                    reminder['email'], reminder['assignment'], reminder['course'], reminder['deadline'], key)
+
+
+class FileSink:
+    # appends the reminders to a file, one JSON object per line
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(config.get('REMINDER_FILE', 'reminders.jsonl'))
+
+    def send(self, key, reminder):
+        line = json.dumps(dict(reminder, key=key)) + '\n'
+        with self.lock, open(self.path, 'a', encoding='utf-8') as f:
+            f.write(line)
+
+
+### the queue ###
+
+class Job:
+    def __init__(self, id, key, payload, attempts):
+        self.id = id
+        self.key = key
+        self.payload = payload
+        self.attempts = attempts
+
+
+class JobQueue:
+    # a persistent job queue in a SQLite file; several processes can use it, every claim happens in a write transaction
+    def __init__(self, path, clock=time.time):
+        self.path = path
+        self.clock = clock
+        self._connection = None
+
+    def _connect(self):
+        if self._connection is None:
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)  # transactions are opened by hand
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('''CREATE TABLE IF NOT EXISTS job (
+                id INTEGER PRIMARY KEY,
+                key TEXT NOT NULL UNIQUE,
+                payload TEXT NOT NULL,
+                state TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                available_at REAL NOT NULL,
+                lease_until REAL,
+                last_error TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL)''')
+            connection.execute('CREATE INDEX IF NOT EXISTS ix_job_state_available_at ON job (state, available_at, id)')
+            self._connection = connection
+        return self._connection
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    def enqueue(self, jobs):
+        # jobs: (key, payload) pairs; returns how many were new (a key that is already in the queue is ignored)
+        connection = self._connect()
+        now = self.clock()
+        with connection:
+            connection.execute('BEGIN IMMEDIATE')
+            before = connection.total_changes
+            connection.executemany(
+                'INSERT OR IGNORE INTO job (key, payload, state, available_at, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?)',
+                [(key, json.dumps(payload), QUEUED, now, now, now) for key, payload in jobs])
+            return connection.total_changes - before
+
+    def claim(self, limit, lease=300):
+        # the next jobs that are due, marked as running for `lease` seconds (after that another worker may take them)
+        connection = self._connect()
+        now = self.clock()
+        with connection:
+            connection.execute('BEGIN IMMEDIATE')
+            rows = connection.execute(
+                '''UPDATE job SET state = ?, attempts = attempts + 1, lease_until = ?, updated_at = ?
+                   WHERE id IN (SELECT id FROM job WHERE state = ? AND available_at <= ?
+                                UNION ALL SELECT id FROM job WHERE state = ? AND available_at <= ? AND lease_until < ?
+                                ORDER BY id LIMIT ?)
+                   RETURNING id, key, payload, attempts''',
+                (RUNNING, now + lease, now, QUEUED, now, RUNNING, now, now, limit)).fetchall()
+        return sorted((Job(id, key, json.loads(payload), attempts) for id, key, payload, attempts in rows), key=lambda job: job.id)
+
+    def finish(self, job_ids, state=DONE, error=None):
+        connection = self._connect()
+        with connection:
+            connection.execute('BEGIN IMMEDIATE')
+            connection.executemany('UPDATE job SET state = ?, lease_until = NULL, last_error = ?, updated_at = ? WHERE id = ?',
+                                   [(state, error, self.clock(), job_id) for job_id in job_ids])
+
+    def retry(self, job_id, delay, error):
+        connection = self._connect()
+        now = self.clock()
+        with connection:
+            connection.execute('UPDATE job SET state = ?, available_at = ?, lease_until = NULL, last_error = ?, updated_at = ? WHERE id = ?',
+                               (QUEUED, now + delay, error, now, job_id))
+
+    def counts(self):
+        return dict(self._connect().execute('SELECT state, count(*) FROM job GROUP BY state').fetchall())
+
+
+### scheduler ###
+
+def due_assignments(start, end, batch_size=1000):
+    # the incomplete assignments (not archived) with a deadline in (start, end], with their course and user, in keyset batches
+    statement = (select(Assignment.id, Assignment.name, Assignment.deadline, Course.name.label('course_name'),
+                        User.id.label('user_id'), User.username, User.email)
+                 .join(Course, Course.id == Assignment.course_id).join(User, User.id == Course.user_id)
+                 .where(Assignment.completion_date.is_(None), Assignment.archived == false(),
+                        Assignment.deadline > start, Assignment.deadline <= end)
+                 .order_by(Assignment.deadline, Assignment.id).limit(batch_size))
+    last = None
+    while True:
+        rows = db.session.execute(statement if last is None else
+                                  statement.where(tuple_(Assignment.deadline, Assignment.id) > tuple_(*last))).all()
+        yield from rows
+        if len(rows) < batch_size:
+            return
+        last = (rows[-1].deadline, rows[-1].id)
+
+
+def reminder_key(assignment_id, deadline):
+    return f'deadline:{assignment_id}:{deadline.isoformat()}'
+
+
+class ReminderScheduler:
+    def __init__(self, queue, sink, lead=timedelta(hours=24), workers=4, max_attempts=5, retry_delay=30, batch_size=100):
+        self.queue = queue
+        self.sink = sink
+        self.lead = lead
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay  # seconds before the first retry, doubled for every further one
+        self.batch_size = batch_size
+
+    @classmethod
+    def from_app(cls, app):
+        config = app.config
+        path = config.get('REMINDER_QUEUE', 'reminders.db')
+        return cls(JobQueue(os.path.join(app.instance_path, path)),  # relative paths are in the instance folder, like site.db
+                   import_string(config.get('REMINDER_SINK', 'webapp.reminders.LogSink')).from_config(config),
+                   timedelta(hours=config.get('REMINDER_LEAD_HOURS', 24)), config.get('REMINDER_WORKERS', 4),
+                   config.get('REMINDER_MAX_ATTEMPTS', 5), config.get('REMINDER_RETRY_DELAY', 30))
+
+    def schedule(self, now=None):
+        # queue a reminder for every assignment due in the lead time, returns how many were new
+        now = now or datetime.now()  # deadlines are in local time, like the users type them
+        added = 0
+        jobs = []
+        for row in due_assignments(now, now + self.lead):
+            jobs.append((reminder_key(row.id, row.deadline), {
+                'assignment_id': row.id, 'assignment': row.name, 'deadline': row.deadline.isoformat(),
+                'course': row.course_name, 'user_id': row.user_id, 'username': row.username, 'email': row.email}))
+            if len(jobs) >= 1000:
+                added += self.queue.enqueue(jobs)
+                jobs = []
+        return added + self.queue.enqueue(jobs)
+
+    def _still_due(self, jobs):
+        # the jobs whose assignment is still incomplete (and not archived) with the same deadline (one query per batch)
+        ids = {job.payload['assignment_id'] for job in jobs}
+        current = {reminder_key(assignment_id, deadline) for assignment_id, deadline in db.session.execute(
+            select(Assignment.id, Assignment.deadline).where(Assignment.id.in_(ids), Assignment.completion_date.is_(None),
+                                                             Assignment.archived == false()))}
+        return [job for job in jobs if job.key in current]
+
+    def deliver(self):
+        # send every job that is due, returns {'sent': n, 'retried': n, 'failed': n, 'skipped': n}
+        result = {'sent': 0, 'retried': 0, 'failed': 0, 'skipped': 0}
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            while True:
+                jobs = self.queue.claim(self.batch_size)
+                if not jobs:
+                    break
+                due = self._still_due(jobs)
+                stale = {job.id for job in jobs} - {job.id for job in due}
+                self.queue.finish(stale, SKIPPED)
+                result['skipped'] += len(stale)
+                futures = [(job, pool.submit(self.sink.send, job.key, job.payload)) for job in due]
+                sent = []
+                for job, future in futures:
+                    try:
+                        future.result()
+                    except Exception as error:
+                        message = f'{type(error).__name__}: {error}'
+                        if job.attempts >= self.max_attempts:
+                            logger.error('Reminder %s failed after %d attempts: %s', job.key, job.attempts, message)
+                            self.queue.finish([job.id], FAILED, message)
+                            result['failed'] += 1
+                        else:
+                            self.queue.retry(job.id, self.retry_delay * 2 ** (job.attempts - 1), message)
+                            result['retried'] += 1
+                    else:
+                        sent.append(job.id)
+                self.queue.finish(sent)
+                result['sent'] += len(sent)
+        return result
+
+    def run(self, interval=60):
+        while True:
+            self.schedule()
+            self.deliver()
+            db.session.remove()
+            time.sleep(interval)
+
+
+### command line ###
+
+reminders_cli = AppGroup('reminders', help='Schedule and send the reminders of upcoming deadlines.')  # added to the app's commands by create_app
+
+
+@reminders_cli.command('schedule')
+def schedule_command():
+    click.echo(f'{ReminderScheduler.from_app(current_app).schedule()} reminders queued.')
+
+
+@reminders_cli.command('deliver')
+def deliver_command():
+    result = ReminderScheduler.from_app(current_app).deliver()
+    click.echo(', '.join(f'{count} {name}' for name, count in result.items()))
+
+
+@reminders_cli.command('run')
+@click.option('--interval', default=60, help='Seconds between two rounds.')
+def run_command(interval):
+    ReminderScheduler.from_app(current_app).run(interval)
+
+
+@reminders_cli.command('status')
+def status_command():
+    counts = ReminderScheduler.from_app(current_app).queue.counts()
+    click.echo(', '.join(f'{count} {state}' for state, count in sorted(counts.items())) or 'The queue is empty.')
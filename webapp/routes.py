@@ -1,53 +1,77 @@
 import datetime
+from datetime import date
 
-from flask import render_template, url_for, flash, redirect, request
-from webapp.forms import RegistrationForm, LoginForm, UpdateAccountForm, CreateCourseForm, CreateAssignmentForm, CreateStudyTimeForm, CreateResourceForm
-from webapp import db, bcrypt, app
+from flask import Blueprint, render_template, url_for, flash, redirect, request, abort
+from webapp.forms import RegistrationForm, LoginForm, UpdateAccountForm, CreateCourseForm, CreateAssignmentForm, CreateStudyTimeForm, CreateResourceForm, ImportForm
+from webapp import db, passwords, rate_limiter
 from webapp.models import *
+from webapp.pagination import PageRequest
+from webapp import queries
+from webapp.export import feed_token
+from webapp.importer import IMPORTERS
+from webapp.analytics import statistics as study_statistics
+from webapp.courses import archive_courses, delete_courses
+from webapp.versioning import bump_data_version
+from webapp.scheduling import check_overlaps
+from webapp.search import search as search_records, result_url
+from webapp.pages import cached_page
+from webapp.files import attach, send_resource_file
 from flask_login import login_user, current_user, logout_user, login_required
 
+# the html pages, registered on the app by create_app (see __init__.py); their endpoints are main.<view>, e.g. url_for('main.course', code=...)
+main = Blueprint('main', __name__)
 
-@app.route("/")
-@app.route("/home", methods=['GET'])
+
+@main.route("/")
+@main.route("/home", methods=['GET'])
 def home():
     return render_template('home.html', user=current_user)
 
-@app.route("/register", methods=['GET', 'POST'])
+@main.route("/register", methods=['GET', 'POST'])
 def register():
     if current_user.is_authenticated:
-        return redirect(url_for('home'))
+        return redirect(url_for('main.home'))
+    if request.method == 'POST':
+        rate_limiter.check(request.form.get('email'))  # a 429 before the form's queries and bcrypt when over the limits (see ratelimit.py)
     form = RegistrationForm()
     if form.validate_on_submit(): # the form doesn't have any input errors
-        hashed_password=bcrypt.generate_password_hash(form.password.data).decode('utf-8')  # BCrypt internally generates a string while encoding passwords and stores that string along with the encrypted password
+        hashed_password=passwords.hash(form.password.data)  # BCrypt internally generates a string while encoding passwords and stores that string along with the encrypted password
         user=User(username=form.username.data, email=form.email.data, password=hashed_password)
         db.session.add(user)  # add user to database
         db.session.commit()  # ave changes to database
         flash('Your account has been created! You are now able to log in!', 'success')  # give feedback to the user by flashing a message
-        return redirect(url_for('login'))   # redirect to an url for the login function
+        return redirect(url_for('main.login'))   # redirect to an url for the login function
     return render_template('register.html', title='Register', form=form)  # render the register html template
 
 
-@app.route("/login", methods=['GET', 'POST'])
+@main.route("/login", methods=['GET', 'POST'])
 def login():
     if current_user.is_authenticated:
-        return redirect(url_for('home'))
+        return redirect(url_for('main.home'))
+    if request.method == 'POST':
+        rate_limiter.check(request.form.get('email'))  # a 429 before the user's query and bcrypt when over the limits (see ratelimit.py)
     form = LoginForm()  # make an instance for login form
     if form.validate_on_submit():  # if the form is valid when submitting( correct username and password)
         user=User.query.filter_by(email=form.email.data).first()  # get the user with the same email as the one submitted in the form
-        if user and bcrypt.check_password_hash(user.password, form.password.data):  # if the user exits and the password entered in form is the same as the in the databases
+        if user and passwords.check(user.password, form.password.data):  # if the user exits and the password entered in form is the same as the in the databases
+            if passwords.needs_rehash(user.password):  # the hash was made with another bcrypt cost than the configured one
+                user.password=passwords.hash(form.password.data)
+                db.session.commit()
+            rate_limiter.login_succeeded(form.email.data)
             login_user(user,remember=form.remember.data)
             next_page=request.args.get('next') # is None if 'next' doesn't exist
-            return redirect(next_page) if next_page else redirect(url_for(('home')))  # redirect tp home page if 'next page' doesn't exists
+            return redirect(next_page) if next_page else redirect(url_for(('main.home')))  # redirect tp home page if 'next page' doesn't exists
         else:
+             rate_limiter.login_failed(form.email.data)  # the account waits longer after every failure (see ratelimit.py)
              flash('Login Unsuccessful. Please check email and password', 'danger')
     return render_template('login.html', title='Login', form=form)  # render the login template
 
-@app.route("/logout")
+@main.route("/logout")
 def logout():
     logout_user()
-    return redirect(url_for(('home')))
+    return redirect(url_for(('main.home')))
 
-@app.route("/account",methods=['GET','POST'])
+@main.route("/account",methods=['GET','POST'])
 @login_required  # if we are trying to access account without being logged in
 def account():
     form=UpdateAccountForm()  # create an instance of the update account form
@@ -56,101 +80,138 @@ def account():
         current_user.username=form.username.data
         current_user.email=form.email.data
         db.session.commit()  # save changes in database
+        forget_user(current_user.id)  # the next request loads the new username and email from the database
         flash('Your account has been updated!','success')  # 'success' is a bootstrap class
-        return redirect(url_for('account'))
+        return redirect(url_for('main.account'))
 
     elif request.method=='GET': #if not submitting any changes
         # the user and the email are visible in the form
         form.username.data=current_user.username
         form.email.data=current_user.email
-    return render_template('account.html', title='Account',form=form)
+    return render_template('account.html', title='Account',form=form, feed_token=feed_token(current_user.id))
 
 ### course ###
 
-@app.route("/course/new",methods=['GET','POST'])
+def _code_is_free(form, course=None):
+    # the code of a course is unique among the user's courses (it's in the urls), course: the one being updated
+    if course is not None and form.code.data == course.code:
+        return True
+    if Course.query.filter_by(user_id=current_user.id, code=form.code.data).first():
+        form.code.errors.append('You already have a course with this code! Please choose a different one.')
+        return False
+    return True
+
+
+@main.route("/course/new",methods=['GET','POST'])
 @login_required
 def new_course():
     form=CreateCourseForm()  # instance oof the new course form
-    if form.validate_on_submit():
-        course=Course(id=form.id.data+ '_'+str(current_user.id), name=form.name.data,user=current_user)  # create instance of the course with the data from the form
+    if form.validate_on_submit() and _code_is_free(form):
+        course=Course(code=form.code.data, name=form.name.data,user=current_user)  # create instance of the course with the data from the form
         db.session.add(course)  # add the course to the database
         db.session.commit()  # save changes to database
         flash('Your course has been created!','success')
-        return redirect(url_for('all_courses'))  # redirect to the html page that contains the all courses
+        return redirect(url_for('main.all_courses'))  # redirect to the html page that contains the all courses
     return render_template('create_course.html', title='New Course',form=form, legend='New Course')
 
 
-@app.route("/course/<course_id>")
+@main.route("/course/<code>")
 @login_required
-def course(course_id):
-    course = Course.query.get_or_404(course_id)
-    return render_template('course.html',title=course.id, course=course)
+@cached_page
+def course(code):
+    course = queries.user_course(current_user.id, code)
+    return render_template('course.html',title=course.code, course=course)
 
 
-@app.route("/course/<course_id>/update",methods=['GET','POST'])
+@main.route("/course/<code>/update",methods=['GET','POST'])
 @login_required
-def update_course(course_id):
-    course = Course.query.get_or_404(course_id)  # returns the course with the given id or a 404 error
+def update_course(code):
+    course = queries.user_course(current_user.id, code)  # returns the user's course with the given id or a 404 error
     form=CreateCourseForm()
-    if form.validate_on_submit():
-        course.id=form.id.data
+    if form.validate_on_submit() and _code_is_free(form, course):
+        course.code=form.code.data  # only the code changes, the id stays (and so do the records that point to it)
         course.name=form.name.data
         db.session.commit()
         flash('Your course has been updated!','success')
-        return redirect (url_for('course',course_id=course.id))
+        return redirect (url_for('main.course',code=course.code))
     elif request.method=='GET':
-        form.id.data=course.id
+        form.code.data=course.code
         form.name.data=course.name
     return render_template('create_course.html', title='Update Course',form=form, legend='Update Course')
 
 
-@app.route("/course/<course_id>/delete",methods=['POST'])
+@main.route("/course/<code>/delete",methods=['POST'])
 @login_required
-def delete_course(course_id):
-    # course = Course.query.get_or_404((course_id,current_user.id))
-    course = Course.query.get_or_404(course_id)
-    db.session.delete(course)
+def delete_course(code):
+    course = queries.user_course(current_user.id, code)
+    delete_courses(db.session, [course.id])  # the course with all its assignments, study times and resources, in a few statements
+    bump_data_version(db.session, user_ids=[current_user.id])  # the bulk statements skip the session's change tracking
     db.session.commit()
     flash('Your course has been deleted!', 'success')
-    return redirect(url_for('all_courses', course_id=course.id))
+    return redirect(url_for('main.all_courses'))
+
+
+@main.route("/course/<code>/archive",methods=['POST'])
+@login_required
+def archive_course(code):
+    course = queries.user_course(current_user.id, code)
+    archive_courses(db.session, [course.id])  # the course and everything in it are hidden from the lists, but kept
+    bump_data_version(db.session, course_ids=[course.id])
+    db.session.commit()
+    flash('Your course has been archived!', 'success')
+    return redirect(url_for('main.all_courses'))
+
+
+@main.route("/course/<code>/unarchive",methods=['POST'])
+@login_required
+def unarchive_course(code):
+    course = queries.user_course(current_user.id, code)
+    archive_courses(db.session, [course.id], archived=False)
+    bump_data_version(db.session, course_ids=[course.id])
+    db.session.commit()
+    flash('Your course is back from the archive!', 'success')
+    return redirect(url_for('main.course', code=code))
 
 
-@app.route("/courses")
+@main.route("/courses")
 @login_required
 def all_courses():
-    courses=Course.query.filter_by(user_id=current_user.id) # get all the courses for the current user
+    courses=queries.user_courses(current_user.id, PageRequest.from_request()) # get a page of the courses of the current user
     return render_template('courses.html',courses=courses)
 
+
+@main.route("/courses/archived")
+@login_required
+def archived_courses():
+    courses=queries.user_courses(current_user.id, PageRequest.from_request(), archived=True)
+    return render_template('courses.html',courses=courses,archived=True)
+
 ### assignment ###
 
-@app.route("/course/<course_id>/assignment/new",methods=['GET','POST'])
+@main.route("/course/<code>/assignment/new",methods=['GET','POST'])
 @login_required
-def new_assignment(course_id):
+def new_assignment(code):
     form=CreateAssignmentForm()
     if form.validate_on_submit():
-        course = Course.query.get_or_404(course_id) # get the course with the given id or a 404 error if the course isn't found
+        course = queries.user_course(current_user.id, code, archived=False) # get the user's course with the given id or a 404 error if there is none (or it's archived)
         assignment=Assignment(name=form.name.data,deadline=form.deadline.data,course=course)  # create instance of Assignment
         db.session.add(assignment)  # add assignment to databases
         db.session.commit()  # save changes
         flash('Your assignment has been created!','success')
-        return redirect(url_for('course_assignments',course_id=course.id))
+        return redirect(url_for('main.course_assignments',code=code))
     return render_template('create_assignment.html', title='New Assignment',form=form, legend='New Assignment')
 
 
-@app.route("/course/<course_id>/assignment/<assignment_id>")
+@main.route("/course/<code>/assignment/<int:assignment_id>")
 @login_required
-def assignment(course_id, assignment_id):
-    # check if assignment and course with the given ids exist
-    assignment=Assignment.query.get_or_404(assignment_id)
-    course=Course.query.get_or_404(course_id)
+def assignment(code, assignment_id):
+    assignment = queries.course_record(Assignment, current_user.id, code, assignment_id)  # 404 unless it exists, is in this course and the course is the user's (one joined query)
     return render_template('assignment.html',title=assignment.id, assignment=assignment)
 
-@app.route("/course/<course_id>/assignment/<assignment_id>/update",methods=['GET','POST'])
+@main.route("/course/<code>/assignment/<int:assignment_id>/update",methods=['GET','POST'])
 @login_required
-def update_assignment(course_id,assignment_id):
-    # check if assignment and course with the given ids exist
-    course = Course.query.get_or_404(course_id)
-    assignment=Assignment.query.get_or_404(assignment_id)
+def update_assignment(code,assignment_id):
+    assignment = queries.course_record(Assignment, current_user.id, code, assignment_id)
     form=CreateAssignmentForm()
     if form.validate_on_submit():
         # change current assignment data with the data submitted in the form
@@ -158,7 +219,7 @@ def update_assignment(course_id,assignment_id):
         assignment.name=form.name.data
         db.session.commit()
         flash('Your assignment has been updated!','success')
-        return redirect (url_for('assignment',course_id=course.id, assignment_id=assignment.id))
+        return redirect (url_for('main.assignment',code=code, assignment_id=assignment_id))
     elif request.method=='GET':
         # the form is filled with the assignment's current data
         form.deadline.data=assignment.deadline
@@ -166,97 +227,95 @@ def update_assignment(course_id,assignment_id):
     return render_template('create_assignment.html', title='Update Assignment',form=form, legend='Update Assignment')
 
 
-@app.route("/course/<course_id>/assignment/<assignment_id>/delete",methods=['POST'])
+@main.route("/course/<code>/assignment/<int:assignment_id>/delete",methods=['POST'])
 @login_required
-def delete_assignment(course_id,assignment_id):
-    course = Course.query.get_or_404(course_id)
-    assignment = Assignment.query.get_or_404(assignment_id)
+def delete_assignment(code,assignment_id):
+    assignment = queries.course_record(Assignment, current_user.id, code, assignment_id)
     db.session.delete(assignment)  # delete from the database the assignment
     db.session.commit()
     flash('Your assignment has been deleted!', 'success')
-    return redirect(url_for('course_assignments', course_id=course.id))
+    return redirect(url_for('main.course_assignments', code=code))
 
-@app.route("/course/<course_id>/assignment/<assignment_id>/complete",methods=['GET','POST'])
+@main.route("/course/<code>/assignment/<int:assignment_id>/complete",methods=['GET','POST'])
 @login_required
-def complete_assignment(course_id,assignment_id):
-    course = Course.query.get_or_404(course_id)
-    assignment = Assignment.query.get_or_404(assignment_id)
+def complete_assignment(code,assignment_id):
+    assignment = queries.course_record(Assignment, current_user.id, code, assignment_id)
     assignment.completion_date=datetime.utcnow()  # add the current date and time
     db.session.commit()
     flash('Your assignment is completed!', 'success')
-    return redirect(url_for('assignment', course_id=course.id, assignment_id=assignment.id))
+    return redirect(url_for('main.assignment', code=code, assignment_id=assignment_id))
 
-@app.route("/course/<course_id>/assignment/<assignment_id>/incomplete",methods=['GET','POST'])
+@main.route("/course/<code>/assignment/<int:assignment_id>/incomplete",methods=['GET','POST'])
 @login_required
-def incomplete_assignment(course_id,assignment_id):
-    course = Course.query.get_or_404(course_id)
-    assignment = Assignment.query.get_or_404(assignment_id)
+def incomplete_assignment(code,assignment_id):
+    assignment = queries.course_record(Assignment, current_user.id, code, assignment_id)
     assignment.completion_date=None  # set the completion date to Null in database
     db.session.commit()
     flash('Your assignment is incompleted!', 'success')
-    return redirect(url_for('assignment', course_id=course.id, assignment_id=assignment.id))
+    return redirect(url_for('main.assignment', code=code, assignment_id=assignment_id))
 
 
-@app.route("/course/<course_id>/assignments")
+@main.route("/course/<code>/assignments")
 @login_required
-def course_assignments(course_id):
-    course = Course.query.get_or_404(course_id)
-    return render_template('course_assignments.html', course=course)  # render the template that has all asignments for a specific course
+@cached_page
+def course_assignments(code):
+    course = queries.user_course(current_user.id, code)
+    assignments = queries.course_assignments(course.id, PageRequest.from_request(), archived=course.archived)  # a page of the course's assignments, sorted by deadline
+    return render_template('course_assignments.html', course=course, assignments=assignments)  # render the template that has all asignments for a specific course
 
 
-@app.route("/assignments")
+@main.route("/assignments")
 @login_required
 def all_assignments():
-    courses=Course.query.filter_by(user_id=current_user.id)  # get all the courses of the current user
-    return render_template('all_assignments.html',courses=courses)  # render the template that has all assigments together
+    assignments=queries.user_assignments(current_user.id, PageRequest.from_request())  # get a page of the assignments of the current user (with their courses), sorted by deadline
+    return render_template('all_assignments.html',assignments=assignments)  # render the template that has all assigments together
 
 ### study time ###
 
-@app.route("/course/<course_id>/studytime/new",methods=['GET','POST'])
+@main.route("/course/<code>/studytime/new",methods=['GET','POST'])
 @login_required
-def new_study_time(course_id):
+def new_study_time(code):
     form=CreateStudyTimeForm()  # create instance of the form used for creating a study time
-    if form.validate_on_submit():
-        course = Course.query.get_or_404(course_id)
+    if form.validate_on_submit() and check_overlaps(form, current_user.id):  # the overlapping study times are shown as errors of the form
+        course = queries.user_course(current_user.id, code, archived=False)
         study_time=StudyTime(date=form.date.data,start_time=form.start.data,end_time=form.end.data,course=course)  # create instance of study time with the data from the form
         db.session.add(study_time)  # add study time to the database
         db.session.commit()  # save changes
         flash('Your study time has been created!','success')
-        return redirect(url_for('course_study_times',course_id=course.id))  # after creating a study time, the used is redirected to the page with all study times of the specific course
+        return redirect(url_for('main.course_study_times',code=code))  # after creating a study time, the used is redirected to the page with all study times of the specific course
     return render_template('create_study_time.html', title='New Study Time',form=form, legend='New Study Time')
 
 
-@app.route("/course/<course_id>/studytimes")
+@main.route("/course/<code>/studytimes")
 @login_required
-def course_study_times(course_id):
-    course = Course.query.get_or_404(course_id)
-    return render_template('course_study_times.html', course=course)  # render the html template that has all study times for the specific course
+@cached_page
+def course_study_times(code):
+    course = queries.user_course(current_user.id, code)
+    study_times = queries.course_study_times(course.id, PageRequest.from_request(), archived=course.archived)
+    return render_template('course_study_times.html', course=course, study_times=study_times)  # render the html template that has all study times for the specific course
 
 
 
-@app.route("/course/<course_id>/studytime/<studytime_id>")
+@main.route("/course/<code>/studytime/<int:studytime_id>")
 @login_required
-def study_time(course_id, studytime_id):
-    # check if both the course and the study time exist
-    study_time=StudyTime.query.get_or_404(studytime_id)
-    course=Course.query.get_or_404(course_id)
+def study_time(code, studytime_id):
+    study_time = queries.course_record(StudyTime, current_user.id, code, studytime_id)
     return render_template('studytime.html',title=study_time.id, study_time=study_time)  # render the html template that has information about the study time
 
 
-@app.route("/course/<course_id>/studytime/<studytime_id>/update",methods=['GET','POST'])
+@main.route("/course/<code>/studytime/<int:studytime_id>/update",methods=['GET','POST'])
 @login_required
-def update_study_time(course_id,studytime_id):
-    course = Course.query.get_or_404(course_id)
-    study_time=StudyTime.query.get_or_404(studytime_id)
+def update_study_time(code,studytime_id):
+    study_time = queries.course_record(StudyTime, current_user.id, code, studytime_id)
     form=CreateStudyTimeForm()
-    if form.validate_on_submit():
+    if form.validate_on_submit() and check_overlaps(form, current_user.id, exclude_id=study_time.id):
         # the study time data si updated to the new one from the form
         study_time.date=form.date.data
         study_time.start_time=form.start.data
         study_time.end_time = form.end.data
         db.session.commit()
         flash('Your study time has been updated!','success')
-        return redirect (url_for('course_study_times',course_id=course.id))
+        return redirect (url_for('main.course_study_times',code=code))
     elif request.method=='GET':
         # the form is filled with the study time current data
         form.date.data=study_time.date
@@ -265,72 +324,134 @@ def update_study_time(course_id,studytime_id):
     return render_template('create_study_time.html', title='Update Study Time',form=form, legend='Update Study Time')
 
 
-@app.route("/course/<course_id>/studytime/<studytime_id>/delete",methods=['POST'])
+@main.route("/course/<code>/studytime/<int:studytime_id>/delete",methods=['POST'])
 @login_required
-def delete_study_time(course_id,studytime_id):
-    course = Course.query.get_or_404(course_id)
-    study_time = StudyTime.query.get_or_404(studytime_id)
+def delete_study_time(code,studytime_id):
+    study_time = queries.course_record(StudyTime, current_user.id, code, studytime_id)
     db.session.delete(study_time)  # delete study time from database
     db.session.commit()
     flash('Your assignment has been deleted!', 'success')
-    return redirect(url_for('course_study_times', course_id=course.id))  # return to all current study times of the given course
+    return redirect(url_for('main.course_study_times', code=code))  # return to all current study times of the given course
 
 ### resource ###
 
-@app.route("/course/<course_id>/resource/new",methods=['GET','POST'])
+@main.route("/course/<code>/resource/new",methods=['GET','POST'])
 @login_required
-def new_resource(course_id):
+def new_resource(code):
     form=CreateResourceForm()  # instance of the form
     if form.validate_on_submit():
-        course = Course.query.get_or_404(course_id)
+        course = queries.user_course(current_user.id, code, archived=False)
         resource=Resource(name=form.name.data,course=course)  # instance of the new resource
         db.session.add(resource)
+        if form.file.data:
+            attach(db.session, resource, form.file.data)  # stored once whoever else uploaded the same file (see files.py)
         db.session.commit()
         flash('Your resource has been created!','success')
-        return redirect(url_for('course_resources',course_id=course.id))  # redirect to all the course's resources
+        return redirect(url_for('main.course_resources',code=code))  # redirect to all the course's resources
     return render_template('create_resource.html', title='New Resource',form=form, legend='New Resource')
 
 
-@app.route("/course/<course_id>/resources")
+@main.route("/course/<code>/resources")
 @login_required
-def course_resources(course_id):
-    course = Course.query.get_or_404(course_id)
-    return render_template('course_resources.html', course=course)  # render the html template with all resources for the specific course
+@cached_page
+def course_resources(code):
+    course = queries.user_course(current_user.id, code)
+    resources = queries.course_resources(course.id, PageRequest.from_request(), archived=course.archived)
+    return render_template('course_resources.html', course=course, resources=resources)  # render the html template with all resources for the specific course
 
 #############
-@app.route("/course/<course_id>/resource/<resource_id>")
+@main.route("/course/<code>/resource/<int:resource_id>")
 @login_required
-def resource(course_id, resource_id):
-    # check if both resource and course exist
-    resource=Resource.query.get_or_404(resource_id)
-    course=Course.query.get_or_404(course_id)
+def resource(code, resource_id):
+    resource = queries.course_record(Resource, current_user.id, code, resource_id)
     return render_template('resource.html',title=resource.id, resource=resource)  # render the html templete with the details about the given resource
 
 
-@app.route("/course/<course_id>/resource/<resource_id>/update",methods=['GET','POST'])
+@main.route("/course/<code>/resource/<int:resource_id>/file")
+@login_required
+def resource_file(code, resource_id):
+    resource = queries.course_record(Resource, current_user.id, code, resource_id)
+    if resource.blob_sha256 is None:
+        abort(404)
+    return send_resource_file(resource)  # with Range requests, the ETag and sendfile (see files.py)
+
+
+@main.route("/course/<code>/resource/<int:resource_id>/update",methods=['GET','POST'])
 @login_required
-def update_resource(course_id,resource_id):
-    course = Course.query.get_or_404(course_id)
-    resource=Resource.query.get_or_404(resource_id)
+def update_resource(code,resource_id):
+    resource = queries.course_record(Resource, current_user.id, code, resource_id)
     form=CreateResourceForm()  # instance of the resource form
     if form.validate_on_submit():
         #change current resource name to the name entered in form
         resource.name=form.name.data
+        if form.file.data:
+            attach(db.session, resource, form.file.data)  # the old file loses a reference, `flask files gc` removes it once nothing points to it
         db.session.commit()
         flash('Your resource has been updated!','success')
-        return redirect (url_for('course_resources',course_id=course.id))
+        return redirect (url_for('main.course_resources',code=code))
     elif request.method=='GET':
         # fill in the form input with the current name of the resource
         form.name.data=resource.name
     return render_template('create_resource.html', title='Update Resource',form=form, legend='Update Resource')
 
 
-@app.route("/course/<course_id>/resource/<resource_id>/delete",methods=['POST'])
+@main.route("/course/<code>/resource/<int:resource_id>/delete",methods=['POST'])
 @login_required
-def delete_resource(course_id,resource_id):
-    course = Course.query.get_or_404(course_id)
-    resource = Resource.query.get_or_404(resource_id)
+def delete_resource(code,resource_id):
+    resource = queries.course_record(Resource, current_user.id, code, resource_id)
     db.session.delete(resource)  # delete resource from database
     db.session.commit()
     flash('Your resource has been deleted!', 'success')
-    return redirect(url_for('course_resources', course_id=course.id))  # redirect to all resource of the course
+    return redirect(url_for('main.course_resources', code=code))  # redirect to all resource of the course
+
+
+### import ###
+
+@main.route("/import",methods=['GET','POST'])
+@login_required
+def import_data():
+    form=ImportForm()
+    report=None
+    if form.validate_on_submit():
+        report=IMPORTERS[form.kind.data](form.file.data.stream, current_user.id)  # the file is read row by row, the valid rows are saved in chunks
+        if report.file_error:
+            flash(f'{report.imported} of {report.rows} rows imported, {report.file_error}.', 'danger')
+        else:
+            flash(f'{report.imported} of {report.rows} rows imported!', 'success' if not report.failed else 'warning')
+    return render_template('import.html', title='Import', form=form, legend='Import from CSV', report=report)
+
+
+### statistics ###
+
+def _statistics_period():
+    # ?from= and ?to= are ISO dates (2021-03-01), the default is the last 12 weeks
+    return request.args.get('from', type=date.fromisoformat), request.args.get('to', type=date.fromisoformat)
+
+
+@main.route("/statistics")
+@login_required
+def statistics():
+    start, end = _statistics_period()
+    stats=study_statistics(current_user.id, None, start, end)  # added up by the database from the daily rollup
+    return render_template('statistics.html', title='Statistics', stats=stats, course=None)
+
+
+@main.route("/course/<code>/statistics")
+@login_required
+def course_statistics(code):
+    course = queries.user_course(current_user.id, code)
+    start, end = _statistics_period()
+    stats=study_statistics(current_user.id, course.id, start, end)
+    return render_template('statistics.html', title='Statistics', stats=stats, course=course)
+
+
+### search ###
+
+@main.route("/search")
+@login_required
+def search():
+    query=request.args.get('q', '')
+    results=search_records(current_user.id, query, limit=50)  # the user's courses, assignments and resources, the best matches first
+    for result in results:
+        result['url']=result_url(result)
+    return render_template('search.html', title='Search', query=query, results=results)
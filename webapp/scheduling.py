@@ -0,0 +1,107 @@
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+
+from sqlalchemy import false, select
+
+from webapp import db
+from webapp.models import Course, StudyTime
+
+# study times of a user must not overlap, whichever course they belong to
+# (the archived ones don't count, they're out of the planner until their course comes back, see courses.py)
+# the lookups go through the user's courses (ix_course_user_id_archived_id) and then ix_study_time_course_id_archived_interval,
+# (course_id, archived, date, start_time, id, end_time): for every course the database seeks to the day, reads the index entries
+# that start before the new session ends and checks their end time in the index too, without touching the table,
+# so a check reads the user's sessions of that day that could overlap and nothing else
+# two sessions overlap if each one starts before the other one ends (10:00-11:00 and 11:00-12:00 don't)
+
+MAX_FREE_SLOT_DAYS = 366
+
+
+def _session_columns():
+    return (StudyTime.id, StudyTime.date, StudyTime.start_time, StudyTime.end_time, StudyTime.course_id,
+            Course.name.label('course_name'))
+
+
+def overlapping(user_id, day, start, end, exclude_id=None):
+    # the user's study times that overlap start-end on the day (exclude_id: the study time being changed)
+    statement = (select(*_session_columns()).join(Course, Course.id == StudyTime.course_id)
+                 .where(Course.user_id == user_id, StudyTime.archived == false(), StudyTime.date == day,
+                        StudyTime.start_time < end, StudyTime.end_time > start)
+                 .order_by(StudyTime.start_time, StudyTime.id))
+    if exclude_id is not None:
+        statement = statement.where(StudyTime.id != exclude_id)
+    return db.session.execute(statement).all()
+
+
+def sessions_between(user_id, first_day, last_day, exclude_ids=()):
+    # all the study times of the user in a range of days, sorted, in one query
+    statement = (select(*_session_columns()).join(Course, Course.id == StudyTime.course_id)
+                 .where(Course.user_id == user_id, StudyTime.archived == false(), StudyTime.date.between(first_day, last_day))
+                 .order_by(StudyTime.date, StudyTime.start_time, StudyTime.id))
+    if exclude_ids:
+        statement = statement.where(StudyTime.id.not_in(exclude_ids))
+    return db.session.execute(statement).all()
+
+
+def describe(session):
+    return f"{session.course_name} ({session.start_time:%H:%M}-{session.end_time:%H:%M})"
+
+
+def conflict_message(sessions):
+    return 'Overlaps with ' + ', '.join(describe(session) for session in sessions) + '.'
+
+
+def check_overlaps(form, user_id, exclude_id=None):
+    # for the study time pages: adds the study times that overlap the form's session to its errors, True if there are none
+    conflicts = overlapping(user_id, form.date.data, form.start.data, form.end.data, exclude_id)
+    if conflicts:
+        form.start.errors.append(conflict_message(conflicts))
+    return not conflicts
+
+
+def batch_conflicts(user_id, sessions, exclude_ids=()):
+    # for the bulk api: sessions is a list of (date, start, end); returns {position: message} for the ones that overlap
+    # a study time of the user or an earlier session of the list, with a single query for all the days
+    if not sessions:
+        return {}
+    days = defaultdict(list)
+    for session in sessions_between(user_id, min(s[0] for s in sessions), max(s[0] for s in sessions), exclude_ids):
+        days[session.date].append(session)
+    conflicts = {}
+    for position, (day, start, end) in enumerate(sessions):
+        found = [session for session in days[day] if session.start_time < end and session.end_time > start]
+        if found:
+            conflicts[position] = conflict_message(found)
+        else:
+            days[day].append(_NewSession(day, start, end))
+    return conflicts
+
+
+class _NewSession:
+    # a session accepted earlier in the same batch, shaped like a row of _session_columns
+    course_name = 'another study time of the request'
+
+    def __init__(self, day, start, end):
+        self.date, self.start_time, self.end_time = day, start, end
+
+
+def free_slots(user_id, first_day, last_day, day_start=time(8), day_end=time(22), min_length=timedelta(minutes=30)):
+    # the windows between day_start and day_end of every day without a study time, at least min_length long:
+    # one query for the sorted sessions of the range, then a single sweep over them
+    slots = []
+    sessions = iter(sessions_between(user_id, first_day, last_day))
+    session = next(sessions, None)
+    day = first_day
+    while day <= last_day:
+        free_from = datetime.combine(day, day_start)
+        closing = datetime.combine(day, day_end)
+        while session is not None and session.date == day:
+            start, end = datetime.combine(day, session.start_time), datetime.combine(day, session.end_time)
+            if min(start, closing) - free_from >= min_length:
+                slots.append((day, free_from.time(), min(start, closing).time()))
+            free_from = max(free_from, end)
+            session = next(sessions, None)
+        if closing - free_from >= min_length:
+            slots.append((day, free_from.time(), closing.time()))
+        day += timedelta(days=1)
+    return slots
@@ -0,0 +1,206 @@
+import re
+import sqlite3
+
+import click
+from flask import url_for
+from flask.cli import AppGroup
+from sqlalchemy import DDL, Select, delete, event, false, func, inspect, insert, literal, select, text
+from sqlalchemy.engine import Engine
+
+from webapp import db
+from webapp.models import Course, Assignment, Resource, SearchDocument
+
+# full-text search over the names of a user's courses, assignments and resources
+# search_document has a row per record (kind, record id, user, course, name) and the database indexes its names:
+#   SQLite:     search_index, a contentless FTS5 table kept in step with search_document by triggers; every word is
+#               indexed as a term of its user (search_terms: "Linear Algebra" of user 42 is u42xlinear u42xalgebra), so the
+#               prefix query of a word only reads the terms and postings of the user's own records, not those of everybody
+#               who has a course called "Mathematics" (with a shared vocabulary and an owner column a prefix like "mathem"
+#               had to merge the postings of every user: ~9 ms instead of ~0.4 ms on a million documents)
+#   PostgreSQL: a generated tsvector column with a GIN index
+# search_document follows the models through mapper events (after_insert / after_update / after_delete), in the same
+# transaction; the bulk statements that bypass the ORM (api, import) call index_records / unindex_records themselves
+# every word of a query is a prefix ("mat an" finds "Mathematical Analysis"), the results are ranked by bm25 / ts_rank
+
+KINDS = {Course: 'course', Assignment: 'assignment', Resource: 'resource'}
+MAX_WORDS = 10
+
+_SQLITE_CREATE = (
+    "CREATE VIRTUAL TABLE search_index USING fts5(terms, content='', tokenize='unicode61 remove_diacritics 2')",
+    "CREATE TRIGGER search_document_insert AFTER INSERT ON search_document BEGIN "
+    "INSERT INTO search_index (rowid, terms) VALUES (new.id, search_terms(new.user_id, new.name)); END",
+    "CREATE TRIGGER search_document_delete AFTER DELETE ON search_document BEGIN "
+    "INSERT INTO search_index (search_index, rowid, terms) VALUES ('delete', old.id, search_terms(old.user_id, old.name)); END",
+    "CREATE TRIGGER search_document_update AFTER UPDATE ON search_document BEGIN "
+    "INSERT INTO search_index (search_index, rowid, terms) VALUES ('delete', old.id, search_terms(old.user_id, old.name)); "
+    "INSERT INTO search_index (rowid, terms) VALUES (new.id, search_terms(new.user_id, new.name)); END",
+)
+_POSTGRESQL_CREATE = (
+    "ALTER TABLE search_document ADD COLUMN document tsvector GENERATED ALWAYS AS (to_tsvector('simple', name)) STORED",
+    "CREATE INDEX ix_search_document_document ON search_document USING gin (document)",
+)
+
+# create_all / drop_all (a new database, the tests) create and drop the full-text index with the table;
+# existing databases get it from migration 6
+for statement in _SQLITE_CREATE:
+    event.listen(SearchDocument.__table__, 'after_create', DDL(statement).execute_if(dialect='sqlite'))
+for statement in _POSTGRESQL_CREATE:
+    event.listen(SearchDocument.__table__, 'after_create', DDL(statement).execute_if(dialect='postgresql'))
+event.listen(SearchDocument.__table__, 'before_drop', DDL('DROP TABLE IF EXISTS search_index').execute_if(dialect='sqlite'))
+
+
+### keeping search_document up to date ###
+
+def split_words(text):
+    # the words of a name or of a query, split like the unicode61 tokenizer does (no "_", no punctuation)
+    return re.findall(r'[^\W_]+', text.lower())
+
+
+def user_term(user_id, word):
+    return f'u{int(user_id)}x{word}'
+
+
+def search_terms(user_id, name):
+    # what the triggers put in search_index for a document (a function of every SQLite connection, see below)
+    return ' '.join(user_term(user_id, word) for word in split_words(name or ''))
+
+
+@event.listens_for(Engine, 'connect')
+def _register_search_terms(dbapi_connection, connection_record):
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        dbapi_connection.create_function('search_terms', 2, search_terms, deterministic=True)
+
+
+def _documents(model, ids):
+    # SELECT kind, record_id, user_id, course_id, name of the records of a model (not of archived courses)
+    if model is Course:
+        return (select(literal('course'), Course.id, Course.user_id, Course.id, Course.name)
+                .where(Course.id.in_(ids), Course.user_id.isnot(None), Course.archived == false()))
+    return (select(literal(KINDS[model]), model.id, Course.user_id, model.course_id, model.name)
+            .join(Course, Course.id == model.course_id)
+            .where(model.id.in_(ids), Course.user_id.isnot(None), Course.archived == false()))
+
+
+def _ids(ids):
+    # a list of the ids, or None if there are none; a select() of them is kept as it is, a subquery of the statements
+    # (all the records of some courses, however many, without loading their ids or binding one parameter per id)
+    if isinstance(ids, Select):
+        return ids
+    return list(ids) or None
+
+
+def index_records(connection, model, ids):
+    # (re)write the documents of records that were inserted or changed by a bulk statement
+    # connection: a Connection or a Session; ids: the ids, or a select() of them
+    kind = KINDS.get(model)
+    ids = _ids(ids)
+    if kind is None or ids is None:
+        return
+    unindex_records(connection, model, ids)
+    connection.execute(insert(SearchDocument).from_select(['kind', 'record_id', 'user_id', 'course_id', 'name'], _documents(model, ids)))
+
+
+def unindex_records(connection, model, ids):
+    kind = KINDS.get(model)
+    ids = _ids(ids)
+    if kind is not None and ids is not None:
+        connection.execute(delete(SearchDocument).where(SearchDocument.kind == kind,
+                                                        SearchDocument.record_id.in_(ids)))
+
+
+def unindex_courses(connection, course_ids):
+    # the documents of deleted courses and of everything in them
+    if course_ids:
+        connection.execute(delete(SearchDocument).where(SearchDocument.course_id.in_(course_ids)))
+
+
+def reindex_all(connection):
+    # rebuild search_document from the records (flask search reindex)
+    connection.execute(delete(SearchDocument))
+    for model in KINDS:
+        connection.execute(insert(SearchDocument).from_select(
+            ['kind', 'record_id', 'user_id', 'course_id', 'name'], _documents(model, select(model.id))))
+
+
+def _after_insert(mapper, connection, target):
+    connection.execute(insert(SearchDocument).from_select(
+        ['kind', 'record_id', 'user_id', 'course_id', 'name'], _documents(type(target), [target.id])))
+
+
+def _after_update(mapper, connection, target):
+    state = inspect(target)
+    if state.attrs.name.history.has_changes() or (not isinstance(target, Course) and state.attrs.course_id.history.has_changes()):
+        index_records(connection, type(target), [target.id])
+
+
+def _after_delete(mapper, connection, target):
+    unindex_records(connection, type(target), [target.id])
+
+
+for _model in KINDS:
+    event.listen(_model, 'after_insert', _after_insert)
+    event.listen(_model, 'after_update', _after_update)
+    event.listen(_model, 'after_delete', _after_delete)
+
+
+### searching ###
+
+def query_words(query):
+    # the words of what the user typed, without the operators of the full-text query languages
+    return split_words(query)[:MAX_WORDS]
+
+
+_SQLITE_SEARCH = '''
+    SELECT d.kind, d.record_id, d.course_id, c.code, d.name
+    FROM search_index JOIN search_document d ON d.id = search_index.rowid JOIN course c ON c.id = d.course_id
+    WHERE search_index MATCH :match {kinds}
+    ORDER BY search_index.rank, d.id
+    LIMIT :limit'''
+
+_POSTGRESQL_SEARCH = '''
+    SELECT d.kind, d.record_id, d.course_id, c.code, d.name
+    FROM search_document d JOIN course c ON c.id = d.course_id
+    WHERE d.user_id = :user_id AND d.document @@ to_tsquery('simple', :match) {kinds}
+    ORDER BY ts_rank(d.document, to_tsquery('simple', :match)) DESC, d.id
+    LIMIT :limit'''
+
+
+def search(user_id, query, kinds=None, limit=20):
+    # the best matches among the user's records: [{'kind', 'id', 'course_id', 'code', 'name'}, ...] (code: the course's)
+    words = query_words(query)
+    if not words:
+        return []
+    parameters = {'limit': limit, 'user_id': user_id}
+    if db.session.get_bind().dialect.name == 'sqlite':
+        statement, kind_column = _SQLITE_SEARCH, 'd.kind'
+        parameters['match'] = ' AND '.join(f'"{user_term(user_id, word)}"*' for word in words)
+    else:
+        statement, kind_column = _POSTGRESQL_SEARCH, 'd.kind'
+        parameters['match'] = ' & '.join(f'{word}:*' for word in words)
+    kinds = list(kinds or [])
+    parameters.update({f'kind_{i}': kind for i, kind in enumerate(kinds)})
+    statement = statement.format(
+        kinds=f'AND {kind_column} IN ({", ".join(f":kind_{i}" for i in range(len(kinds)))})' if kinds else '')
+    return [{'kind': kind, 'id': record_id, 'course_id': course_id, 'code': code, 'name': name}
+            for kind, record_id, course_id, code, name in db.session.execute(text(statement), parameters)]
+
+
+def result_url(result):
+    if result['kind'] == 'course':
+        return url_for('main.course', code=result['code'])
+    if result['kind'] == 'assignment':
+        return url_for('main.assignment', code=result['code'], assignment_id=result['id'])
+    return url_for('main.resource', code=result['code'], resource_id=result['id'])
+
+
+### command line ###
+
+search_cli = AppGroup('search', help='Manage the full-text search index.')  # added to the app's commands by create_app
+
+
+@search_cli.command('reindex')
+def reindex_command():
+    # flask --app webapp search reindex   (after changing the records without the app)
+    reindex_all(db.session)
+    db.session.commit()
+    click.echo(f'{db.session.scalar(select(func.count()).select_from(SearchDocument))} records indexed.')
@@ -0,0 +1,47 @@
+import os
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from jinja2 import FileSystemBytecodeCache
+
+# the templates compiled to Python code are kept on disk (TEMPLATE_CACHE_DIR, relative to the instance folder), so a
+# new worker process loads them from there instead of parsing and compiling each one again on its first request.
+# `flask --app webapp templates compile` fills the cache when the app is built (next to `assets build`), before the
+# workers start; Jinja checks a template's source against its cached code, so a changed template is compiled again.
+# the cache is for a Jinja and Python version and for the path of the templates, build it where the app runs
+
+
+def cache_dir(app):
+    directory = app.config.get('TEMPLATE_CACHE_DIR')
+    return os.path.join(app.instance_path, directory) if directory else None  # '' turns the cache off
+
+
+def init_app(app):
+    # before anything renders: the Jinja environment is made on first use with these options
+    directory = cache_dir(app)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+        app.jinja_options = dict(app.jinja_options, bytecode_cache=FileSystemBytecodeCache(directory))
+
+
+def compile_templates(app):
+    # loads every template of the app and of its blueprints, which writes them to the cache; returns their names
+    names = app.jinja_env.list_templates()
+    for name in names:
+        app.jinja_env.get_template(name)
+    return names
+
+
+### command line ###
+
+templates_cli = AppGroup('templates', help='Compile the templates ahead of the first requests.')  # added to the app's commands by create_app
+
+
+@templates_cli.command('compile')
+def compile_command():
+    # flask --app webapp templates compile
+    directory = cache_dir(current_app)
+    if directory is None:
+        raise click.ClickException('TEMPLATE_CACHE_DIR is empty, there is no cache to compile into.')
+    click.echo(f'{len(compile_templates(current_app))} templates compiled into {directory}.')
@@ -0,0 +1,58 @@
+from datetime import datetime, timezone
+
+from sqlalchemy import event, inspect, or_, select, update
+from sqlalchemy.orm import Session
+
+from webapp.models import User, Course, Assignment, StudyTime, Resource
+
+# the data version of a user: User.data_version goes up by one (and User.data_modified is set) in the same transaction
+# as any change to the user's courses, assignments, study times or resources
+# the changed courses get the new version of their user in Course.data_version: as the user's version only goes up, a course
+# that is deleted and created again never gets a version it had before (the page cache relies on it, see pages.py)
+# changes made through the session are picked up by the after_flush listener below,
+# the bulk statements (api, import) that bypass the session call bump_data_version themselves
+
+COURSE_CHILDREN = (Assignment, StudyTime, Resource)
+
+
+def _utcnow():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def bump_data_version(connection, user_ids=(), course_ids=()):
+    # connection: a Connection or a Session; course_ids: the users owning these courses are bumped too
+    user_ids, course_ids = set(user_ids) - {None}, set(course_ids) - {None}
+    if not user_ids and not course_ids:
+        return
+    users = User.__table__
+    condition = users.c.id.in_(user_ids)
+    if course_ids:
+        condition = or_(condition, users.c.id.in_(select(Course.__table__.c.user_id).where(Course.__table__.c.id.in_(course_ids))))
+    connection.execute(update(users).where(condition).values(data_version=users.c.data_version + 1, data_modified=_utcnow()))
+    if course_ids:
+        courses = Course.__table__
+        connection.execute(update(courses).where(courses.c.id.in_(course_ids), courses.c.user_id.isnot(None)).values(
+            data_version=select(users.c.data_version).where(users.c.id == courses.c.user_id).scalar_subquery()))
+
+
+def _changed_courses(session):
+    # the users and the courses touched by the flush that just happened
+    user_ids, course_ids = set(), set()
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if obj in session.dirty and not session.is_modified(obj):
+            continue
+        if isinstance(obj, Course):
+            user_ids.add(obj.user_id)
+            course_ids.add(obj.id)
+            user_ids.update(inspect(obj).attrs.user_id.history.deleted)  # the previous owner, if it changed
+        elif isinstance(obj, COURSE_CHILDREN):
+            course_ids.add(obj.course_id)
+            course_ids.update(inspect(obj).attrs.course_id.history.deleted)
+    return user_ids, course_ids
+
+
+@event.listens_for(Session, 'after_flush')
+def bump_after_flush(session, flush_context):
+    user_ids, course_ids = _changed_courses(session)
+    # a plain Core statement on the flush's connection: it is part of the same transaction and doesn't re-enter the ORM
+    bump_data_version(session.connection(), user_ids, course_ids)